@@ -0,0 +1,86 @@
+"""
+Times the kernels of tagra.kernels with the numba and the NumPy backends on a large random graph.
+
+Usage:
+    python benchmarks/bench_kernels.py --nodes 1000000 --degree 10
+
+The graph is generated directly as edge arrays (no networkx graph), with ring edges and random long-range
+edges so that it has triangles. The first numba call of each kernel compiles it and is not timed.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tagra.kernels import (  # noqa: E402
+    NUMBA_AVAILABLE,
+    adjacency_csr,
+    clustering_coefficients,
+    mixing_matrices,
+    neighbor_label_counts,
+    neighbor_mean
+)
+
+
+def random_graph(n_nodes, degree, seed=0):
+    """Edge arrays of a ring lattice with degree / 2 neighbors per node, half of the edges rewired at random."""
+    rng = np.random.default_rng(seed)
+    half = degree // 2
+    sources = np.repeat(np.arange(n_nodes), half)
+    targets = (sources + np.tile(np.arange(1, half + 1), n_nodes)) % n_nodes
+    rewired = rng.random(len(targets)) < 0.5
+    targets[rewired] = rng.integers(0, n_nodes, rewired.sum())
+    keep = sources != targets
+    return sources[keep], targets[keep]
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the tagra.kernels backends.")
+    parser.add_argument('--nodes', type=int, default=1_000_000)
+    parser.add_argument('--degree', type=int, default=10)
+    parser.add_argument('--labels', type=int, default=5)
+    parser.add_argument('--permutations', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sources, targets = random_graph(args.nodes, args.degree)
+    indptr, indices = adjacency_csr(sources, targets, args.nodes, self_loops=False)
+    codes = rng.integers(0, args.labels, args.nodes)
+    shuffled = np.vstack([codes[rng.permutation(args.nodes)] for _ in range(args.permutations)])
+    distributions = np.eye(args.labels)[codes]
+    print(f"{args.nodes} nodes, {len(sources)} edges, {args.labels} labels, numba: {NUMBA_AVAILABLE}")
+
+    kernels = {
+        'neighbor_label_counts': lambda b: neighbor_label_counts(indptr, indices, codes, args.labels, backend=b),
+        'clustering_coefficients': lambda b: clustering_coefficients(indptr, indices, backend=b),
+        f'mixing_matrices ({args.permutations} permutations)':
+            lambda b: mixing_matrices(shuffled, sources, targets, args.labels, backend=b),
+        'neighbor_mean': lambda b: neighbor_mean(indptr, indices, distributions, backend=b),
+    }
+    print(f"{'kernel':<40} {'numpy (s)':>10} {'numba (s)':>10} {'speedup':>8}")
+    for name, kernel in kernels.items():
+        numpy_time = best_time(lambda: kernel('numpy'), args.repeat)
+        if NUMBA_AVAILABLE:
+            kernel('numba')
+            numba_time = best_time(lambda: kernel('numba'), args.repeat)
+            print(f"{name:<40} {numpy_time:>10.3f} {numba_time:>10.3f} {numpy_time / numba_time:>7.1f}x")
+        else:
+            print(f"{name:<40} {numpy_time:>10.3f} {'-':>10} {'-':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,88 +3,79 @@ import os
 import sys
 import argparse
 from datetime import datetime
-import pandas as pd
-from tagra.preprocessing import preprocess_dataframe
-from tagra.graph import create_graph
-from tagra.analysis import analyze_graph
+from tagra.pipeline import run_pipeline, build_pipeline
+from tagra.batch import run_batch
+from tagra.server import serve, service_from_pipeline
 from tagra.config import *
 
-def main(config_path, dataset_path, target_class):
+def main(config_path, dataset_path, target_class, multi_target=False, serve_port=None, serve_host='127.0.0.1'):
     start_time = datetime.now()
 
     config = load_config(config_path, dataset_path)
     if target_class is not None:
-        config['target_columns'] = target_class
-    # Preprocessing
-    df_preprocessed, manifold_pos = preprocess_dataframe(
-        input_dataframe=config['input_dataframe'],
-        output_directory=config['output_directory'],
-        preprocessed_filename=config['preprocessed_filename'],
-        inferred_columns_filename=config['inferred_columns_filename'],
-        numeric_columns=config['numeric_columns'],
-        categorical_columns=config['categorical_columns'],
-        target_columns=config['target_columns'],
-        unknown_column_action=config['unknown_column_action'],
-        ignore_columns=config['ignore_columns'],
-        numeric_threshold=config['numeric_threshold'],
-        numeric_scaling=config['numeric_scaling'],
-        categorical_encoding=config['categorical_encoding'],
-        nan_action=config['nan_action'],
-        nan_threshold=config['nan_threshold'],
-        verbose=config['verbose'],
-        manifold_method=config['manifold_method'],
-        overwrite=config['overwrite']
-    )
+        config['target_columns'] = target_class[0] if isinstance(target_class, list) and len(target_class) == 1 else target_class
+    if multi_target:
+        config['multi_target'] = True
 
-    # Graph Creation
-    graph = create_graph(
-        input_dataframe=config['input_dataframe'],
-        output_directory=config['output_directory'],
-        graph_filename=config['graph_filename'],
-        inferred_columns_filename=config['inferred_columns_filename'],
-        numeric_columns=config['numeric_columns'],
-        preprocessed_dataframe=df_preprocessed,
-        similarity_threshold=config['similarity_threshold'],
-        distance_threshold=config['distance_threshold'],
-        method=config['method'],
-        k=config['k'],
-        verbose=config['verbose'],
-        overwrite=config['overwrite']
-    )
-    if config['manifold_method'] is not None:
-        pos = manifold_pos
-    else:
-        pos = None
+    if serve_port is not None:
+        # Build the graph once, then keep it in memory and answer queries until interrupted
+        results = build_pipeline(config).run()
+        print(f"Pipeline complete. Execution time: {datetime.now() - start_time}")
+        serve(service_from_pipeline(results, config), host=serve_host, port=serve_port, verbose=config['verbose'])
+        return results['report']
 
-    # Graph Analysis
-    analyze_graph(
-        graph,
-        target_attributes=config['target_columns'],
-        verbose=config['verbose'],
-        output_directory=config['output_directory'],
-        degree_distribution_filename=config['degree_distribution_filename'],
-        community_filename=config['community_filename'],
-        graph_visualization_filename=config['graph_visualization_filename'],
-        prob_heatmap_filename=config['prob_heatmap_filename'],
-        pos=pos,
-        overwrite=config['overwrite'],
-        network_metrics_filename=config['network_metrics_filename']
-    )
+    # Loading, preprocessing, manifold, graph creation and analysis run as a DAG of stages:
+    # independent stages (e.g. the manifold and the graph, the metrics and the plots) overlap
+    metrics = run_pipeline(config)
 
     end_time = datetime.now()
     
     print(f"Analysis complete. Execution time: {end_time - start_time}")
+    return metrics
+
+def batch(batch_spec, config_path, target_class, multi_target=False, max_workers=None, summary_filename=None):
+    start_time = datetime.now()
+
+    # Settings shared by every dataset; the datasets come from the manifest or the glob
+    base_config = {}
+    if config_path is not None:
+        with open(config_path, 'r') as f:
+            base_config = json.load(f)
+        base_config.pop('input_dataframe', None)
+    if target_class is not None:
+        base_config['target_columns'] = target_class[0] if len(target_class) == 1 else target_class
+    if multi_target:
+        base_config['multi_target'] = True
+
+    summary = run_batch(batch_spec, base_config, max_workers=max_workers, summary_filename=summary_filename)
+    print(summary.to_string(index=False, columns=[c for c in ['dataset', 'status', 'run_time', 'nodes', 'edges',
+                                                             'modularity', 'homophily_score'] if c in summary.columns]))
+
+    end_time = datetime.now()
+    print(f"Batch complete. Execution time: {end_time - start_time}")
+    return summary
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run TaGra example with configuration file.')
     parser.add_argument('-c', '--config', type=str, required=False, default=None, help='Path to the configuration file.')
     parser.add_argument('-d', '--dataframe', type=str, required=False, default=None, help='Path to the input dataframe.')
-    parser.add_argument('-a', '--attribute', type=str, required=False, default=None, help='Path to the input dataframe.')
+    parser.add_argument('-a', '--attribute', type=str, nargs='+', required=False, default=None, help='Name of the target column(s).')
+    parser.add_argument('-m', '--multi-target', action='store_true', help='Analyze each target column separately in one pass.')
+    parser.add_argument('-b', '--batch', type=str, required=False, default=None, help='JSON manifest or glob pattern of the datasets of a batch.')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None, help='Number of datasets processed at the same time in batch mode.')
+    parser.add_argument('--serve', type=int, required=False, default=None, metavar='PORT', help='After the run, serve queries on the graph on this port.')
+    parser.add_argument('--host', type=str, required=False, default='127.0.0.1', help='Address of the server started by --serve.')
+    parser.add_argument('-s', '--summary', type=str, required=False, default=None, help='Path (.csv or .parquet) of the batch summary table.')
     args = parser.parse_args()
 
     if args.config is not None and not os.path.isfile(args.config):
         print(f"Error: The configuration file {args.config} does not exist.")
         sys.exit(1)
+    if args.batch is not None:
+        summary = batch(args.batch, args.config, args.attribute, args.multi_target, args.jobs, args.summary)
+        # A failed dataset does not stop the others, but makes the batch fail
+        sys.exit(1 if (summary['status'] != 'ok').any() else 0)
+
     if args.dataframe is not None and not os.path.isfile(args.dataframe):
         print(f"Error: The dataset file {args.dataframe} does not exist.")
         sys.exit(1)
@@ -92,4 +83,4 @@ if __name__ == "__main__":
         print(f"Error: Either --config or --dataframe must be specified.")
         sys.exit(1)
 
-    main(args.config, args.dataframe, args.attribute)
+    main(args.config, args.dataframe, args.attribute, args.multi_target, args.serve, args.host)
@@ -1,3 +1,4 @@
+import json
 import pickle
 import datetime
 import networkx as nx
@@ -8,17 +9,26 @@ import matplotlib.pyplot as plt
 from datetime import datetime
 from sklearn.metrics import silhouette_score
 from scipy.stats import chi2_contingency
-import random
 
+from .context import AnalysisContext
+from .estimators import distance_metrics
+from .kernels import mixing_matrices
+from .spectral import spectral_metrics
 from .utils import (
-    analyze_neighborhood_attributes,
-    print_neighbors_prob,
-    heat_map_prob,
+    mixing_probabilities,
+    probabilities_to_dict,
+    heat_map_mixing,
     plot_distribution,
     plot_community_composition,
     matplotlib_graph_visualization
 )
 
+PARQUET_METRICS_KEY = b'tagra.metrics'
+TARGET_METRICS = ['chi2_stat', 'chi2_p_value', 'homophily_score', 'homophily_p_value', 'homophily_z_score']
+# Upper bound on the edges counted by one batch of the permutation test, over all its permutations and
+# attributes: a batch holds PERMUTATION_BATCH_CELLS // (n_edges * n_attributes) permutations
+PERMUTATION_BATCH_CELLS = 2**22
+
 def analyze_graph(graph, 
                   target_attributes=None, 
                   verbose=True,
@@ -30,6 +40,16 @@ def analyze_graph(graph,
                   community_filename=None,
                   graph_visualization_filename=None,
                   network_metrics_filename=None,
+                  projection_info=None,
+                  context=None,
+                  multi_target=False,
+                  metrics_filename=None,
+                  path_length_samples=None,
+                  betweenness_samples=None,
+                  pagerank_centrality=False,
+                  estimate_time_budget=None,
+                  spectral_eigenvalues=None,
+                  spectral_method='eigsh',
                   overwrite=False):
     """
     Analyzes a graph and generates various metrics and visualizations.
@@ -39,7 +59,8 @@ def analyze_graph(graph,
     graph : networkx.Graph or str
         The graph to analyze, or a path to a pickle file containing a graph.
     target_attributes : str or list, optional
-        Target attributes for coloring and analysis.
+        Target attributes for coloring and analysis. A list is combined into a single attribute,
+        unless multi_target is True.
     verbose : bool, default=True
         Whether to print detailed information.
     pos : dict, optional
@@ -58,33 +79,102 @@ def analyze_graph(graph,
         Filename for graph visualization.
     network_metrics_filename : str, optional
         Filename for network metrics report.
+    projection_info : dict, optional
+        Projection summary returned by tagra.projection.project_dataframe, added to the report.
+    context : tagra.context.AnalysisContext, optional
+        Context holding memoized intermediate results for this graph. A new one is created if not provided.
+    multi_target : bool, default=False
+        Whether to analyze each of the target attributes separately. The structural metrics are computed
+        once, the mixing matrices in a single pass over the edges and the permutation tests together.
+        Per-attribute results are stored in metrics['targets'] and the heatmaps get the attribute as suffix.
+    metrics_filename : str, optional
+        Filename (.json or .parquet) for the machine-readable metrics, see save_metrics.
+    path_length_samples : int, optional
+        Number of breadth-first searches estimating the average path length and the diameter bounds,
+        see tagra.estimators.estimate_path_lengths. Not computed if None.
+    betweenness_samples : int, optional
+        Number of sources of the sampled betweenness centrality, see tagra.estimators.estimate_betweenness.
+        Not computed if None.
+    pagerank_centrality : bool, default=False
+        Whether to compute the PageRank of the nodes, see tagra.estimators.pagerank.
+    estimate_time_budget : float, optional
+        Seconds allowed to each of the estimators above.
+    spectral_eigenvalues : int, optional
+        Number of smallest eigenvalues of the normalized Laplacian to compute, with the spectral gap and
+        the Fiedler vector, see tagra.spectral.spectral_metrics. Not computed if None.
+    spectral_method : str, default='eigsh'
+        Eigensolver of the spectrum: 'eigsh' or 'lobpcg'.
     overwrite : bool, default=False
         Whether to overwrite existing files.
         
     Returns:
     --------
     dict
-        Dictionary containing computed metrics.
+        Dictionary containing computed metrics. metrics['node_metrics'] is a DataFrame with the
+        degree, community id and local clustering coefficient of each node, and its betweenness,
+        PageRank and Fiedler vector entry when computed.
+    """
+    paths = output_paths(output_directory, overwrite,
+                         degree_distribution_filename=degree_distribution_filename,
+                         prob_heatmap_filename=prob_heatmap_filename,
+                         community_filename=community_filename,
+                         graph_visualization_filename=graph_visualization_filename,
+                         neigh_prob_filename=neigh_prob_filename,
+                         network_metrics_filename=network_metrics_filename,
+                         metrics_filename=metrics_filename)
+
+    if verbose:
+        print(f"{datetime.now()}: Starting graph analysis...")
+        print(f"{datetime.now()}: Configured output paths for analysis results.")
+
+    G = load_graph(graph, verbose)
+    # Intermediate results (mixing matrices, degrees, communities) are computed once and shared
+    if context is None or context.graph is not G:
+        context = AnalysisContext(G)
+    target_attributes, target_list = resolve_target_attributes(target_attributes, multi_target, verbose)
+
+    if verbose:
+        print(f"--------------------------\nGraph analysis options\n--------------------------\n\n"
+              f"\tOptions:\n"
+              f"\tgraph: {graph}, attribute: {target_attributes}, \n"
+              f"\toverwrite: {overwrite}\n\n")
+        print(f"{datetime.now()}: Graph has {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
+
+    # Dictionary to store all computed metrics
+    metrics = structural_metrics(G, context, projection_info=projection_info,
+                                 path_length_samples=path_length_samples, betweenness_samples=betweenness_samples,
+                                 pagerank_centrality=pagerank_centrality, estimate_time_budget=estimate_time_budget,
+                                 spectral_eigenvalues=spectral_eigenvalues, spectral_method=spectral_method,
+                                 verbose=verbose)
+    metrics.update(target_metrics(context, target_attributes, multi_target=multi_target, verbose=verbose))
+    write_metrics(metrics, paths, target_attributes, multi_target=multi_target, verbose=verbose)
+    plot_analysis(G, context, paths, target_attributes, multi_target=multi_target, pos=pos, verbose=verbose)
+
+    if verbose:
+        print(f"{datetime.now()}: Graph analysis complete.")
+
+    return metrics
+
+
+def output_paths(output_directory=None, overwrite=False, **filenames):
+    """
+    Builds the output paths of the analysis files, creating the output directory if needed.
+
+    Unless overwrite is True, a '%Y%m%d%H%M' timestamp is appended to each filename.
+
+    Returns:
+    - dict: The path of each filename parameter, or None for the files that are not requested.
     """
-    
-    # Output path managing
     time_str = datetime.now().strftime('%Y%m%d%H%M')
     if output_directory is None:
         output_directory = './'
     if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+        os.makedirs(output_directory, exist_ok=True)
         print(f"{datetime.now()}: Output directory created: {output_directory}.")
 
     # Configure output paths
     paths = {}
-    for filename_param, filename_value in [
-        ('degree_distribution_filename', degree_distribution_filename),
-        ('prob_heatmap_filename', prob_heatmap_filename),
-        ('community_filename', community_filename),
-        ('graph_visualization_filename', graph_visualization_filename),
-        ('neigh_prob_filename', neigh_prob_filename),
-        ('network_metrics_filename', network_metrics_filename)
-    ]:
+    for filename_param, filename_value in filenames.items():
         if filename_value is not None:
             if not overwrite:
                 basename = os.path.basename(filename_value)
@@ -93,37 +183,59 @@ def analyze_graph(graph,
             paths[filename_param] = os.path.join(output_directory, filename_value)
         else:
             paths[filename_param] = None
+    return paths
 
-    if verbose:
-        print(f"{datetime.now()}: Starting graph analysis...")
-        print(f"{datetime.now()}: Configured output paths for analysis results.")
 
-    # Load graph if path is provided
+def load_graph(graph, verbose=True):
+    """Returns the graph itself, or loads it if a path to a pickle file is provided."""
     if isinstance(graph, str):
         if verbose:
             print(f"{datetime.now()}: Loading graph from file: {graph}")
-        G = pickle.load(open(graph, 'rb'))
+        with open(graph, 'rb') as f:
+            return pickle.load(f)
     elif isinstance(graph, nx.Graph):
         if verbose:
             print(f"{datetime.now()}: Using provided NetworkX graph object.")
-        G = graph
-    else:
-        raise ValueError("Invalid graph. Must be a path to a file or a NetworkX Graph.")
+        return graph
+    raise ValueError("Invalid graph. Must be a path to a file or a NetworkX Graph.")
+
 
-    # Handle target attributes
+def resolve_target_attributes(target_attributes, multi_target=False, verbose=True):
+    """
+    Returns the target attribute as stored in the graph and the list of attributes to analyze.
+
+    A list of attributes names the tuple attribute made by preprocess_dataframe, unless multi_target is True.
+    """
+    if multi_target:
+        # Each attribute is analyzed on its own, sharing the structural metrics
+        target_list = [target_attributes] if isinstance(target_attributes, str) else list(target_attributes or [])
+        if verbose:
+            print(f"{datetime.now()}: Using {len(target_list)} target attributes: {target_list}")
+        return target_attributes, target_list
     if target_attributes is not None and isinstance(target_attributes, list) and len(target_attributes) > 0:
         target_attributes = str(tuple(target_attributes))
         if verbose:
             print(f"{datetime.now()}: Using target attributes: {target_attributes}")
+    return target_attributes, [target_attributes] if target_attributes is not None else []
 
-    if verbose:
-        print(f"--------------------------\nGraph analysis options\n--------------------------\n\n"
-              f"\tOptions:\n"
-              f"\tgraph: {graph}, attribute: {target_attributes}, \n"
-              f"\toverwrite: {overwrite}\n\n")
-        print(f"{datetime.now()}: Graph has {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
 
-    # Dictionary to store all computed metrics
+def structural_metrics(G, context=None, projection_info=None, path_length_samples=None, betweenness_samples=None,
+                       pagerank_centrality=False, estimate_time_budget=None, spectral_eigenvalues=None,
+                       spectral_method='eigsh', verbose=True):
+    """
+    Computes the metrics that do not depend on the target attributes: size, density, clustering,
+    connected components, assortativity, Girvan-Newman communities and modularity, and the per-node
+    table (degree, community id and local clustering) under 'node_metrics'.
+
+    The sampled path length, diameter and centrality estimates are added when requested, see
+    tagra.estimators.distance_metrics; betweenness and PageRank become columns of 'node_metrics'. So
+    does the Fiedler vector, with the Laplacian spectrum of tagra.spectral.spectral_metrics.
+
+    Returns:
+    - dict: The computed metrics, with the projection summary if provided.
+    """
+    if context is None or context.graph is not G:
+        context = AnalysisContext(G)
     metrics = {}
     
     # Calculate basic graph metrics
@@ -132,14 +244,13 @@ def analyze_graph(graph,
     metrics['nodes'] = G.number_of_nodes()
     metrics['edges'] = G.number_of_edges()
     metrics['density'] = nx.density(G)
-    # if verbose:
-    #     print(f"{datetime.now()}: Graph density: {metrics['density']:.6f}")
+    if projection_info is not None:
+        metrics.update(projection_info)
     
     if verbose:
         print(f"{datetime.now()}: Calculating average clustering coefficient...")
-    metrics['avg_clustering'] = nx.average_clustering(G)
-    # if verbose:
-    #     print(f"{datetime.now()}: Average clustering coefficient: {metrics['avg_clustering']:.6f}")
+    # The local coefficients are kept for the per-node metrics; their mean is networkx's average_clustering
+    metrics['avg_clustering'] = float(np.mean(context.clustering())) if G.number_of_nodes() > 0 else 0.0
     
     # Connected components analysis
     if verbose:
@@ -147,9 +258,6 @@ def analyze_graph(graph,
     components = list(nx.connected_components(G))
     metrics['connected_components'] = len(components)
     metrics['largest_component_size'] = len(max(components, key=len))
-    # if verbose:
-    #     print(f"{datetime.now()}: Found {metrics['connected_components']} connected components.")
-    #     print(f"{datetime.now()}: Largest component has {metrics['largest_component_size']} nodes.")
     
     # Calculate additional network metrics (always calculate these even if not saving to file)
     if verbose:
@@ -160,134 +268,16 @@ def analyze_graph(graph,
         if verbose:
             print(f"{datetime.now()}: Calculating degree assortativity coefficient...")
         metrics['assortativity'] = nx.degree_assortativity_coefficient(G)
-        # if verbose:
-        #     print(f"{datetime.now()}: Assortativity coefficient: {metrics['assortativity']:.6f}")
     except Exception as e:
         if verbose:
             print(f"{datetime.now()}: Could not calculate assortativity: {str(e)}")
         metrics['assortativity'] = None
-                
-    # Perform neighborhood analysis if target attributes provided
-    if target_attributes is not None:
-        if verbose:
-            print(f"{datetime.now()}: Performing statistical analysis for target attribute: {target_attributes}")
-        
-        # Chi-square test for neighborhood attributes
-        try:
-            if verbose:
-                print(f"{datetime.now()}: Analyzing neighborhood attributes...")
-            df_neigh = analyze_neighborhood_attributes(G, target_attribute=target_attributes)
-            target_values = df_neigh[f'node_{target_attributes}'].unique()
-            # if verbose:
-            #     print(f"{datetime.now()}: Found {len(target_values)} unique values for target attribute.")
-            
-            # Create contingency table
-            if verbose:
-                print(f"{datetime.now()}: Creating contingency table for chi-square test...")
-            contingency_table = []
-            for target_value in target_values:
-                row = []
-                nodes_with_value = df_neigh[df_neigh[f'node_{target_attributes}'] == target_value]
-                for neigh_value in target_values:
-                    col_name = f'n_{neigh_value}'
-                    total_neighbors = nodes_with_value[col_name].sum()
-                    row.append(total_neighbors)
-                contingency_table.append(row)
-            
-            # Chi-square test
-            if len(contingency_table) > 1 and all(sum(row) > 0 for row in contingency_table):
-                if verbose:
-                    print(f"{datetime.now()}: Performing chi-square test...")
-                chi2, p_value, dof, expected = chi2_contingency(contingency_table)
-                metrics['chi2_stat'] = chi2
-                metrics['chi2_p_value'] = p_value
-                # if verbose:
-                #     print(f"{datetime.now()}: Chi-square statistic: {chi2:.6f}, p-value: {p_value:.6f}")
-            else:
-                if verbose:
-                    print(f"{datetime.now()}: Skipping chi-square test - insufficient data.")
-                metrics['chi2_stat'] = None
-                metrics['chi2_p_value'] = None
-                
-            # Permutation test for neighborhood patterns
-            if len(target_values) > 1:
-                if verbose:
-                    print(f"{datetime.now()}: Calculating homophily score...")
-                original_probs = print_neighbors_prob(df_neigh, target_attributes)
-                
-                # Calculate diagonal sum (homophily measure)
-                diagonal_sum = sum(original_probs.get((i, i), 0) for i in target_values)
-                metrics['homophily_score'] = diagonal_sum / len(target_values)
-                # if verbose:
-                #     print(f"{datetime.now()}: Homophily score: {metrics['homophily_score']:.6f}")
-                
-                # Permutation test (compare with randomized attribute assignments)
-                if verbose:
-                    print(f"{datetime.now()}: Starting permutation test (this may take a moment)...")
-                n_permutations = 100
-                permutation_diagonals = []
-                
-                for i in range(n_permutations):
-                    if verbose and i % 25 == 0:
-                        print(f"{datetime.now()}: Permutation test progress: {i}/{n_permutations}...")
-                        
-                    # Create copy of graph with shuffled attributes
-                    G_perm = G.copy()
-                    attr_values = [G.nodes[n].get(target_attributes, 'None') for n in G.nodes()]
-                    random.shuffle(attr_values)
-                    
-                    for i, node in enumerate(G.nodes()):
-                        G_perm.nodes[node][target_attributes] = attr_values[i]
-                        
-                    # Calculate neighborhood probabilities
-                    df_neigh_perm = analyze_neighborhood_attributes(G_perm, target_attribute=target_attributes)
-                    perm_probs = print_neighbors_prob(df_neigh_perm, target_attributes)
-                    
-                    # Calculate diagonal sum
-                    perm_diagonal = sum(perm_probs.get((i, i), 0) for i in target_values)
-                    permutation_diagonals.append(perm_diagonal / len(target_values))
-                
-                # Calculate permutation test p-value
-                p_value = sum(d >= metrics['homophily_score'] for d in permutation_diagonals) / n_permutations
-                metrics['homophily_p_value'] = p_value
-                # if verbose:
-                #     print(f"{datetime.now()}: Permutation test p-value: {p_value:.6f}")
-                
-                # Z-score compared to random
-                if len(permutation_diagonals) > 1:
-                    if verbose:
-                        print(f"{datetime.now()}: Calculating Z-score...")
-                    perm_mean = np.mean(permutation_diagonals)
-                    perm_std = np.std(permutation_diagonals)
-                    if perm_std > 0:
-                        metrics['homophily_z_score'] = (metrics['homophily_score'] - perm_mean) / perm_std
-                        # if verbose:
-                        #     print(f"{datetime.now()}: Homophily Z-score: {metrics['homophily_z_score']:.6f}")
-                    else:
-                        metrics['homophily_z_score'] = 0
-                        if verbose:
-                            print(f"{datetime.now()}: Homophily Z-score: 0 (zero standard deviation in permutations)")
-                else:
-                    metrics['homophily_z_score'] = 0
-                    if verbose:
-                        print(f"{datetime.now()}: Could not calculate Z-score - insufficient permutation data.")
-                    
-        except Exception as e:
-            if verbose:
-                print(f"{datetime.now()}: Error in neighborhood analysis: {str(e)}")
-            metrics['chi2_stat'] = None
-            metrics['chi2_p_value'] = None
-            metrics['homophily_score'] = None
-            metrics['homophily_p_value'] = None
-            metrics['homophily_z_score'] = None
     
     # Community detection using Girvan-Newman
     try:
         if verbose:
             print(f"{datetime.now()}: Detecting communities using Girvan-Newman algorithm...")
-        communities_generator = nx.algorithms.community.girvan_newman(G)
-        top_level_communities = next(communities_generator)
-        communities = [list(c) for c in sorted(top_level_communities, key=len, reverse=True)]
+        communities = context.communities()
         metrics['community_count'] = len(communities)
         if verbose:
             print(f"{datetime.now()}: Found {metrics['community_count']} communities.")
@@ -296,10 +286,6 @@ def analyze_graph(graph,
         if metrics['community_count'] > 1:
             if verbose:
                 print(f"{datetime.now()}: Calculating modularity score...")
-            community_dict = {}
-            for i, comm in enumerate(communities):
-                for node in comm:
-                    community_dict[node] = i
             metrics['modularity'] = nx.algorithms.community.modularity(G, communities)
             if verbose:
                 print(f"{datetime.now()}: Modularity score: {metrics['modularity']:.6f}")
@@ -314,100 +300,197 @@ def analyze_graph(graph,
         metrics['community_count'] = 0
         metrics['modularity'] = None
 
+    estimates, node_estimates = distance_metrics(context, path_length_samples=path_length_samples,
+                                                 betweenness_samples=betweenness_samples,
+                                                 pagerank_centrality=pagerank_centrality,
+                                                 time_budget=estimate_time_budget, verbose=verbose)
+    metrics.update(estimates)
+    if spectral_eigenvalues is not None:
+        spectrum, fiedler = spectral_metrics(context, spectral_eigenvalues, method=spectral_method, verbose=verbose)
+        metrics.update(spectrum)
+        node_estimates.update(fiedler)
 
-    # Function to format metrics output (used for both file and console)
-    def format_metrics_report():
-        lines = []
-        lines.append("Network Metrics Report")
-        lines.append("=====================\n")
-        lines.append(f"Generated on: {datetime.now()}\n")
-        
-        lines.append("Basic Metrics:")
-        lines.append(f"- Nodes: {metrics['nodes']}")
-        lines.append(f"- Edges: {metrics['edges']}")
-        lines.append(f"- Density: {metrics['density']:.6f} (Fraction of possible connections that actually exist)")
-        lines.append(f"- Average Clustering Coefficient: {metrics['avg_clustering']:.6f} (Measure of how nodes tend to cluster together)")
-        lines.append(f"- Connected Components: {metrics['connected_components']} (Number of separate subgraphs)")
-        lines.append(f"- Largest Component Size: {metrics['largest_component_size']} nodes ({metrics['largest_component_size']/metrics['nodes']*100:.1f}% of graph)")
-        
-        if 'assortativity' in metrics and metrics['assortativity'] is not None:
-            lines.append(f"- Assortativity Coefficient: {metrics['assortativity']:.6f} (Tendency of nodes to connect to similar nodes by degree)")
-        
-        if 'community_count' in metrics:
-            lines.append(f"- Community Count: {metrics['community_count']} (Detected using Girvan-Newman algorithm)")
+    # Per-node metrics, in the order of G.nodes
+    metrics['node_metrics'] = pd.DataFrame({
+        'node': context.nodes(),
+        'degree': context.degrees(),
+        'community': context.community_ids() if metrics['community_count'] > 0 else -1,
+        'clustering': context.clustering(),
+        **node_estimates
+    })
+    return metrics
+
+
+def target_metrics(context, target_attributes, multi_target=False, n_permutations=100, verbose=True):
+    """
+    Computes the chi-square and homophily tests of the target attributes, see target_statistics.
+
+    target_attributes is resolved by resolve_target_attributes first.
+
+    Returns:
+    - dict: The metrics of a single target attribute, or {'targets': {attribute: metrics}} in
+      multi-target mode. Empty if there is no target attribute.
+    """
+    target_attributes, target_list = resolve_target_attributes(target_attributes, multi_target, verbose=False)
+    if not target_list:
+        return {}
+    # Perform neighborhood analysis if target attributes provided
+    if verbose:
+        print(f"{datetime.now()}: Performing statistical analysis for target attribute: {target_attributes}")
+    try:
+        results = target_statistics(context, target_list, n_permutations=n_permutations, verbose=verbose)
+    except Exception as e:
+        if verbose:
+            print(f"{datetime.now()}: Error in neighborhood analysis: {str(e)}")
+        results = {attribute: dict.fromkeys(TARGET_METRICS + ['n_labels']) for attribute in target_list}
+    if multi_target:
+        return {'targets': results}
+    return results[target_attributes]
+
+
+def format_metrics_report(metrics, target_attributes=None, multi_target=False):
+    """Formats the metrics as the lines of the network metrics report."""
+    lines = []
+    lines.append("Network Metrics Report")
+    lines.append("=====================\n")
+    lines.append(f"Generated on: {datetime.now()}\n")
+    
+    lines.append("Basic Metrics:")
+    lines.append(f"- Nodes: {metrics['nodes']}")
+    lines.append(f"- Edges: {metrics['edges']}")
+    lines.append(f"- Density: {metrics['density']:.6f} (Fraction of possible connections that actually exist)")
+    lines.append(f"- Average Clustering Coefficient: {metrics['avg_clustering']:.6f} (Measure of how nodes tend to cluster together)")
+    lines.append(f"- Connected Components: {metrics['connected_components']} (Number of separate subgraphs)")
+    lines.append(f"- Largest Component Size: {metrics['largest_component_size']} nodes ({metrics['largest_component_size']/metrics['nodes']*100:.1f}% of graph)")
+    
+    if 'assortativity' in metrics and metrics['assortativity'] is not None:
+        lines.append(f"- Assortativity Coefficient: {metrics['assortativity']:.6f} (Tendency of nodes to connect to similar nodes by degree)")
+    
+    if 'community_count' in metrics:
+        lines.append(f"- Community Count: {metrics['community_count']} (Detected using Girvan-Newman algorithm)")
+    
+    if 'modularity' in metrics and metrics['modularity'] is not None:
+        lines.append(f"- Modularity Score: {metrics['modularity']:.6f} (Strength of division into communities)")
+    
+    if metrics.get('path_samples') or metrics.get('betweenness_samples') or metrics.get('pagerank_iterations'):
+        lines.append("\nDistances and Centrality (sampled estimates):")
+        if metrics.get('avg_path_length') is not None:
+            lines.append(f"- Average Path Length: {metrics['avg_path_length']:.4f} "
+                         f"(± {metrics['avg_path_length_stderr']:.4f} standard error, {metrics['path_samples']} sources)")
+        if metrics.get('path_samples'):
+            lines.append(f"- Diameter: between {metrics['diameter_lower']} and {metrics['diameter_upper']} "
+                         f"(Longest shortest path of any component)")
+        if metrics.get('betweenness_samples'):
+            lines.append(f"- Maximum Betweenness: {metrics['betweenness_max']:.6f} "
+                         f"(largest standard error {metrics['betweenness_max_stderr']:.6f}, {metrics['betweenness_samples']} sources)")
+        if metrics.get('pagerank_iterations'):
+            lines.append(f"- PageRank: {metrics['pagerank_iterations']} iterations, "
+                         f"L1 error below {metrics['pagerank_error']:.2e}")
+
+    if metrics.get('spectral_eigenvalues') is not None:
+        lines.append("\nLaplacian Spectrum:")
+        lines.append(f"- Smallest Eigenvalues: {', '.join(f'{value:.6f}' for value in metrics['spectral_eigenvalues'])}")
+        lines.append(f"- Zero Eigenvalues: {metrics['zero_eigenvalues']} (One per connected component)")
+        if metrics['spectral_gap'] is not None:
+            lines.append(f"- Spectral Gap: {metrics['spectral_gap']:.6f} (Smallest nonzero eigenvalue; small values mean weakly connected clusters)")
+        lines.append(f"- Largest Eigengap After: {metrics['eigengap_clusters']} eigenvalues (Suggested number of clusters)")
+
+    if metrics.get('projection_method') is not None:
+        lines.append("\nProjection:")
+        lines.append(f"- Method: {metrics['projection_method']} ({metrics['projection_input_dim']} -> {metrics['projection_dim']} dimensions)")
+        if metrics.get('projection_explained_variance') is not None:
+            lines.append(f"- Explained Variance: {metrics['projection_explained_variance']:.6f}")
+        if metrics.get('projection_knn_overlap') is not None:
+            lines.append(f"- kNN Overlap: {metrics['projection_knn_overlap']:.6f} (Fraction of full-dimensional neighbors preserved after projection)")
+
+    if multi_target and metrics.get('targets'):
+        lines.append("\nMulti-Target Analysis:")
+        lines.append(f"  {'Attribute':<24}{'Labels':>8}{'Chi-square':>14}{'Chi2 p':>10}{'Homophily':>11}{'Perm. p':>9}{'Z-score':>10}")
+        for attribute, stats in metrics['targets'].items():
+            lines.append(f"  {str(attribute):<24}{stats['n_labels'] or 0:>8}"
+                         f"{_format_stat(stats['chi2_stat'], 14, 2)}{_format_stat(stats['chi2_p_value'], 10, 4)}"
+                         f"{_format_stat(stats['homophily_score'], 11, 4)}{_format_stat(stats['homophily_p_value'], 9, 2)}"
+                         f"{_format_stat(stats['homophily_z_score'], 10, 2)}")
+        lines.append("  Homophily is the mean of P(same label | label); a random graph scores 1/labels.")
+        lines.append("  The permutation p-value is the fraction of label shuffles scoring at least as high.")
+
+    if target_attributes is not None and not multi_target:
+        lines.append("\nTarget Attribute Analysis:")
         
-        if 'modularity' in metrics and metrics['modularity'] is not None:
-            lines.append(f"- Modularity Score: {metrics['modularity']:.6f} (Strength of division into communities)")
+        if 'chi2_stat' in metrics and metrics['chi2_stat'] is not None:
+            lines.append(f"- Neighborhood Pattern Chi-square: {metrics['chi2_stat']:.6f}")
+            lines.append(f"  This tests whether nodes connect to neighbors with particular target attributes")
+            lines.append(f"  in a non-random way. Higher values suggest stronger patterns.")
+            lines.append(f"- Chi-square p-value: {metrics['chi2_p_value']:.6f}")
+            if metrics['chi2_p_value'] < 0.05:
+                lines.append(f"  Significant result (p < 0.05): The pattern of connections between nodes")
+                lines.append(f"  with different target attributes is not random.")
+            else:
+                lines.append(f"  Non-significant result (p >= 0.05): No strong evidence that connections")
+                lines.append(f"  follow a pattern based on target attributes.")
         
-        if target_attributes is not None:
-            lines.append("\nTarget Attribute Analysis:")
-            
-            if 'chi2_stat' in metrics and metrics['chi2_stat'] is not None:
-                lines.append(f"- Neighborhood Pattern Chi-square: {metrics['chi2_stat']:.6f}")
-                lines.append(f"  This tests whether nodes connect to neighbors with particular target attributes")
-                lines.append(f"  in a non-random way. Higher values suggest stronger patterns.")
-                lines.append(f"- Chi-square p-value: {metrics['chi2_p_value']:.6f}")
-                if metrics['chi2_p_value'] < 0.05:
-                    lines.append(f"  Significant result (p < 0.05): The pattern of connections between nodes")
-                    lines.append(f"  with different target attributes is not random.")
-                else:
-                    lines.append(f"  Non-significant result (p >= 0.05): No strong evidence that connections")
-                    lines.append(f"  follow a pattern based on target attributes.")
+        if 'homophily_score' in metrics and metrics['homophily_score'] is not None:
+            lines.append(f"- Homophily Score: {metrics['homophily_score']:.6f}")
+            lines.append(f"  Measures how often nodes connect to others with the same target attribute.")
+            lines.append(f"  Score of 1.0 = perfect homophily (nodes only connect to same class)")
+            lines.append(f"  Score of {1.0/metrics['n_labels']:.2f} = random connections")
             
-            if 'homophily_score' in metrics and metrics['homophily_score'] is not None:
-                lines.append(f"- Homophily Score: {metrics['homophily_score']:.6f}")
-                lines.append(f"  Measures how often nodes connect to others with the same target attribute.")
-                lines.append(f"  Score of 1.0 = perfect homophily (nodes only connect to same class)")
-                lines.append(f"  Score of {1.0/len(df_neigh[f'node_{target_attributes}'].unique()):.2f} = random connections")
+        if 'homophily_p_value' in metrics and metrics['homophily_p_value'] is not None:
+            lines.append(f"- Homophily Permutation Test p-value: {metrics['homophily_p_value']:.6f}")
+            if metrics['homophily_p_value'] < 0.05:
+                lines.append(f"  Significant result (p < 0.05): The observed homophily is unlikely")
+                lines.append(f"  to occur by random chance.")
+            else:
+                lines.append(f"  Non-significant result (p >= 0.05): The observed homophily could")
+                lines.append(f"  be explained by random chance.")
                 
-            if 'homophily_p_value' in metrics and metrics['homophily_p_value'] is not None:
-                lines.append(f"- Homophily Permutation Test p-value: {metrics['homophily_p_value']:.6f}")
-                if metrics['homophily_p_value'] < 0.05:
-                    lines.append(f"  Significant result (p < 0.05): The observed homophily is unlikely")
-                    lines.append(f"  to occur by random chance.")
-                else:
-                    lines.append(f"  Non-significant result (p >= 0.05): The observed homophily could")
-                    lines.append(f"  be explained by random chance.")
-                    
-            if 'homophily_z_score' in metrics and metrics['homophily_z_score'] is not None:
-                lines.append(f"- Homophily Z-score: {metrics['homophily_z_score']:.6f}")
-                lines.append(f"  How many standard deviations the homophily score is from random expectation.")
-                if abs(metrics['homophily_z_score']) > 2:
-                    lines.append(f"  |Z| > 2: Strong evidence of non-random connectivity pattern.")
+        if 'homophily_z_score' in metrics and metrics['homophily_z_score'] is not None:
+            lines.append(f"- Homophily Z-score: {metrics['homophily_z_score']:.6f}")
+            lines.append(f"  How many standard deviations the homophily score is from random expectation.")
+            if abs(metrics['homophily_z_score']) > 2:
+                lines.append(f"  |Z| > 2: Strong evidence of non-random connectivity pattern.")
+    
+    lines.append("\nInterpretation:")
+    lines.append("- Graph Density: " + 
+                ("Very sparse graph" if metrics['density'] < 0.01 else
+                "Sparse graph" if metrics['density'] < 0.1 else
+                "Moderately connected graph" if metrics['density'] < 0.3 else
+                "Densely connected graph"))
         
-        lines.append("\nInterpretation:")
-        lines.append("- Graph Density: " + 
-                    ("Very sparse graph" if metrics['density'] < 0.01 else
-                    "Sparse graph" if metrics['density'] < 0.1 else
-                    "Moderately connected graph" if metrics['density'] < 0.3 else
-                    "Densely connected graph"))
-            
-        lines.append("- Community Structure: " +
-                    ("Weak community structure" if 'modularity' in metrics and metrics['modularity'] is not None and metrics['modularity'] < 0.2 else
-                    "Moderate community structure" if 'modularity' in metrics and metrics['modularity'] is not None and metrics['modularity'] < 0.4 else
-                    "Strong community structure" if 'modularity' in metrics and metrics['modularity'] is not None else
-                    "Not analyzed"))
-            
-        if target_attributes is not None and 'homophily_score' in metrics and metrics['homophily_score'] is not None:
-            lines.append("- Class Separation: " +
-                        ("Poor separation of target classes" if metrics['homophily_score'] < 0.3 else
-                        "Moderate separation of target classes" if metrics['homophily_score'] < 0.9 else
-                        "Strong separation of target classes"))
-            
-            if 'chi2_p_value' in metrics and metrics['chi2_p_value'] is not None:
-                if metrics['chi2_p_value'] < 0.05:
-                    lines.append("  The connection patterns by class are statistically significant.")
-                else:
-                    lines.append("  The connection patterns by class may be due to random chance.")
+    lines.append("- Community Structure: " +
+                ("Weak community structure" if 'modularity' in metrics and metrics['modularity'] is not None and metrics['modularity'] < 0.2 else
+                "Moderate community structure" if 'modularity' in metrics and metrics['modularity'] is not None and metrics['modularity'] < 0.4 else
+                "Strong community structure" if 'modularity' in metrics and metrics['modularity'] is not None else
+                "Not analyzed"))
+        
+    if target_attributes is not None and not multi_target and 'homophily_score' in metrics and metrics['homophily_score'] is not None:
+        lines.append("- Class Separation: " +
+                    ("Poor separation of target classes" if metrics['homophily_score'] < 0.3 else
+                    "Moderate separation of target classes" if metrics['homophily_score'] < 0.9 else
+                    "Strong separation of target classes"))
         
-        return lines    
+        if 'chi2_p_value' in metrics and metrics['chi2_p_value'] is not None:
+            if metrics['chi2_p_value'] < 0.05:
+                lines.append("  The connection patterns by class are statistically significant.")
+            else:
+                lines.append("  The connection patterns by class may be due to random chance.")
+    
+    return lines
+
+
+def write_metrics(metrics, paths, target_attributes=None, multi_target=False, verbose=True):
+    """
+    Writes the network metrics report, or prints it when no report file is requested, and saves
+    the machine-readable metrics if paths['metrics_filename'] is set.
+    """
+    target_attributes, _ = resolve_target_attributes(target_attributes, multi_target, verbose=False)
     # Write metrics to file if filename is provided
-    if paths['network_metrics_filename']:
+    if paths.get('network_metrics_filename'):
         if verbose:
             print(f"{datetime.now()}: Writing network metrics report to file...")
             
         with open(paths['network_metrics_filename'], 'w') as f:
-            for line in format_metrics_report():
+            for line in format_metrics_report(metrics, target_attributes, multi_target):
                 f.write(line + "\n")
         
         if verbose:
@@ -417,72 +500,253 @@ def analyze_graph(graph,
         if verbose:
             print(f"{datetime.now()}: Network metrics report (no output file specified):")
             print("-" * 50)
-            for line in format_metrics_report():
+            for line in format_metrics_report(metrics, target_attributes, multi_target):
                 print(line)
             print("-" * 50)
 
+    if paths.get('metrics_filename'):
+        save_metrics(metrics, paths['metrics_filename'], verbose=verbose)
+
+
+def plot_analysis(G, context, paths, target_attributes=None, multi_target=False, pos=None,
+                  neighborhood=True, verbose=True):
+    """
+    Prints and writes the neighborhood probabilities and draws the plots requested in paths: probability
+    heatmaps, degree distribution, community composition and graph visualization.
+
+    Plots are colored by the target attribute, or by the first one in multi-target mode. With
+    neighborhood=False the probabilities and heatmaps are skipped, so that the plots can be split
+    among several calls.
+    """
+    target_attributes, target_list = resolve_target_attributes(target_attributes, multi_target, verbose=False)
+    if context is None or context.graph is not G:
+        context = AnalysisContext(G)
+
     # Perform neighborhood analysis if target attributes provided
-    if target_attributes is not None:
+    if target_list and neighborhood:
         if verbose:
             print(f"{datetime.now()}: Analyzing neighborhood probabilities...")
-            
-        df_neigh = analyze_neighborhood_attributes(G, target_attribute=target_attributes)
-        probabilities = print_neighbors_prob(df_neigh, target_attributes)
-        
+
+        probabilities = {}
+        for attribute in target_list:
+            target_values, mixing = context.mixing(attribute)
+            prob_matrix = context.probabilities(attribute)
+            probabilities[attribute] = probabilities_to_dict(target_values, prob_matrix)
+
+            # Create heatmap, one per attribute in multi-target mode
+            if paths.get('prob_heatmap_filename') is not None:
+                if verbose:
+                    print(f"{datetime.now()}: Creating probability heatmap...")
+                heatmap_path = paths['prob_heatmap_filename']
+                if multi_target:
+                    base, ext = os.path.splitext(heatmap_path)
+                    heatmap_path = f"{base}_{_safe_filename(attribute)}{ext}"
+                heat_map_mixing(target_values, prob_matrix, heatmap_path, verbose)
+
         # Print probabilities
         if verbose:
             print(f"{datetime.now()}: Neighborhood probability results:")
             
-        for (i, j), prob in probabilities.items():
-            print(f"P({j}|{i}) = {prob:.4f}")
+        for attribute, attribute_probabilities in probabilities.items():
+            if multi_target:
+                print(f"# {attribute}")
+            for (i, j), prob in attribute_probabilities.items():
+                print(f"P({j}|{i}) = {prob:.4f}")
         
         # Save to file if specified
-        if paths['neigh_prob_filename'] is not None:
+        if paths.get('neigh_prob_filename') is not None:
             if verbose:
                 print(f"{datetime.now()}: Saving neighborhood probabilities to file...")
                 
             with open(paths['neigh_prob_filename'], 'w') as fp:
-                for (i, j), prob in probabilities.items():
-                    fp.write(f"P({j}|{i}) = {prob:.4f}\n")
+                for attribute, attribute_probabilities in probabilities.items():
+                    if multi_target:
+                        fp.write(f"# {attribute}\n")
+                    for (i, j), prob in attribute_probabilities.items():
+                        fp.write(f"P({j}|{i}) = {prob:.4f}\n")
             
             if verbose:
                 print(f"{datetime.now()}: Neighborhood probabilities saved to {paths['neigh_prob_filename']}")
-        
-        # Create heatmap
-        if paths['prob_heatmap_filename'] is not None:
-            if verbose:
-                print(f"{datetime.now()}: Creating probability heatmap...")
-                
-            heat_map_prob(probabilities, df_neigh, target_attributes, paths['prob_heatmap_filename'], verbose)
-            
+
+    # Plots are colored by the first target attribute in multi-target mode
+    color_attribute = target_list[0] if multi_target and target_list else target_attributes
 
     # Create degree distribution plot
-    if paths['degree_distribution_filename'] is not None:
+    if paths.get('degree_distribution_filename') is not None:
         if verbose:
             print(f"{datetime.now()}: Creating degree distribution plot...")
             
-        degree_data = {'data': [degree for _, degree in G.degree()],
+        degree_data = {'data': context.degrees().tolist(),
                        'title': 'Degree distribution',
                        'xlabel': 'Degree',
                        'ylabel': 'Number of Nodes'}
         plot_distribution(degree_data, paths['degree_distribution_filename'], verbose)
             
     # Create community composition plot
-    if paths['community_filename'] is not None:
+    if paths.get('community_filename') is not None:
         if verbose:
             print(f"{datetime.now()}: Creating community composition plot...")
             
-        plot_community_composition(G, target_attributes, communities, paths['community_filename'], verbose)
-        
+        plot_community_composition(G, color_attribute, context.communities(), paths['community_filename'], verbose, context=context)
     
     # Create graph visualization
-    if paths['graph_visualization_filename'] is not None:
+    if paths.get('graph_visualization_filename') is not None:
         if verbose:
             print(f"{datetime.now()}: Creating graph visualization...")
             
-        matplotlib_graph_visualization(G, target_attributes, paths['graph_visualization_filename'], verbose, pos=pos)
-            
+        matplotlib_graph_visualization(G, color_attribute, paths['graph_visualization_filename'], verbose, pos=pos, context=context)
+
+
+def save_metrics(metrics, path, verbose=False):
+    """
+    Saves the metrics returned by analyze_graph in a machine-readable file.
+
+    Two formats are supported, chosen by the file extension:
+    - .json: an object with the scalar metrics under "metrics" and the per-node columns under "nodes".
+    - .parquet: the per-node table, with the scalar metrics stored as JSON in the file metadata.
+
+    Parameters:
+    - metrics (dict): Metrics returned by analyze_graph. The 'node_metrics' DataFrame is optional.
+    - path (str): Output file.
+    - verbose (bool): Whether to print progress messages.
+
+    Raises:
+    - ValueError: If the extension is not .json or .parquet.
+    """
+    node_metrics = metrics.get('node_metrics')
+    scalars = {key: value for key, value in metrics.items() if key != 'node_metrics'}
+    if path.endswith('.json'):
+        content = {'metrics': scalars,
+                   'nodes': node_metrics.to_dict(orient='list') if node_metrics is not None else {}}
+        with open(path, 'w') as f:
+            json.dump(content, f, default=_json_default)
+    elif path.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(node_metrics if node_metrics is not None else pd.DataFrame(), preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[PARQUET_METRICS_KEY] = json.dumps(scalars, default=_json_default).encode()
+        pq.write_table(table.replace_schema_metadata(metadata), path)
+    else:
+        raise ValueError(f"Unsupported metrics file: {path}. Use a .json or .parquet file.")
     if verbose:
-        print(f"{datetime.now()}: Graph analysis complete.")
+        print(f"{datetime.now()}: Metrics saved to {path}")
+
+
+def load_metrics(path):
+    """
+    Loads metrics saved by save_metrics.
+
+    Returns:
+    - dict: The scalar metrics, with the per-node table as a DataFrame under 'node_metrics'.
+    """
+    if path.endswith('.json'):
+        with open(path) as f:
+            content = json.load(f)
+        metrics = content['metrics']
+        metrics['node_metrics'] = pd.DataFrame(content['nodes'])
+    elif path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        metrics = json.loads(table.schema.metadata[PARQUET_METRICS_KEY])
+        metrics['node_metrics'] = table.to_pandas()
+    else:
+        raise ValueError(f"Unsupported metrics file: {path}. Use a .json or .parquet file.")
+    return metrics
+
+
+def _json_default(value):
+    """Convert the numpy scalars and arrays found in the metrics to JSON types."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def target_statistics(context, target_attributes, n_permutations=100, random_state=None, verbose=True):
+    """
+    Computes the chi-square test and the homophily permutation test of several target attributes.
+
+    The mixing matrices of all attributes are counted in a single pass over the edges. The permutation
+    test shuffles the rows of the stacked label matrix, so that every attribute is permuted by the same
+    node shuffle, and counts batches of permutations with tagra.kernels.mixing_matrices.
+
+    Parameters:
+    - context (AnalysisContext): Context of the graph to analyze.
+    - target_attributes (list): Node attributes to analyze.
+    - n_permutations (int): Number of label shuffles of the permutation test.
+    - random_state (int, optional): Seed of the shuffles.
+    - verbose (bool): Whether to print progress messages.
+
+    Returns:
+    - dict: For each attribute, a dictionary with its number of labels ('n_labels') and the
+      chi2_stat, chi2_p_value, homophily_score, homophily_p_value and homophily_z_score metrics,
+      None when they cannot be computed.
+    """
+    if verbose:
+        print(f"{datetime.now()}: Computing the neighbor mixing matrix...")
+    results = {}
+    tested = []
+    for attribute, (target_values, contingency_table) in zip(target_attributes, context.mixing_many(target_attributes)):
+        stats = dict.fromkeys(TARGET_METRICS)
+        stats['n_labels'] = len(target_values)
+        # Chi-square test
+        if len(contingency_table) > 1 and (contingency_table.sum(axis=1) > 0).all():
+            if verbose:
+                print(f"{datetime.now()}: Performing chi-square test for {attribute}...")
+            chi2, p_value, dof, expected = chi2_contingency(contingency_table)
+            stats['chi2_stat'] = chi2
+            stats['chi2_p_value'] = p_value
+        elif verbose:
+            print(f"{datetime.now()}: Skipping chi-square test for {attribute} - insufficient data.")
+        # Calculate diagonal sum (homophily measure)
+        if len(target_values) > 1:
+            stats['homophily_score'] = np.trace(context.probabilities(attribute)) / len(target_values)
+            tested.append(attribute)
+        results[attribute] = stats
+
+    if tested and n_permutations > 0:
+        if verbose:
+            print(f"{datetime.now()}: Starting permutation test (this may take a moment)...")
+        permutation_diagonals = _permutation_homophily(context, tested, n_permutations, random_state, verbose)
+        for attribute, diagonals in zip(tested, permutation_diagonals.T):
+            stats = results[attribute]
+            stats['homophily_p_value'] = np.mean(diagonals >= stats['homophily_score'])
+            perm_std = np.std(diagonals)
+            # Z-score compared to random
+            stats['homophily_z_score'] = (stats['homophily_score'] - np.mean(diagonals)) / perm_std \
+                if len(diagonals) > 1 and perm_std > 0 else 0
+    return results
+
+
+def _permutation_homophily(context, target_attributes, n_permutations, random_state, verbose):
+    """Homophily score of each attribute under n_permutations random node shuffles, as an (n_permutations, n_attributes) array."""
+    codes = np.column_stack([context.label_codes(a)[0] for a in target_attributes]).astype(np.int64)
+    n_labels = [len(context.label_codes(a)[1]) for a in target_attributes]
+    sources, targets = context.edge_arrays()
+    n_nodes, n_attributes = codes.shape
+    rng = np.random.default_rng(random_state)
+
+    batch_size = max(1, PERMUTATION_BATCH_CELLS // max(1, len(sources) * n_attributes))
+    diagonals = np.empty((n_permutations, n_attributes))
+    for start in range(0, n_permutations, batch_size):
+        size = min(batch_size, n_permutations - start)
+        if verbose:
+            print(f"{datetime.now()}: Permutation test progress: {start}/{n_permutations}...")
+        # One row of shuffled labels per permutation and attribute, counted by the mixing kernel
+        shuffled = np.vstack([codes[rng.permutation(n_nodes)].T for _ in range(size)])
+        matrices = mixing_matrices(shuffled, sources, targets, max(n_labels))
+        for i, perm_mixing in enumerate(matrices):
+            attribute = i % n_attributes
+            perm_mixing = perm_mixing[:n_labels[attribute], :n_labels[attribute]]
+            diagonals[start + i // n_attributes, attribute] = np.trace(mixing_probabilities(perm_mixing)) / n_labels[attribute]
+    return diagonals
+
+
+def _format_stat(value, width, decimals):
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.{decimals}f}"
+
 
-    return metrics
\ No newline at end of file
+def _safe_filename(name):
+    return "".join(c if c.isalnum() or c in '-_.' else '_' for c in str(name))
@@ -0,0 +1,177 @@
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+
+from .config import default_config
+
+
+# Metrics that are not scalars and are left out of the summary table
+SUMMARY_EXCLUDED_METRICS = ['node_metrics', 'targets', 'pipeline']
+
+
+def expand_datasets(spec: Union[str, List[Union[str, Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """
+    Lists the datasets of a batch, each with its configuration overrides.
+
+    Args:
+        spec: One of:
+            - a glob pattern of dataset files, e.g. 'data/*.csv';
+            - a path to a JSON manifest, either a list of entries or an object with a "datasets"
+              list and "defaults" overrides applied to every entry;
+            - a list of entries.
+            An entry is a dataset path or an object with an "input_dataframe" key and any other
+            setting of the configuration file, which overrides the base configuration for that dataset.
+
+    Returns:
+        A list of override dictionaries, each with an 'input_dataframe' key.
+
+    Raises:
+        ValueError: If an entry has no input_dataframe or an unknown setting, or if no dataset is found.
+    """
+    defaults = {}
+    if isinstance(spec, str):
+        if spec.endswith('.json') and os.path.isfile(spec):
+            with open(spec, 'r') as f:
+                manifest = json.load(f)
+            if isinstance(manifest, dict):
+                defaults = manifest.get('defaults', {})
+                manifest = manifest.get('datasets', [])
+            # Relative paths in the manifest are relative to the manifest itself
+            base_dir = os.path.dirname(os.path.abspath(spec))
+            entries = []
+            for entry in manifest:
+                entry = {'input_dataframe': entry} if isinstance(entry, str) else dict(entry)
+                if isinstance(entry.get('input_dataframe'), str):
+                    entry['input_dataframe'] = os.path.join(base_dir, entry['input_dataframe'])
+                entries.append(entry)
+        else:
+            entries = [{'input_dataframe': path} for path in sorted(glob.glob(spec))]
+    else:
+        entries = [{'input_dataframe': entry} if isinstance(entry, str) else dict(entry) for entry in spec]
+
+    datasets = []
+    for entry in entries:
+        overrides = dict(defaults, **entry)
+        if 'input_dataframe' not in overrides:
+            raise ValueError(f"Batch entry {entry} has no input_dataframe.")
+        _check_settings(overrides)
+        datasets.append(overrides)
+    if len(datasets) == 0:
+        raise ValueError(f"No dataset found for {spec}.")
+    return datasets
+
+
+def run_batch(
+    datasets: Union[str, List[Union[str, Dict[str, Any]]]],
+    base_config: Optional[Dict[str, Any]] = None,
+    max_workers: Optional[int] = None,
+    summary_filename: Optional[str] = None,
+    verbose: bool = True,
+) -> pd.DataFrame:
+    """
+    Runs the TaGra pipeline on many datasets in a pool of long-lived worker processes.
+
+    The workers import the heavy dependencies once, when they start, and then process one dataset
+    after the other; at most max_workers datasets are processed at the same time. Unless overridden,
+    each dataset writes its outputs to a subdirectory of the base output directory named after it
+    (suffixed with its position when several datasets share a file name), and runs its own pipeline on a single thread so that the workers do not compete for the CPUs.
+    A failing dataset is recorded in the summary and does not stop the batch.
+
+    Args:
+        datasets: The datasets, see expand_datasets.
+        base_config: Settings shared by every dataset. Missing settings take the default values.
+        max_workers: Number of worker processes. Defaults to the number of CPUs.
+        summary_filename: Optional path (.csv or .parquet) where the summary table is saved.
+        verbose: Whether to print the progress of the batch.
+
+    Returns:
+        The summary table: one row per dataset, in the order of the batch, with its status, its
+        run time, the error message if it failed, and its scalar metrics.
+    """
+    datasets = expand_datasets(datasets)
+    base_config = dict(default_config, **(base_config or {}))
+    _check_settings(base_config)
+    names = [os.path.splitext(os.path.basename(overrides['input_dataframe']))[0] for overrides in datasets]
+    # Datasets with the same file name in different directories get their position as suffix
+    duplicated = {name for name in names if names.count(name) > 1}
+    configs = [_dataset_config(base_config, overrides, f"{name}_{i}" if name in duplicated else name)
+               for i, (overrides, name) in enumerate(zip(datasets, names))]
+
+    if verbose:
+        print(f"{datetime.datetime.now()}: Running {len(configs)} datasets on {max_workers or os.cpu_count()} workers.")
+    rows = [None] * len(configs)
+    # Spawned workers: forking after numba's threading layer has started in this process can leave the
+    # children, and the interpreter exit, waiting on locks that were held at fork time
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_warm_imports,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(_run_dataset, config): i for i, config in enumerate(configs)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            rows[i] = future.result()
+            if verbose:
+                print(f"{datetime.datetime.now()}: [{done}/{len(configs)}] {rows[i]['dataset']}: "
+                      f"{rows[i]['status']} in {rows[i]['run_time']:.2f}s")
+
+    summary = pd.DataFrame(rows)
+    if summary_filename is not None:
+        if summary_filename.endswith('.parquet'):
+            summary.to_parquet(summary_filename, index=False)
+        elif summary_filename.endswith('.csv'):
+            summary.to_csv(summary_filename, index=False)
+        else:
+            raise ValueError(f"Unsupported summary file: {summary_filename}. Use a .csv or .parquet file.")
+        if verbose:
+            print(f"{datetime.datetime.now()}: Batch summary saved to {summary_filename}")
+    return summary
+
+
+def _check_settings(settings: Dict[str, Any]) -> None:
+    for setting in settings:
+        if setting not in default_config and setting != 'input_dataframe':
+            raise ValueError(f"Unknown setting '{setting}' in batch configuration.")
+
+
+def _dataset_config(base_config: Dict[str, Any], overrides: Dict[str, Any], name: str) -> Dict[str, Any]:
+    config = dict(base_config)
+    config['output_directory'] = os.path.join(base_config['output_directory'] or './', name)
+    config['n_workers'] = 1
+    config['pipeline_executor'] = 'thread'
+    config.update(overrides)
+    return config
+
+
+def _warm_imports() -> None:
+    """Worker initializer: import the heavy dependencies once per worker process."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot  # noqa: F401
+    import networkx  # noqa: F401
+    import sklearn.neighbors  # noqa: F401
+    from . import pipeline  # noqa: F401
+    try:
+        import umap  # noqa: F401
+    except ImportError:
+        pass
+
+
+def _run_dataset(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the pipeline on one dataset and return its summary row."""
+    from .pipeline import run_pipeline
+    row = {'dataset': config['input_dataframe'], 'output_directory': config['output_directory']}
+    start = time.time()
+    try:
+        metrics = run_pipeline(config)
+    except Exception as e:
+        row.update(status='failed', run_time=time.time() - start, error=f"{type(e).__name__}: {e}")
+        return row
+    row.update(status='ok', run_time=time.time() - start, error=None)
+    row.update({key: value for key, value in metrics.items() if key not in SUMMARY_EXCLUDED_METRICS})
+    row['critical_path_time'] = metrics['pipeline']['critical_path_time']
+    return row
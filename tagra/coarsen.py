@@ -0,0 +1,188 @@
+import datetime
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+from .community import community_assignment, community_composition, community_mixing_matrix
+from .utils import graph_edge_arrays, node_label_codes
+
+
+COARSEN_METHODS = ['louvain', 'matching']
+
+
+def coarsen_graph(graph, communities=None, method='louvain', target_attributes=None, max_nodes=1000,
+                  random_state=0, context=None, verbose=True):
+    """
+    Collapses groups of nodes into a weighted super-graph, small enough for networkx metrics and plots.
+
+    Each super-node stands for a group of original nodes: a community, given or detected with Louvain,
+    or a cluster of the multilevel matching, which merges pairs of nodes joined by their heaviest edge,
+    level after level, until at most max_nodes super-nodes are left (or no pair can be merged).
+
+    Super-node attributes:
+    - size: number of original nodes;
+    - internal_edges: edges between its original nodes;
+    - for each target attribute: the attribute itself (majority label, so that the super-graph can be
+      colored and analyzed like the original one), '{attribute}_composition' ({label: count}) and
+      '{attribute}_purity' (fraction of the majority label).
+    Super-edges have a 'weight', the number of original edges between the two groups. The graph
+    attributes 'assignment' (super-node of each original node, in original node order) and
+    'original_nodes' allow to drill back down, see super_node_members and expand_super_nodes.
+
+    Parameters:
+    - graph (networkx.Graph): The original, undirected graph.
+    - communities (list or dict, optional): Node groups to collapse, as lists of nodes or {key: nodes}.
+      Nodes in no group become super-nodes of their own. If None, the groups are found with method.
+    - method (str): 'louvain' (networkx Louvain communities) or 'matching' (multilevel heavy-edge matching).
+    - target_attributes (str or list, optional): Node attributes whose composition is stored.
+    - max_nodes (int): With 'matching', the number of super-nodes to reach.
+    - random_state (int): Seed of Louvain and of the tie-breaking of the matching.
+    - context (tagra.context.AnalysisContext, optional): Context of graph, to reuse its edge arrays and labels.
+    - verbose (bool): Whether to print progress messages.
+
+    Returns:
+    - networkx.Graph: The super-graph; super-node i is the i-th group, then come the nodes in no group.
+    """
+    if graph.is_directed():
+        raise ValueError("Coarsening supports undirected graphs only.")
+    nodes = context.nodes() if context is not None else list(graph.nodes)
+    sources, targets = context.edge_arrays() if context is not None else graph_edge_arrays(graph)
+
+    if communities is None:
+        if method == 'louvain':
+            if verbose:
+                print(f"{datetime.datetime.now()}: Detecting Louvain communities...")
+            communities = nx.community.louvain_communities(graph, seed=random_state)
+            assignment, _ = community_assignment(nodes, communities)
+        elif method == 'matching':
+            assignment = _multilevel_matching(sources, targets, len(nodes), max_nodes, random_state, verbose)
+        else:
+            raise ValueError(f"Unsupported coarsening method: {method}. Choose from {COARSEN_METHODS}")
+    else:
+        assignment, _ = community_assignment(nodes, communities)
+    # Super-node i is group i; nodes in no group follow as super-nodes of their own
+    n_groups = len(communities) if communities is not None else int(assignment.max(initial=-1)) + 1
+    alone = assignment < 0
+    assignment[alone] = n_groups + np.arange(alone.sum())
+    n_super = n_groups + int(alone.sum())
+
+    weights = community_mixing_matrix(assignment, sources, targets, n_super).tocoo()
+    sizes = np.bincount(assignment, minlength=n_super)
+    internal = weights.diagonal() // 2
+
+    super_graph = nx.Graph()
+    super_graph.add_nodes_from((i, {'size': int(sizes[i]), 'internal_edges': int(internal[i])}) for i in range(n_super))
+    upper = weights.row < weights.col
+    super_graph.add_weighted_edges_from(zip(weights.row[upper].tolist(), weights.col[upper].tolist(),
+                                            weights.data[upper].tolist()))
+
+    if isinstance(target_attributes, str):
+        target_attributes = [target_attributes]
+    for attribute in target_attributes or []:
+        codes, labels = context.label_codes(attribute) if context is not None else node_label_codes(graph, attribute)
+        composition = community_composition(assignment, codes, n_super, len(labels))
+        majority = composition.argmax(axis=1)
+        for i in range(n_super):
+            data = super_graph.nodes[i]
+            data[attribute] = labels[majority[i]]
+            data[f"{attribute}_composition"] = {labels[j]: int(count) for j, count in enumerate(composition[i]) if count > 0}
+            data[f"{attribute}_purity"] = float(composition[i, majority[i]] / sizes[i])
+
+    super_graph.graph['assignment'] = assignment
+    super_graph.graph['original_nodes'] = nodes
+    # Original node positions grouped by super-node, for drill-down
+    super_graph.graph['member_order'] = np.argsort(assignment, kind='stable')
+    super_graph.graph['member_offsets'] = np.concatenate([[0], np.cumsum(sizes)])
+    if verbose:
+        print(f"{datetime.datetime.now()}: Coarsened {len(nodes)} nodes and {len(sources)} edges into "
+              f"{n_super} super-nodes and {super_graph.number_of_edges()} super-edges.")
+    return super_graph
+
+
+def super_node_members(super_graph, super_node):
+    """
+    The original nodes collapsed into a super-node.
+
+    Parameters:
+    - super_graph (networkx.Graph): A super-graph built by coarsen_graph.
+    - super_node (int): The super-node.
+
+    Returns:
+    - list: The original nodes, in original order.
+    """
+    order, offsets = super_graph.graph['member_order'], super_graph.graph['member_offsets']
+    nodes = super_graph.graph['original_nodes']
+    return [nodes[i] for i in order[offsets[super_node]:offsets[super_node + 1]]]
+
+
+def expand_super_nodes(super_graph, graph, super_nodes):
+    """
+    Drills down from super-nodes to the original graph.
+
+    Parameters:
+    - super_graph (networkx.Graph): A super-graph built by coarsen_graph from graph.
+    - graph (networkx.Graph): The original graph.
+    - super_nodes (int or list): The super-nodes to expand.
+
+    Returns:
+    - networkx.Graph: The subgraph of graph induced by the original nodes of the super-nodes (a view).
+    """
+    if np.isscalar(super_nodes):
+        super_nodes = [super_nodes]
+    members = [node for super_node in super_nodes for node in super_node_members(super_graph, super_node)]
+    return graph.subgraph(members)
+
+
+def _multilevel_matching(sources, targets, n_nodes, max_nodes, random_state=0, verbose=True, max_rounds=5):
+    """
+    Groups nodes by repeated heavy-edge matching and returns the group of each node.
+
+    At each level every node proposes to the neighbor joined by its heaviest edge (ties broken at random),
+    mutual proposals are merged, and the unmatched nodes propose again among themselves, up to max_rounds
+    times; the nodes still unmatched join their heaviest matched neighbor. The merged groups become the
+    nodes of the next level, whose edge weights are the sums of the original ones.
+    """
+    rng = np.random.default_rng(random_state)
+    assignment = np.arange(n_nodes)
+    weights = community_mixing_matrix(assignment, sources, targets, n_nodes).tocsr().astype(float)
+    level = 0
+    while weights.shape[0] > max_nodes:
+        n = weights.shape[0]
+        weights.setdiag(0)
+        weights.eliminate_zeros()
+        # Random tie-breaking, small enough not to change the order of different weights
+        weights.data *= 1 + 1e-6 * rng.random(len(weights.data))
+        match = np.full(n, -1)
+        for _ in range(max_rounds):
+            unmatched = np.flatnonzero(match < 0)
+            sub = weights[unmatched][:, unmatched].tocsr()
+            if sub.nnz == 0:
+                break
+            has_neighbors = np.diff(sub.indptr) > 0
+            best = np.asarray(sub.argmax(axis=1)).ravel()
+            mutual = has_neighbors & (best[best] == np.arange(len(unmatched))) & (best != np.arange(len(unmatched)))
+            if not mutual.any():
+                break
+            match[unmatched[mutual]] = unmatched[best[mutual]]
+        representative = np.where(match >= 0, np.minimum(np.arange(n), match), np.arange(n))
+        # Nodes left unmatched join the pair of their heaviest matched neighbor, so that sparse random
+        # graphs, where mutual proposals are rare, still shrink quickly
+        leftover, matched = np.flatnonzero(match < 0), np.flatnonzero(match >= 0)
+        if len(leftover) and len(matched):
+            sub = weights[leftover][:, matched].tocsr()
+            has_neighbors = np.diff(sub.indptr) > 0
+            best = np.asarray(sub.argmax(axis=1)).ravel()
+            representative[leftover[has_neighbors]] = representative[matched[best[has_neighbors]]]
+        _, level_ids = np.unique(representative, return_inverse=True)
+        n_next = level_ids.max() + 1
+        if n_next == n:
+            break
+        assignment = level_ids[assignment]
+        # Contract: W' = P^T W P, with P the (n, n_next) membership matrix
+        membership = sparse.csr_matrix((np.ones(n), (np.arange(n), level_ids)), shape=(n, n_next))
+        weights = (membership.T @ weights @ membership).tocsr()
+        level += 1
+        if verbose:
+            print(f"{datetime.datetime.now()}: Matching level {level}: {n} -> {n_next} nodes.")
+    return assignment
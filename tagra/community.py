@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def community_assignment(nodes, communities):
+    """
+    Maps each node to the integer id of its community.
+
+    Parameters:
+    - nodes (list): The nodes of the graph; positions in this list index the returned array.
+    - communities (list or dict): The communities, as a list of node collections (the id of a community
+      is its position) or as a dict {community key: node collection} (the id is the position of the key).
+
+    Returns:
+    - (np.ndarray, list): The community id of each node (-1 for the nodes in no community), and the key
+      of each community id.
+
+    Raises:
+    - ValueError: If a community contains a node that is not in nodes.
+    """
+    if isinstance(communities, dict):
+        keys, members = list(communities.keys()), list(communities.values())
+    else:
+        keys, members = list(range(len(communities))), list(communities)
+    sizes = np.fromiter((len(m) for m in members), dtype=np.int64, count=len(members))
+    flat = [node for m in members for node in m]
+    positions = pd.Index(nodes).get_indexer(pd.Index(flat, dtype=object)) if flat else np.empty(0, dtype=np.int64)
+    if (positions < 0).any():
+        missing = [node for node, position in zip(flat, positions) if position < 0]
+        raise ValueError(f"Nodes in communities not in the graph: {set(missing)}")
+    ids = np.full(len(nodes), -1, dtype=np.int64)
+    ids[positions] = np.repeat(np.arange(len(members), dtype=np.int64), sizes)
+    return ids, keys
+
+
+def community_mixing_matrix(community_ids, sources, targets, n_communities, directed=False):
+    """
+    Counts the edges between each pair of communities, as a sparse matrix.
+
+    The edges are aggregated with a single COO to CSR conversion, so the cost is linear in the number of
+    edges and the memory in the number of community pairs that are actually connected. In an undirected
+    graph each edge is counted in both directions (a self-loop twice), so that row c sums to the total
+    degree of community c.
+
+    Parameters:
+    - community_ids (np.ndarray): Community id of each node, -1 for no community, see community_assignment.
+    - sources, targets (np.ndarray): Edge endpoints as node positions, see tagra.utils.graph_edge_arrays.
+    - n_communities (int): Number of communities.
+    - directed (bool): Whether to count each edge only from its source to its target.
+
+    Returns:
+    - scipy.sparse.csr_matrix: An (n_communities, n_communities) integer matrix. Edges with an end in no
+      community are not counted.
+    """
+    c_sources, c_targets = community_ids[sources], community_ids[targets]
+    if not directed:
+        c_sources, c_targets = np.concatenate([c_sources, c_targets]), np.concatenate([c_targets, c_sources])
+    valid = (c_sources >= 0) & (c_targets >= 0)
+    counts = np.ones(int(valid.sum()), dtype=np.int64)
+    return sparse.coo_matrix((counts, (c_sources[valid], c_targets[valid])),
+                             shape=(n_communities, n_communities)).tocsr()
+
+
+def community_composition(community_ids, label_codes, n_communities, n_labels):
+    """
+    Counts the nodes of each label in each community.
+
+    Parameters:
+    - community_ids (np.ndarray): Community id of each node, -1 for no community.
+    - label_codes (np.ndarray): Integer label code of each node, see tagra.utils.node_label_codes.
+    - n_communities (int): Number of communities.
+    - n_labels (int): Number of distinct label codes.
+
+    Returns:
+    - np.ndarray: An (n_communities, n_labels) integer matrix.
+    """
+    valid = community_ids >= 0
+    counts = np.bincount(community_ids[valid] * n_labels + label_codes[valid], minlength=n_communities * n_labels)
+    return counts.reshape(n_communities, n_labels)
+
+
+def community_statistics(community_ids, sources, targets, n_communities, label_codes=None, n_labels=None):
+    """
+    Computes the statistics of every community in one vectorized pass over the nodes and edges.
+
+    Parameters:
+    - community_ids (np.ndarray): Community id of each node, -1 for no community.
+    - sources, targets (np.ndarray): Edge endpoints as node positions (undirected edges).
+    - n_communities (int): Number of communities.
+    - label_codes (np.ndarray, optional): Integer label code of each node, for the composition statistics.
+    - n_labels (int, optional): Number of distinct label codes.
+
+    Returns:
+    - pd.DataFrame: One row per community id, with:
+      - size: number of nodes;
+      - internal_edges: edges with both ends in the community;
+      - cut_edges: edges with one end in the community;
+      - volume: total degree of the nodes;
+      - conductance: cut_edges / min(volume, total volume - volume), NaN if that is 0;
+      and with labels:
+      - majority_code: code of the most common label;
+      - purity: fraction of the nodes with the most common label;
+      - entropy: Shannon entropy, in bits, of the label distribution.
+    """
+    valid_nodes = community_ids >= 0
+    size = np.bincount(community_ids[valid_nodes], minlength=n_communities)
+
+    c_sources, c_targets = community_ids[sources], community_ids[targets]
+    degree = np.bincount(sources, minlength=len(community_ids)) + np.bincount(targets, minlength=len(community_ids))
+    volume = np.bincount(community_ids[valid_nodes], weights=degree[valid_nodes], minlength=n_communities)
+    internal = (c_sources == c_targets) & (c_sources >= 0)
+    internal_edges = np.bincount(c_sources[internal], minlength=n_communities)
+    cut = ~internal
+    cut_edges = (np.bincount(c_sources[cut & (c_sources >= 0)], minlength=n_communities)
+                 + np.bincount(c_targets[cut & (c_targets >= 0)], minlength=n_communities))
+    denominator = np.minimum(volume, degree.sum() - volume)
+    conductance = np.divide(cut_edges, denominator, out=np.full(n_communities, np.nan), where=denominator > 0)
+
+    statistics = pd.DataFrame({
+        'community': np.arange(n_communities),
+        'size': size,
+        'internal_edges': internal_edges,
+        'cut_edges': cut_edges,
+        'volume': volume.astype(np.int64),
+        'conductance': conductance,
+    })
+    if label_codes is not None:
+        n_labels = int(label_codes.max()) + 1 if n_labels is None else n_labels
+        composition = community_composition(community_ids, label_codes, n_communities, n_labels)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fractions = composition / size[:, None]
+            plogp = np.where(composition > 0, fractions * np.log2(np.where(composition > 0, fractions, 1)), 0.0)
+        statistics['majority_code'] = composition.argmax(axis=1)
+        statistics['purity'] = np.divide(composition.max(axis=1), size, out=np.full(n_communities, np.nan), where=size > 0)
+        statistics['entropy'] = np.where(size > 0, -plogp.sum(axis=1), np.nan)
+    return statistics
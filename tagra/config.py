@@ -4,30 +4,64 @@ import os
 default_config = {
     "output_directory": "results/", 
     "preprocessed_filename": None,
+    "preprocessor_filename": None,
     "graph_filename": None,
     "inferred_columns_filename": None,
     "numeric_columns": [],
     "categorical_columns": [],
     "target_columns": None,
+    "multi_target": False,
     "ignore_columns": [],
+    "downcast": True,
+    "downcast_floats": False,
+    "dtype": "float64",
+    "memory_budget": None,
+    "track_memory": False,
     "unknown_column_action": "infer",
     "numeric_threshold": 0.05,
     "numeric_scaling": "standard",
     "categorical_encoding": "one-hot",
     "nan_action": "infer",
     "nan_threshold": 0,
+    "preprocessing_n_jobs": None,
     "verbose": True,
     "manifold_method": 'UMAP',
+    "manifold_sample_size": None,
+    "projection_method": None,
+    "projection_dim": 50,
+    "projection_filename": None,
     "method": "knn",
     "k": 5,
+    "share_knn": True,
+    "node_attributes": None,
+    "index_filename": None,
+    "index_method": "kdtree",
     "distance_threshold": None,
     "similarity_threshold": None,
+    "target_degree": None,
+    "max_degree": None,
+    "max_edges": None,
     "neigh_prob_path": "neigh_prob.txt",
     "degree_distribution_filename": "degree.png",
     "community_filename": "communities.png",
     "graph_visualization_filename": "graph.png",
+    "coarsen_method": None,
+    "coarsen_max_nodes": 1000,
+    "super_graph_filename": None,
+    "super_graph_visualization_filename": "super_graph.png",
+    "neighborhood_features_filename": None,
+    "neighborhood_hops": 3,
+    "path_length_samples": None,
+    "betweenness_samples": None,
+    "pagerank_centrality": False,
+    "estimate_time_budget": None,
+    "spectral_eigenvalues": None,
+    "spectral_method": "eigsh",
     "prob_heatmap_filename": "neigh_prob_heatmap.png",
     "network_metrics_filename": None,
+    "metrics_filename": None,
+    "n_workers": None,
+    "pipeline_executor": "thread",
     "overwrite": False
 }
 
@@ -35,10 +69,11 @@ def load_config(config_path = None, dataset_path = None):
     if config_path is None:
         if dataset_path is None:
             raise ValueError("Either config_path or dataset_path must be specified.")
-        config = default_config
+        config = dict(default_config)
         config['input_dataframe'] = dataset_path
         if config["verbose"]:
             print("Using default configuration.")
+        return config
 
     if type(config_path) is str:
         if os.path.exists(config_path):
@@ -62,10 +97,10 @@ def load_config(config_path = None, dataset_path = None):
             if config["verbose"]:
                 print(f"Loaded configuration from {config_path}.")
             return config
-    else:
-        config = default_config
-        if config["verbose"]:
-            print("Using default configuration.")
+    # Without a configuration file, the defaults are used
+    config = dict(default_config)
+    if config["verbose"]:
+        print("Using default configuration.")
     return config
 
 def save_config(config, config_path="config.json"):
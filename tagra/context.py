@@ -0,0 +1,204 @@
+import threading
+
+import networkx as nx
+import numpy as np
+
+from .community import community_assignment, community_statistics
+from .kernels import adjacency_csr, clustering_coefficients
+from .utils import (
+    analyze_neighborhood_attributes,
+    graph_edge_arrays,
+    node_label_codes,
+    mixing_matrix,
+    stacked_mixing_matrices,
+    mixing_probabilities
+)
+
+
+# Marks a key that is not memoized
+_MISSING = object()
+
+
+class AnalysisContext:
+    """
+    Memoizes the intermediate results of a graph analysis, so that each one is computed once
+    and shared by every consumer (metrics, statistical tests and plots).
+
+    Results are keyed by the graph version: the number of nodes and edges, plus a counter
+    bumped by invalidate(). Changing the graph through networkx changes its size in most cases;
+    call invalidate() after edits that keep it (e.g. rewiring or changing node attributes).
+
+    A context can be shared by threads (e.g. the stages of tagra.pipeline.Pipeline): each result is
+    computed once, by the first thread that asks for it, while the others wait for it.
+
+    Parameters:
+    - graph (networkx.Graph): The graph to analyze.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._revision = 0
+        self._cache = {}
+        self._cache_version = None
+        # Guards the cache; each key has its own lock, held while the key is computed
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @property
+    def version(self):
+        """The current version of the graph."""
+        return (self.graph.number_of_nodes(), self.graph.number_of_edges(), self._revision)
+
+    def invalidate(self):
+        """Discard every memoized result."""
+        with self._lock:
+            self._revision += 1
+            self._cache = {}
+
+    def _sync(self):
+        # Called with self._lock held
+        if self._cache_version != self.version:
+            self._cache = {}
+            self._cache_version = self.version
+
+    def _lookup(self, key):
+        """The memoized result of key (or _MISSING), the cache version and the lock of the key."""
+        with self._lock:
+            self._sync()
+            return self._cache.get(key, _MISSING), self._cache_version, self._key_locks.setdefault(key, threading.RLock())
+
+    def _store(self, key, value, version):
+        with self._lock:
+            self._sync()
+            # A result computed before the graph changed is returned to its caller but not memoized
+            if self._cache_version == version:
+                self._cache.setdefault(key, value)
+
+    def _memo(self, key, compute):
+        value, _, key_lock = self._lookup(key)
+        if value is not _MISSING:
+            return value
+        with key_lock:
+            # Another thread may have computed the key while this one waited for the lock
+            value, version, _ = self._lookup(key)
+            if value is _MISSING:
+                value = compute()
+                self._store(key, value, version)
+        return value
+
+    def nodes(self):
+        """List of the nodes; positions in this list index every per-node array."""
+        return self._memo(('nodes',), lambda: list(self.graph.nodes))
+
+    def edge_arrays(self):
+        """Edge endpoints as node positions, see tagra.utils.graph_edge_arrays."""
+        return self._memo(('edge_arrays',), lambda: graph_edge_arrays(self.graph))
+
+    def degrees(self):
+        """Degree of each node, counting self-loops twice as networkx does."""
+        def compute():
+            sources, targets = self.edge_arrays()
+            n = len(self.nodes())
+            return np.bincount(sources, minlength=n) + np.bincount(targets, minlength=n)
+        return self._memo(('degrees',), compute)
+
+    def adjacency(self):
+        """CSR adjacency arrays (indptr, indices) of the graph, see tagra.kernels.adjacency_csr."""
+        def compute():
+            sources, targets = self.edge_arrays()
+            return adjacency_csr(sources, targets, len(self.nodes()), directed=self.graph.is_directed())
+        return self._memo(('adjacency',), compute)
+
+    def clustering(self):
+        """Local clustering coefficient of each node, see networkx.clustering."""
+        def compute():
+            if self.graph.is_directed() or self.graph.is_multigraph():
+                coefficients = nx.clustering(self.graph)
+                return np.array([coefficients[node] for node in self.nodes()], dtype=float)
+            # Triangles are counted on the CSR arrays, with the compiled kernel when numba is installed
+            sources, targets = self.edge_arrays()
+            return clustering_coefficients(*adjacency_csr(sources, targets, len(self.nodes()), self_loops=False))
+        return self._memo(('clustering',), compute)
+
+    def label_codes(self, target_attribute):
+        """Integer code of each node's attribute and the labels, see tagra.utils.node_label_codes."""
+        return self._memo(('label_codes', target_attribute), lambda: node_label_codes(self.graph, target_attribute))
+
+    def node_labels(self, target_attribute):
+        """Attribute value of each node, with 'None' for missing values."""
+        def compute():
+            codes, labels = self.label_codes(target_attribute)
+            return labels[codes]
+        return self._memo(('node_labels', target_attribute), compute)
+
+    def mixing(self, target_attribute):
+        """Labels and neighbor mixing matrix of an attribute, see tagra.utils.mixing_matrix."""
+        def compute():
+            codes, labels = self.label_codes(target_attribute)
+            sources, targets = self.edge_arrays()
+            return labels, mixing_matrix(codes, sources, targets, len(labels))
+        return self._memo(('mixing', target_attribute), compute)
+
+    def mixing_many(self, target_attributes):
+        """
+        Labels and mixing matrix of several attributes. The matrices that are not memoized yet are
+        counted together in a single pass over the edges, see tagra.utils.stacked_mixing_matrices.
+        """
+        keys = [('mixing', a) for a in dict.fromkeys(target_attributes)]
+        # The keys are locked in a fixed order, so that two calls with the same attributes cannot deadlock
+        key_locks = [self._lookup(key)[2] for key in sorted(keys, key=repr)]
+        for key_lock in key_locks:
+            key_lock.acquire()
+        try:
+            lookups = {key: self._lookup(key) for key in keys}
+            missing = [key for key in keys if lookups[key][0] is _MISSING]
+            if missing:
+                codes = [self.label_codes(a) for _, a in missing]
+                sources, targets = self.edge_arrays()
+                matrices = stacked_mixing_matrices([c for c, _ in codes], sources, targets,
+                                                   [len(labels) for _, labels in codes])
+                for key, (_, labels), matrix in zip(missing, codes, matrices):
+                    self._store(key, (labels, matrix), lookups[key][1])
+        finally:
+            for key_lock in reversed(key_locks):
+                key_lock.release()
+        return [self.mixing(a) for a in target_attributes]
+
+    def probabilities(self, target_attribute):
+        """Matrix of P(j|i), the probability that a neighbor of a node with label i has label j."""
+        return self._memo(('probabilities', target_attribute),
+                          lambda: mixing_probabilities(self.mixing(target_attribute)[1]))
+
+    def neighborhood(self, target_attribute):
+        """Per-node neighborhood DataFrame, see tagra.utils.analyze_neighborhood_attributes."""
+        return self._memo(('neighborhood', target_attribute),
+                          lambda: analyze_neighborhood_attributes(self.graph, target_attribute, context=self))
+
+    def communities(self):
+        """Top-level Girvan-Newman communities, as lists of nodes sorted by decreasing size."""
+        def compute():
+            communities_generator = nx.algorithms.community.girvan_newman(self.graph)
+            top_level_communities = next(communities_generator)
+            return [list(c) for c in sorted(top_level_communities, key=len, reverse=True)]
+        return self._memo(('communities',), compute)
+
+    def community_ids(self):
+        """Index in communities() of each node's community, see tagra.community.community_assignment."""
+        return self._memo(('community_ids',), lambda: community_assignment(self.nodes(), self.communities())[0])
+
+    def community_statistics(self, target_attribute=None):
+        """
+        Size, edges, conductance and, with a target attribute, purity and entropy of each community,
+        see tagra.community.community_statistics. With a target attribute, the 'majority_label' column
+        gives the most common label of each community.
+        """
+        def compute():
+            sources, targets = self.edge_arrays()
+            if target_attribute is None:
+                return community_statistics(self.community_ids(), sources, targets, len(self.communities()))
+            codes, labels = self.label_codes(target_attribute)
+            statistics = community_statistics(self.community_ids(), sources, targets, len(self.communities()),
+                                              label_codes=codes, n_labels=len(labels))
+            statistics['majority_label'] = labels[statistics['majority_code'].to_numpy()]
+            return statistics
+        return self._memo(('community_statistics', target_attribute), compute)
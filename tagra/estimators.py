@@ -0,0 +1,285 @@
+import datetime
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components, shortest_path
+
+from .context import AnalysisContext
+
+
+# Upper bound on the (sources, nodes) distance matrix computed by one batch of breadth-first searches
+BFS_BLOCK_ELEMENTS = 2**22
+
+
+def estimate_path_lengths(indptr, indices, n_samples=100, time_budget=None, directed=False, random_state=0):
+    """
+    Estimates the average shortest path length and bounds the diameter from breadth-first searches.
+
+    The searches start from n_samples nodes drawn without replacement and run in batches until the
+    sample or time_budget is exhausted (at least one batch runs). The average path length is taken over
+    the ordered pairs of distinct nodes joined by a path, as networkx.average_shortest_path_length on a
+    connected graph; it is exact when every node is a source. Its standard error is that of a ratio
+    estimator over the sampled sources, with the finite population correction.
+
+    The diameter is the longest shortest path of any component. The lower bound is the largest
+    eccentricity found, refined by a second search from the farthest node reached (double sweep). On
+    undirected graphs, the diameter of a component is at most twice the eccentricity of any of its
+    nodes, and at most its size minus one if none of its nodes was sampled. Both bounds are the diameter
+    when every node is a source.
+
+    Parameters:
+    - indptr, indices (np.ndarray): CSR adjacency, see tagra.kernels.adjacency_csr.
+    - n_samples (int): Maximum number of source nodes.
+    - time_budget (float, optional): Seconds after which no new batch of searches starts.
+    - directed (bool): Whether the adjacency holds each edge from its source only.
+    - random_state (int): Seed of the choice of the sources.
+
+    Returns:
+    - dict: 'avg_path_length', 'avg_path_length_stderr', 'diameter_lower', 'diameter_upper',
+      'path_samples' (sources searched) and 'path_seconds'. The path length is None without any pair of
+      connected nodes.
+    """
+    start = time.perf_counter()
+    n_nodes = len(indptr) - 1
+    if n_nodes == 0:
+        return {'avg_path_length': None, 'avg_path_length_stderr': None, 'diameter_lower': 0,
+                'diameter_upper': 0, 'path_samples': 0, 'path_seconds': 0.0}
+    adjacency = _csr_matrix(indptr, indices)
+    _, component = connected_components(adjacency, directed=directed, connection='weak')
+    component_sizes = np.bincount(component)
+    sources = np.random.default_rng(random_state).permutation(n_nodes)[:max(1, min(n_samples, n_nodes))]
+    batch_size = max(1, BFS_BLOCK_ELEMENTS // n_nodes)
+
+    sums, counts, eccentricities, searched = [], [], [], []
+    for batch_start in range(0, len(sources), batch_size):
+        if batch_start > 0 and time_budget is not None and time.perf_counter() - start > time_budget:
+            break
+        batch = sources[batch_start:batch_start + batch_size]
+        distances = shortest_path(adjacency, directed=directed, unweighted=True, indices=batch)
+        reached = np.isfinite(distances)
+        distances[~reached] = 0
+        sums.append(distances.sum(axis=1))
+        counts.append(reached.sum(axis=1) - 1)
+        eccentricities.append(distances.max(axis=1))
+        searched.append(batch)
+    sums, counts = np.concatenate(sums), np.concatenate(counts)
+    eccentricities, searched = np.concatenate(eccentricities), np.concatenate(searched)
+
+    # Double sweep: the farthest node from the most eccentric source is usually an end of a diameter
+    farthest = shortest_path(adjacency, directed=directed, unweighted=True, indices=[searched[eccentricities.argmax()]])[0]
+    farthest[~np.isfinite(farthest)] = -1
+    sweep = shortest_path(adjacency, directed=directed, unweighted=True, indices=[farthest.argmax()])[0]
+    diameter_lower = int(max(eccentricities.max(), sweep[np.isfinite(sweep)].max()))
+
+    upper = component_sizes - 1
+    if not directed:
+        sampled_minimum = np.full(len(component_sizes), np.inf)
+        np.minimum.at(sampled_minimum, component[searched], 2 * eccentricities)
+        upper = np.minimum(upper, sampled_minimum)
+    diameter_upper = int(max(upper.max(), diameter_lower))
+    n_searched = len(searched)
+    if n_searched >= n_nodes:
+        diameter_upper = diameter_lower
+
+    if counts.sum() == 0:
+        mean, stderr = None, None
+    else:
+        mean = float(sums.sum() / counts.sum())
+        if n_searched >= n_nodes:
+            stderr = 0.0
+        elif n_searched < 2:
+            stderr = float('inf')
+        else:
+            residuals = sums - mean * counts
+            variance = np.sum(residuals ** 2) / (n_searched * (n_searched - 1)) * (1 - n_searched / n_nodes)
+            stderr = float(np.sqrt(variance) / counts.mean()) if counts.mean() > 0 else float('inf')
+    return {'avg_path_length': mean, 'avg_path_length_stderr': stderr, 'diameter_lower': diameter_lower,
+            'diameter_upper': diameter_upper, 'path_samples': n_searched,
+            'path_seconds': time.perf_counter() - start}
+
+
+def estimate_betweenness(indptr, indices, n_samples=100, time_budget=None, directed=False, random_state=0):
+    """
+    Estimates the betweenness centrality of every node with Brandes' algorithm from sampled sources.
+
+    The dependencies of the nodes on the sources (Brandes, 2001) are accumulated over n_samples sources
+    drawn without replacement and scaled by n_nodes / sources, which is unbiased (Brandes and Pich, 2007)
+    and exact when every node is a source. The values are normalized as networkx.betweenness_centrality.
+    The shortest path counts and dependencies are computed one distance level at a time over the edges
+    of the shortest path DAG of each source.
+
+    Parameters:
+    - indptr, indices (np.ndarray): CSR adjacency, see tagra.kernels.adjacency_csr.
+    - n_samples (int): Maximum number of source nodes.
+    - time_budget (float, optional): Seconds after which no new source is processed.
+    - directed (bool): Whether the adjacency holds each edge from its source only.
+    - random_state (int): Seed of the choice of the sources.
+
+    Returns:
+    - (np.ndarray, np.ndarray, int): The betweenness of each node, its standard error (from the spread
+      of the per-source dependencies, with the finite population correction) and the number of sources.
+    """
+    start = time.perf_counter()
+    n_nodes = len(indptr) - 1
+    if n_nodes == 0:
+        return np.zeros(0), np.zeros(0), 0
+    adjacency = _csr_matrix(indptr, indices)
+    rows = np.repeat(np.arange(n_nodes), np.diff(indptr))
+    sources = np.random.default_rng(random_state).permutation(n_nodes)[:max(1, min(n_samples, n_nodes))]
+    batch_size = max(1, BFS_BLOCK_ELEMENTS // n_nodes)
+
+    totals = np.zeros(n_nodes)
+    squares = np.zeros(n_nodes)
+    n_searched = 0
+    for batch_start in range(0, len(sources), batch_size):
+        batch = sources[batch_start:batch_start + batch_size]
+        distances = shortest_path(adjacency, directed=directed, unweighted=True, indices=batch)
+        for source, source_distances in zip(batch, distances):
+            if n_searched > 0 and time_budget is not None and time.perf_counter() - start > time_budget:
+                break
+            dependencies = _source_dependencies(source, source_distances, rows, indices, n_nodes)
+            totals += dependencies
+            squares += dependencies ** 2
+            n_searched += 1
+        if n_searched < batch_start + len(batch):
+            break
+
+    # networkx divides by the ordered pairs of the other nodes; undirected pairs are counted from both ends
+    scale = 1 / ((n_nodes - 1) * (n_nodes - 2)) if n_nodes > 2 else 1.0
+    population_scale = n_nodes / n_searched
+    betweenness = totals * population_scale * scale
+    if n_searched >= n_nodes:
+        stderr = np.zeros(n_nodes)
+    elif n_searched < 2:
+        stderr = np.full(n_nodes, np.inf)
+    else:
+        variance = np.maximum(squares - totals ** 2 / n_searched, 0) / (n_searched - 1)
+        stderr = n_nodes * scale * np.sqrt(variance / n_searched * (1 - n_searched / n_nodes))
+    return betweenness, stderr, n_searched
+
+
+def pagerank(indptr, indices, alpha=0.85, max_iter=100, tol=1e-6, time_budget=None):
+    """
+    Computes PageRank by power iteration on the sparse adjacency.
+
+    Nodes without out-edges spread their rank uniformly, as in networkx.pagerank. The iterations stop
+    when the L1 change of the ranks falls below tol * n_nodes (the networkx criterion), after max_iter
+    iterations or when time_budget is exhausted. The change r of the last iteration bounds the L1 error
+    of the returned ranks by alpha * r / (1 - alpha), the power iteration contracting by alpha.
+
+    Parameters:
+    - indptr, indices (np.ndarray): CSR adjacency, see tagra.kernels.adjacency_csr.
+    - alpha (float): Damping factor.
+    - max_iter (int): Maximum number of iterations.
+    - tol (float): Convergence threshold per node.
+    - time_budget (float, optional): Seconds after which the iterations stop.
+
+    Returns:
+    - (np.ndarray, int, float): The rank of each node (summing to 1), the number of iterations and the
+      bound on the L1 error.
+    """
+    start = time.perf_counter()
+    n_nodes = len(indptr) - 1
+    if n_nodes == 0:
+        return np.zeros(0), 0, 0.0
+    out_degrees = np.diff(indptr)
+    dangling = out_degrees == 0
+    weights = np.repeat(np.divide(1.0, out_degrees, out=np.zeros(n_nodes), where=~dangling), out_degrees)
+    # Transposed so that the product pulls the rank of the in-neighbors
+    transition = sparse.csr_matrix((weights, indices, indptr), shape=(n_nodes, n_nodes)).T.tocsr()
+    ranks = np.full(n_nodes, 1.0 / n_nodes)
+    change, iteration = float('inf'), 0
+    for iteration in range(1, max_iter + 1):
+        updated = alpha * (transition @ ranks) + (alpha * ranks[dangling].sum() + 1 - alpha) / n_nodes
+        change = float(np.abs(updated - ranks).sum())
+        ranks = updated
+        if change < n_nodes * tol:
+            break
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            break
+    return ranks, iteration, alpha * change / (1 - alpha)
+
+
+def distance_metrics(graph, path_length_samples=None, betweenness_samples=None, pagerank_centrality=False,
+                     time_budget=None, random_state=0, verbose=True):
+    """
+    Computes the sampled distance and centrality estimates requested, for the metrics of analyze_graph.
+
+    Parameters:
+    - graph (networkx.Graph or tagra.context.AnalysisContext): The graph, or its context to reuse its adjacency.
+    - path_length_samples (int, optional): Sources of estimate_path_lengths; skipped if None.
+    - betweenness_samples (int, optional): Sources of estimate_betweenness; skipped if None.
+    - pagerank_centrality (bool): Whether to compute PageRank.
+    - time_budget (float, optional): Seconds allowed to each estimator.
+    - random_state (int): Seed of the sampled sources.
+    - verbose (bool): Whether to print progress messages.
+
+    Returns:
+    - (dict, dict): The scalar metrics, and the per-node columns ('betweenness', 'betweenness_stderr',
+      'pagerank') in the order of the nodes of the graph.
+    """
+    context = graph if isinstance(graph, AnalysisContext) else AnalysisContext(graph)
+    indptr, indices = context.adjacency()
+    directed = context.graph.is_directed()
+    metrics, columns = {}, {}
+    if path_length_samples is not None:
+        if verbose:
+            print(f"{datetime.datetime.now()}: Estimating path lengths from {path_length_samples} sources...")
+        metrics.update(estimate_path_lengths(indptr, indices, path_length_samples, time_budget=time_budget,
+                                             directed=directed, random_state=random_state))
+    if betweenness_samples is not None:
+        if verbose:
+            print(f"{datetime.datetime.now()}: Estimating betweenness centrality from {betweenness_samples} sources...")
+        start = time.perf_counter()
+        betweenness, stderr, n_searched = estimate_betweenness(indptr, indices, betweenness_samples,
+                                                               time_budget=time_budget, directed=directed,
+                                                               random_state=random_state)
+        columns['betweenness'] = betweenness
+        columns['betweenness_stderr'] = stderr
+        metrics['betweenness_samples'] = n_searched
+        metrics['betweenness_max'] = float(betweenness.max(initial=0))
+        metrics['betweenness_max_stderr'] = float(stderr.max(initial=0))
+        metrics['betweenness_seconds'] = time.perf_counter() - start
+    if pagerank_centrality:
+        if verbose:
+            print(f"{datetime.datetime.now()}: Computing PageRank...")
+        start = time.perf_counter()
+        ranks, iterations, error = pagerank(indptr, indices, time_budget=time_budget)
+        columns['pagerank'] = ranks
+        metrics['pagerank_iterations'] = iterations
+        metrics['pagerank_error'] = error
+        metrics['pagerank_seconds'] = time.perf_counter() - start
+    return metrics, columns
+
+
+def _csr_matrix(indptr, indices):
+    n_nodes = len(indptr) - 1
+    return sparse.csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr), shape=(n_nodes, n_nodes))
+
+
+def _source_dependencies(source, distances, rows, indices, n_nodes):
+    """Brandes dependencies of every node on source, from the distances of the nodes to the source."""
+    reached = np.isfinite(distances)
+    levels = np.where(reached, distances, -2).astype(np.int64)
+    # Edges of the shortest path DAG, grouped by the level of their tail
+    on_path = (levels[rows] >= 0) & (levels[indices] == levels[rows] + 1)
+    tails, heads = rows[on_path], indices[on_path]
+    order = np.argsort(levels[tails], kind='stable')
+    tails, heads = tails[order], heads[order]
+    bounds = np.searchsorted(levels[tails], np.arange(levels.max() + 1))
+    bounds = np.append(bounds, len(tails))
+
+    paths = np.zeros(n_nodes)
+    paths[source] = 1
+    for level in range(len(bounds) - 1):
+        span = slice(bounds[level], bounds[level + 1])
+        paths += np.bincount(heads[span], weights=paths[tails[span]], minlength=n_nodes)
+    dependencies = np.zeros(n_nodes)
+    for level in range(len(bounds) - 2, -1, -1):
+        span = slice(bounds[level], bounds[level + 1])
+        tail, head = tails[span], heads[span]
+        dependencies += np.bincount(tail, weights=paths[tail] / paths[head] * (1 + dependencies[head]),
+                                    minlength=n_nodes)
+    dependencies[source] = 0
+    return dependencies
@@ -1,13 +1,17 @@
 import datetime
 import os
-from typing import Optional, Union, List, Dict
+from typing import Optional, Union, List, Dict, Tuple
 import numpy as np
 import pandas as pd
 import pickle
 import networkx as nx
 from scipy.spatial import cKDTree
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial.distance import cdist, pdist, squareform
 from sklearn.metrics.pairwise import cosine_similarity
+from .kernels import GOWER_BLOCK_ELEMENTS
+from .loader import load_dataframe, source_name
+from .query import NeighborIndex
+from .store import FeatureStore, is_feature_store, open_feature_store
 
 
 def create_graph(
@@ -15,12 +19,22 @@ def create_graph(
     preprocessed_dataframe: Optional[Union[str, pd.DataFrame]] = None,
     inferred_columns_filename: Optional[str] = None,
     numeric_columns: Optional[List[str]] = None,
+    categorical_columns: Optional[List[str]] = None,
     output_directory: Optional[str] = None,
     graph_filename: Optional[str] = None,
     method: str = "knn",
     k: int = 5,
     distance_threshold: Optional[float] = None,
     similarity_threshold: Optional[float] = None,
+    target_degree: Optional[float] = None,
+    max_degree: Optional[int] = None,
+    max_edges: Optional[int] = None,
+    knn: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    node_attributes: Optional[List[str]] = None,
+    index_filename: Optional[str] = None,
+    index_method: str = "kdtree",
+    index_labels: Optional[List[str]] = None,
+    dtype: Optional[str] = None,
     verbose: bool = True,
     overwrite: bool = False,
 ) -> nx.Graph:
@@ -28,16 +42,43 @@ def create_graph(
     Creates a graph from a dataframe by connecting points based on a specified method.
 
     Args:
-        input_dataframe: Path to the input dataframe or a pandas DataFrame.
-        preprocessed_dataframe: Path to the preprocessed dataframe or a pandas DataFrame.
+        input_dataframe: Path to the input dataframe or a pandas DataFrame, whose columns become node
+            attributes. A DataFrame is used as it is, without copying it.
+        preprocessed_dataframe: Path to the preprocessed dataframe or a pandas DataFrame, or a feature
+            store (a '.features' path or a tagra.store.FeatureStore), whose feature matrix is used
+            in place, memory mapped.
         inferred_columns_filename: Path to a pickle file containing inferred numeric columns.
-        numeric_columns: List of numeric columns to use for graph construction.
+        numeric_columns: List of numeric columns to use for graph construction. With the 'gower' method
+            only the listed numeric and categorical columns are used, since a preprocessed dataframe
+            keeps numeric targets and ignored columns next to the features.
+        categorical_columns: Categorical columns of the 'gower' method, label-encoded codes or raw values
+            of the preprocessed dataframe. Other methods ignore them.
         output_directory: Directory to save the output graph.
         graph_filename: Name of the output graph file.
-        method: Method for connecting nodes ('knn', 'distance', or 'similarity').
-        k: Number of nearest neighbors for the 'knn' method.
-        distance_threshold: Distance threshold for the 'distance' method.
+        method: Method for connecting nodes ('knn', 'distance', 'similarity' or 'gower'). 'gower' connects
+            each node to its k nearest neighbors under the Gower distance of mixed numeric and categorical
+            columns, see compute_gower_knn, so categorical columns need no one-hot encoding.
+        k: Number of nearest neighbors for the 'knn' and 'gower' methods.
+        distance_threshold: Distance threshold for the 'distance' method. If None, it is selected
+            from target_degree with select_distance_threshold.
         similarity_threshold: Similarity threshold for the 'similarity' method.
+        target_degree: Average degree the 'distance' method aims at when distance_threshold is None.
+        max_degree: Maximum degree of a node with the 'distance' method. Each node keeps its
+            max_degree nearest neighbors within the threshold, and an edge is kept if both its
+            ends keep it (mutual nearest neighbors), so dense regions cannot create hub nodes.
+        max_edges: Maximum number of edges with the 'distance' method. The edges are counted
+            before they are created, and a ValueError is raised if there are more.
+        knn: Precomputed (distances, indices) as returned by compute_knn, with at least k + 1 columns.
+            If provided, the 'knn' method takes the first k neighbors of each row instead of searching again.
+        node_attributes: Columns of the input dataframe stored as node attributes (e.g. only the target
+            columns). If None, all columns are stored. Only these columns are read from file inputs.
+        index_filename: Name of a pickle file, in the output directory, where a NeighborIndex of the
+            feature rows is saved for nearest-neighbor queries of new records (see tagra.query).
+            If None, no index is saved.
+        index_method: Search method of the saved index, 'kdtree' or 'brute'.
+        index_labels: Node attributes whose labels are stored in the saved index.
+        dtype: Type of the feature matrix, e.g. 'float32' to halve the memory of the matrix and of
+            the 'similarity' matrix. If None, the type of the preprocessed columns is kept.
         verbose: Whether to print progress messages.
         overwrite: Whether to overwrite existing files.
 
@@ -56,55 +97,109 @@ def create_graph(
     os.makedirs(output_directory, exist_ok=True)
 
     if graph_filename is None:
+        source_path = source_name(input_dataframe)
         base = (
-            os.path.splitext(os.path.basename(input_dataframe))[0]
-            if isinstance(input_dataframe, str)
+            os.path.splitext(os.path.basename(source_path))[0]
+            if source_path is not None
             else "graph"
         )
         timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M")
         graph_filename = f"{base}.graphml" if overwrite else f"{base}_{timestamp}.graphml"
     elif not graph_filename.endswith(".graphml"):
         raise ValueError("graph_filename must end with '.graphml'.")
+    if index_filename is not None and not index_filename.endswith(".pickle"):
+        raise ValueError("index_filename must end with '.pickle'.")
+    if index_filename is not None and method == "gower":
+        raise ValueError("index_filename is not supported with the 'gower' method: the index searches Euclidean neighbors.")
 
     output_path = os.path.join(output_directory, graph_filename)
     if verbose:
         print(f"{datetime.datetime.now()}: Output path: {output_path}.")
 
-    # Load dataframes
-    df = _load_dataframe(input_dataframe)
-    df_preprocessed = _load_dataframe(preprocessed_dataframe) if preprocessed_dataframe is not None else df.copy()
+    if isinstance(node_attributes, str):
+        node_attributes = [node_attributes]
+    if isinstance(index_labels, str):
+        index_labels = [index_labels]
+
+    # Load dataframes. DataFrames are used as they are, without copies; only the node
+    # attribute columns of the input dataframe are read (or selected) and aligned. A feature
+    # store is opened with its feature matrix memory mapped, see tagra.store.
+    if is_feature_store(preprocessed_dataframe) or isinstance(preprocessed_dataframe, FeatureStore):
+        df_preprocessed = open_feature_store(preprocessed_dataframe)
+        if input_dataframe is not None:
+            df = _load_dataframe(input_dataframe, columns=node_attributes)
+        else:
+            df = df_preprocessed.to_dataframe(columns=node_attributes)
+    elif preprocessed_dataframe is not None:
+        df_preprocessed = _load_dataframe(preprocessed_dataframe)
+        df = _load_dataframe(input_dataframe, columns=node_attributes) if input_dataframe is not None else None
+    else:
+        df_preprocessed = _load_dataframe(input_dataframe)
+        df = None
+    if df is None:
+        df = _load_dataframe(df_preprocessed, columns=node_attributes)
 
     # Ensure dataframes have the same number of rows
     if df.shape[0] != df_preprocessed.shape[0]:
-        df = df.dropna().copy()
+        df = df.dropna()
         if verbose:
             print(f"{datetime.datetime.now()}: Dropped rows with NaN values from the original dataframe.")
+    preprocessed_index = df_preprocessed.index
+    if not df.index.equals(preprocessed_index):
+        df = df.loc[preprocessed_index, :]
 
     # Create graph and add nodes
     G = nx.Graph()
-    df = df.loc[df_preprocessed.index, :].reset_index(drop=True)
-    df_preprocessed = df_preprocessed.reset_index(drop=True)
-    for i, row in df.iterrows():
-        G.add_node(i, **row.to_dict())
+    G.add_nodes_from(enumerate(df.to_dict("records")))
+    if verbose:
+        print(f"{datetime.datetime.now()}: Added {G.number_of_nodes()} nodes with attributes: {list(df.columns)}")
 
     # Prepare numeric data
-    if numeric_columns is None:
-        numeric_columns = df_preprocessed.select_dtypes(include=["number"]).columns.tolist()
-    values = df_preprocessed[numeric_columns].values
-
-    if values.shape[1] == 0:
-        raise ValueError("No numeric columns found in the preprocessed dataframe.")
+    if method == "gower":
+        categorical_columns = list(categorical_columns or [])
+        numeric_columns = list(numeric_columns or [])
+        if not numeric_columns and not categorical_columns:
+            raise ValueError("The 'gower' method needs numeric_columns or categorical_columns.")
+        if numeric_columns:
+            values, numeric_columns = get_feature_matrix(df_preprocessed, numeric_columns, dtype=dtype)
+        else:
+            values = np.empty((df_preprocessed.shape[0], 0))
+        codes = get_categorical_codes(df_preprocessed, categorical_columns)
+        if verbose:
+            print(f"{datetime.datetime.now()}: Using categorical columns: {categorical_columns}")
+    else:
+        values, numeric_columns = get_feature_matrix(df_preprocessed, numeric_columns, dtype=dtype)
 
     if verbose:
         print(f"{datetime.datetime.now()}: Using numeric columns: {numeric_columns}")
 
     # Build edges based on the specified method
     if method == "knn":
-        _add_knn_edges(G, values, k)
+        if knn is None:
+            knn = compute_knn(values, k)
+        elif knn[1].shape[0] != values.shape[0] or knn[1].shape[1] < k + 1:
+            raise ValueError(f"Precomputed knn must have {values.shape[0]} rows and at least {k + 1} columns.")
+        elif verbose:
+            print(f"{datetime.datetime.now()}: Using precomputed nearest neighbors.")
+        _add_knn_edges(G, knn[1], k)
     elif method == "distance":
-        _add_distance_edges(G, values, distance_threshold)
+        if distance_threshold is None:
+            if target_degree is None:
+                raise ValueError("The 'distance' method needs distance_threshold or target_degree.")
+            distance_threshold = select_distance_threshold(values, target_degree)
+            if verbose:
+                print(f"{datetime.datetime.now()}: Selected distance threshold {distance_threshold:.4g} "
+                      f"for an average degree of {target_degree}.")
+        if verbose:
+            estimated_edges = estimate_edge_counts(values, [distance_threshold])[0]
+            print(f"{datetime.datetime.now()}: Estimated {estimated_edges:.0f} edges "
+                  f"(average degree {2 * estimated_edges / len(values):.2f}) for threshold {distance_threshold:.4g}.")
+        _add_distance_edges(G, values, distance_threshold, max_degree=max_degree, max_edges=max_edges)
     elif method == "similarity":
         _add_similarity_edges(G, values, similarity_threshold)
+    elif method == "gower":
+        _, indices = compute_gower_knn(values, codes, k)
+        _add_knn_edges(G, indices, k)
     else:
         raise ValueError(f"Unsupported method: {method}")
 
@@ -114,33 +209,288 @@ def create_graph(
     if verbose:
         print(f"{datetime.datetime.now()}: Saved graph to {output_path}.")
 
+    # Save the neighbor index next to the graph
+    if index_filename is not None:
+        missing = [col for col in index_labels or [] if col not in df.columns]
+        if missing:
+            raise ValueError(f"Index label columns {missing} are not node attributes.")
+        labels = {col: df[col].values for col in index_labels or []}
+        NeighborIndex(values, numeric_columns, method=index_method, labels=labels).save(
+            os.path.join(output_directory, index_filename), verbose=verbose)
+
     return G
 
 
-def _load_dataframe(data: Union[str, pd.DataFrame]) -> pd.DataFrame:
-    """Load a dataframe from a file or return a copy if already a DataFrame."""
-    if isinstance(data, str):
-        return pd.read_pickle(data) if data.endswith(".pickle") else pd.read_csv(data)
-    elif isinstance(data, pd.DataFrame):
-        return data.copy()
+def _load_dataframe(data: Union[str, pd.DataFrame], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Load a dataframe from a file, or select the columns of a DataFrame without copying it."""
+    if isinstance(data, (str, pd.DataFrame)):
+        return load_dataframe(data, columns=columns)
     raise ValueError("Input must be a file path or a pandas DataFrame.")
 
 
-def _add_knn_edges(G: nx.Graph, values: np.ndarray, k: int) -> None:
-    """Add edges based on k-nearest neighbors."""
+def get_feature_matrix(
+    df_preprocessed: pd.DataFrame,
+    numeric_columns: Optional[List[str]] = None,
+    dtype: Optional[str] = None,
+) -> Tuple[np.ndarray, List[str]]:
+    """
+    Returns the matrix used for the neighbor search and the columns it was built from.
+
+    Args:
+        df_preprocessed: The preprocessed pandas DataFrame, or a tagra.store.FeatureStore whose
+            memory-mapped matrix is returned without a copy when all its columns are used.
+        numeric_columns: Columns to use. If None, all numeric columns (the feature columns of a store).
+        dtype: If given, the matrix is converted to this type, in C order, with a single copy.
+
+    Raises:
+        ValueError: If no numeric column is available, or numeric_columns is empty.
+    """
+    if numeric_columns is not None and len(numeric_columns) == 0:
+        raise ValueError("numeric_columns is empty; pass None to use all numeric columns.")
+    if isinstance(df_preprocessed, FeatureStore):
+        if numeric_columns is None:
+            numeric_columns = df_preprocessed.feature_columns
+        values = df_preprocessed.feature_matrix(numeric_columns, dtype=dtype)
+        if values.shape[1] == 0:
+            raise ValueError("No numeric columns found in the feature store.")
+        return values, list(numeric_columns)
+    if numeric_columns is None:
+        numeric_columns = df_preprocessed.select_dtypes(include=["number"]).columns.tolist()
+    if dtype is None:
+        values = df_preprocessed[numeric_columns].values
+    else:
+        values = np.ascontiguousarray(df_preprocessed[numeric_columns].to_numpy(dtype=dtype))
+
+    if values.shape[1] == 0:
+        raise ValueError("No numeric columns found in the preprocessed dataframe.")
+    return values, numeric_columns
+
+
+def get_categorical_codes(
+    df_preprocessed: Union[pd.DataFrame, FeatureStore],
+    categorical_columns: List[str],
+) -> np.ndarray:
+    """
+    Returns the integer codes of categorical columns as one matrix.
+
+    Integer columns (e.g. label-encoded ones) are used as they are; other columns are factorized,
+    with the code -1 for missing values.
+
+    Args:
+        df_preprocessed: The preprocessed pandas DataFrame or a tagra.store.FeatureStore.
+        categorical_columns: The categorical columns.
+
+    Returns:
+        An (n_rows, n_categorical_columns) int64 matrix.
+
+    Raises:
+        ValueError: If a column is missing.
+    """
+    available = df_preprocessed.columns
+    missing = [col for col in categorical_columns if col not in set(available)]
+    if missing:
+        raise ValueError(f"Categorical columns {missing} are not in the preprocessed dataframe.")
+    if isinstance(df_preprocessed, FeatureStore):
+        df_preprocessed = df_preprocessed.to_dataframe(columns=categorical_columns)
+    codes = np.empty((df_preprocessed.shape[0], len(categorical_columns)), dtype=np.int64)
+    for j, col in enumerate(categorical_columns):
+        column = df_preprocessed[col]
+        codes[:, j] = column.to_numpy() if pd.api.types.is_integer_dtype(column) else pd.factorize(column)[0]
+    return codes
+
+
+def compute_gower_knn(
+    numeric_values: np.ndarray,
+    categorical_codes: np.ndarray,
+    k: int,
+    block_size: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the k nearest neighbors of every row under the Gower distance of mixed columns.
+
+    The Gower distance of two rows is the mean, over the columns, of |x - y| / range for numeric
+    columns and of 0 (same code) or 1 (different codes) for categorical columns, so every column
+    weighs the same whatever its scale or number of categories. The distances of a block of rows to
+    all the rows are computed with two vectorized cdist calls (city block and Hamming), and the k
+    nearest of each row are selected with argpartition, so only a block of distances is held at once.
+
+    Args:
+        numeric_values: The (n_rows, n_numeric) numeric matrix; it may have no columns.
+        categorical_codes: The (n_rows, n_categorical) integer codes, see get_categorical_codes; it may
+            have no columns.
+        k: Number of neighbors.
+        block_size: Rows per block. Defaults to GOWER_BLOCK_ELEMENTS / n_rows.
+
+    Returns:
+        A tuple (distances, indices) of shape (n_rows, k + 1), as compute_knn: the first column is the
+        row itself, and missing neighbors (k >= n_rows) have index n_rows and an infinite distance.
+
+    Raises:
+        ValueError: If there are no columns or the matrices have different numbers of rows.
+    """
+    numeric_values = np.asarray(numeric_values, dtype=float)
+    categorical_codes = np.asarray(categorical_codes, dtype=float)
+    n, n_numeric = numeric_values.shape
+    n_categorical = categorical_codes.shape[1]
+    if categorical_codes.shape[0] != n:
+        raise ValueError("numeric_values and categorical_codes must have the same number of rows.")
+    if n_numeric + n_categorical == 0:
+        raise ValueError("The Gower distance needs at least one numeric or categorical column.")
+    # Numeric columns scaled by their ranges, so the city block distance sums |x - y| / range;
+    # constant columns never differ and keep their values
+    ranges = np.ptp(numeric_values, axis=0) if n > 0 else np.ones(n_numeric)
+    numeric_values = numeric_values / np.where(ranges > 0, ranges, 1)
+    block_size = block_size or max(1, GOWER_BLOCK_ELEMENTS // max(n, 1))
+    n_neighbors = min(k + 1, n)
+
+    distances = np.full((n, k + 1), np.inf)
+    indices = np.full((n, k + 1), n, dtype=np.int64)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        if n_numeric:
+            block = cdist(numeric_values[start:stop], numeric_values, "cityblock")
+        else:
+            block = np.zeros((stop - start, n))
+        if n_categorical:
+            block += n_categorical * cdist(categorical_codes[start:stop], categorical_codes, "hamming")
+        block /= n_numeric + n_categorical
+        # Each row is its own first neighbor, before the duplicates at distance 0
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = -1
+        nearest = np.argpartition(block, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        order = np.argsort(np.take_along_axis(block, nearest, axis=1), axis=1, kind="stable")
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        indices[start:stop, :n_neighbors] = nearest
+        distances[start:stop, :n_neighbors] = np.maximum(np.take_along_axis(block, nearest, axis=1), 0)
+    return distances, indices
+
+
+def compute_knn(values: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the k nearest neighbors of every row with a KD-tree.
+
+    Returns:
+        A tuple (distances, indices) of shape (n_rows, k + 1). The first column is the row itself,
+        so the result can be shared with methods that count the point among its neighbors (e.g. UMAP).
+    """
     tree = cKDTree(values)
-    for i in G.nodes():
-        distances, indices = tree.query(values[i], k=k + 1)
-        for j in indices[1:]:  # Skip the first index (self)
-            G.add_edge(i, j)
+    distances, indices = tree.query(values, k=k + 1)
+    return distances, indices
 
 
-def _add_distance_edges(G: nx.Graph, values: np.ndarray, distance_threshold: float) -> None:
-    """Add edges based on a distance threshold."""
+def _add_knn_edges(G: nx.Graph, indices: np.ndarray, k: int) -> None:
+    """Add edges based on k-nearest neighbors."""
+    neighbors = indices[:, 1:k + 1]  # Skip the first index (self)
+    sources = np.repeat(np.arange(neighbors.shape[0]), neighbors.shape[1])
+    targets = neighbors.ravel()
+    valid = targets < neighbors.shape[0]  # cKDTree marks missing neighbors with n when k >= n
+    G.add_edges_from(zip(sources[valid].tolist(), targets[valid].tolist()))
+
+
+def sample_pair_distances(values: np.ndarray, sample_size: int = 2000, random_state: int = 0) -> np.ndarray:
+    """
+    Returns the sorted pairwise distances of a random sample of rows.
+
+    The distribution of these distances estimates the one of all the pairs of rows, at a cost of
+    sample_size ** 2 / 2 distances. If there are at most sample_size rows, all the pairs are used.
+    """
+    if len(values) > sample_size:
+        rng = np.random.default_rng(random_state)
+        values = values[rng.choice(len(values), sample_size, replace=False)]
+    return np.sort(pdist(values))
+
+
+def estimate_edge_counts(
+    values: np.ndarray,
+    thresholds: List[float],
+    sample_size: int = 2000,
+    random_state: int = 0,
+) -> np.ndarray:
+    """
+    Estimates the number of edges of the 'distance' method for candidate thresholds.
+
+    Args:
+        values: The feature matrix.
+        thresholds: Candidate distance thresholds.
+        sample_size: Number of rows whose pairwise distances are sampled.
+        random_state: Seed of the sample.
+
+    Returns:
+        The estimated number of edges for each threshold: the fraction of the sampled pairs within
+        the threshold times the number of pairs of rows. It is exact if there are at most sample_size rows.
+    """
+    distances = sample_pair_distances(values, sample_size, random_state)
+    n_pairs = len(values) * (len(values) - 1) / 2
+    if len(distances) == 0:
+        return np.zeros(len(thresholds))
+    fractions = np.searchsorted(distances, np.asarray(thresholds, dtype=float), side="right") / len(distances)
+    return fractions * n_pairs
+
+
+def select_distance_threshold(
+    values: np.ndarray,
+    target_degree: float,
+    sample_size: int = 2000,
+    random_state: int = 0,
+) -> float:
+    """
+    Selects the distance threshold that gives an expected average degree.
+
+    The average degree of the 'distance' graph is (n - 1) times the fraction of pairs within the
+    threshold, so the threshold is the target_degree / (n - 1) quantile of the sampled pair distances.
+
+    Raises:
+        ValueError: If target_degree is not between 0 and n - 1.
+    """
+    if not 0 < target_degree <= len(values) - 1:
+        raise ValueError(f"target_degree must be between 0 and {len(values) - 1}.")
+    distances = sample_pair_distances(values, sample_size, random_state)
+    return float(np.quantile(distances, target_degree / (len(values) - 1)))
+
+
+def _add_distance_edges(
+    G: nx.Graph,
+    values: np.ndarray,
+    distance_threshold: float,
+    max_degree: Optional[int] = None,
+    max_edges: Optional[int] = None,
+    block_size: int = 4096,
+) -> None:
+    """Add edges based on a distance threshold, within the degree and edge budgets."""
+    if max_edges is not None and max_edges < 1:
+        raise ValueError("max_edges must be a positive integer.")
     tree = cKDTree(values)
-    pairs = tree.query_pairs(distance_threshold)
-    for i, j in pairs:
-        G.add_edge(i, j)
+    n = len(values)
+    if max_degree is not None:
+        # Bounded search: each node gets at most max_degree candidates, whatever the density around it
+        if max_degree < 1:
+            raise ValueError("max_degree must be a positive integer.")
+        _, indices = tree.query(values, k=min(max_degree + 1, n), distance_upper_bound=distance_threshold)
+        indices = indices.reshape(n, -1)
+        sources = np.broadcast_to(np.arange(n)[:, None], indices.shape)
+        candidates = (indices < n) & (indices != sources)
+        candidates &= np.cumsum(candidates, axis=1) <= max_degree
+        sources, targets = sources[candidates], indices[candidates]
+        # Keep the edges chosen by both ends
+        keys = sources.astype(np.int64) * n + targets
+        mutual = np.isin(keys, targets.astype(np.int64) * n + sources) & (sources < targets)
+        pairs = np.column_stack([sources[mutual], targets[mutual]])
+    else:
+        if max_edges is not None:
+            # Count the edges block by block before creating them, and stop as soon as the budget is exceeded
+            degree_sum = 0
+            for start in range(0, n, block_size):
+                degree_sum += int(tree.query_ball_point(values[start:start + block_size], distance_threshold,
+                                                        return_length=True).sum()) - len(values[start:start + block_size])
+                if degree_sum / 2 > max_edges:
+                    raise ValueError(
+                        f"The distance threshold {distance_threshold:.4g} gives more than {max_edges} edges "
+                        f"(estimated {estimate_edge_counts(values, [distance_threshold])[0]:.0f}). Use a threshold "
+                        f"below {select_distance_threshold(values, min(2 * max_edges / n, n - 1)):.4g} or set max_degree.")
+        pairs = tree.query_pairs(distance_threshold, output_type="ndarray")
+    if max_edges is not None and len(pairs) > max_edges:
+        raise ValueError(f"The distance graph has {len(pairs)} edges, more than max_edges={max_edges}.")
+    G.add_edges_from(pairs.tolist())
 
 
 def _add_similarity_edges(G: nx.Graph, values: np.ndarray, similarity_threshold: float) -> None:
@@ -0,0 +1,283 @@
+import contextlib
+import threading
+
+import numpy as np
+from scipy import sparse
+
+try:
+    import numba
+    from numba import prange
+except ImportError:
+    numba = None
+    prange = range
+
+
+BACKENDS = ['numba', 'numpy']
+NUMBA_AVAILABLE = numba is not None
+# Distances held at once by each block of rows of the 'gower' method (64 MB of float64 per block matrix),
+# shared by tagra.graph.compute_gower_knn and its memory estimate in tagra.memory
+GOWER_BLOCK_ELEMENTS = 2 ** 23
+# numba's 'workqueue' threading layer, used when neither TBB nor OpenMP is installed, aborts when parallel
+# code is launched from several threads at once, as the pipeline stages do; on that layer the kernels run
+# one at a time, see kernel_lock
+_KERNEL_LOCK = threading.Lock()
+_threading_layer = []
+
+
+def start_threading_layer():
+    """
+    Starts numba's threading layer from the calling thread, which should be the main thread.
+
+    A TBB pool first started from a worker thread blocks the interpreter exit, so tagra.pipeline.Pipeline
+    and tagra.server.TagraService call this before starting their threads. The layer is the one chosen by
+    numba's configuration (e.g. the NUMBA_THREADING_LAYER environment variable), which is left as it is.
+
+    Returns:
+    - str: The threading layer ('tbb', 'omp' or 'workqueue'), None without numba.
+    """
+    if not NUMBA_AVAILABLE:
+        return None
+    if not _threading_layer:
+        with _KERNEL_LOCK:
+            if not _threading_layer:
+                _start_numba(1)
+                _threading_layer.append(numba.threading_layer())
+    return _threading_layer[0]
+
+
+def kernel_lock():
+    """
+    Context manager to hold while running numba parallel code, from tagra or from another library such as
+    UMAP, in a thread that may run concurrently with others. It serializes that code on the 'workqueue'
+    layer, which is not threadsafe, and does nothing on the TBB and OpenMP layers.
+    """
+    if start_threading_layer() == 'workqueue':
+        return _KERNEL_LOCK
+    return contextlib.nullcontext()
+
+
+def resolve_backend(backend=None):
+    """
+    Chooses the backend of the kernels.
+
+    Parameters:
+    - backend (str, optional): 'numba', 'numpy' or None for numba when it is installed.
+
+    Returns:
+    - str: 'numba' or 'numpy'.
+    """
+    if backend is None:
+        return 'numba' if NUMBA_AVAILABLE else 'numpy'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported kernel backend: {backend}. Choose from {BACKENDS}")
+    if backend == 'numba' and not NUMBA_AVAILABLE:
+        raise ValueError("The 'numba' kernel backend needs numba: pip install numba")
+    return backend
+
+
+def adjacency_csr(sources, targets, n_nodes, directed=False, self_loops=True):
+    """
+    Builds the CSR adjacency arrays of a graph from its edge arrays.
+
+    Parameters:
+    - sources, targets (np.ndarray): Edge endpoints as node positions, see tagra.utils.graph_edge_arrays.
+    - n_nodes (int): Number of nodes.
+    - directed (bool): Whether to keep each edge from its source only; otherwise both directions are stored.
+    - self_loops (bool): Whether to keep self-loops (stored once).
+
+    Returns:
+    - (np.ndarray, np.ndarray): indptr and indices, with the neighbors of each node sorted.
+    """
+    sources, targets = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)
+    if not self_loops:
+        keep = sources != targets
+        sources, targets = sources[keep], targets[keep]
+    if not directed:
+        not_loop = sources != targets
+        sources, targets = np.concatenate([sources, targets[not_loop]]), np.concatenate([targets, sources[not_loop]])
+    order = np.lexsort((targets, sources))
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n_nodes), out=indptr[1:])
+    return indptr, targets[order]
+
+
+def neighbor_label_counts(indptr, indices, codes, n_labels, backend=None):
+    """
+    Counts the labels in the neighborhood of every node.
+
+    Parameters:
+    - indptr, indices (np.ndarray): CSR adjacency, see adjacency_csr.
+    - codes (np.ndarray): Integer label code of each node.
+    - n_labels (int): Number of distinct codes.
+    - backend (str, optional): See resolve_backend.
+
+    Returns:
+    - np.ndarray: An (n_nodes, n_labels) integer matrix; entry (u, c) is the number of neighbors of u with code c.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    if resolve_backend(backend) == 'numba':
+        with kernel_lock():
+            return _neighbor_label_counts_numba(indptr, indices, codes, n_labels)
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    counts = np.bincount(rows * n_labels + codes[indices], minlength=(len(indptr) - 1) * n_labels)
+    return counts.reshape(-1, n_labels)
+
+
+def triangle_counts(indptr, indices, backend=None):
+    """
+    Counts the triangles through every node of an undirected graph.
+
+    Parameters:
+    - indptr, indices (np.ndarray): Symmetric CSR adjacency without self-loops and with sorted neighbors,
+      see adjacency_csr.
+    - backend (str, optional): See resolve_backend.
+
+    Returns:
+    - np.ndarray: The number of triangles of each node.
+    """
+    if resolve_backend(backend) == 'numba':
+        with kernel_lock():
+            return _triangle_counts_numba(indptr, indices)
+    n_nodes = len(indptr) - 1
+    adjacency = sparse.csr_matrix((np.ones(len(indices), dtype=np.int64), indices, indptr), shape=(n_nodes, n_nodes))
+    return np.asarray((adjacency @ adjacency).multiply(adjacency).sum(axis=1)).ravel() // 2
+
+
+def clustering_coefficients(indptr, indices, backend=None):
+    """
+    Local clustering coefficient of every node, as networkx.clustering for undirected graphs.
+
+    Parameters:
+    - indptr, indices (np.ndarray): Symmetric CSR adjacency without self-loops, see adjacency_csr.
+    - backend (str, optional): See resolve_backend.
+
+    Returns:
+    - np.ndarray: 2 T / (d (d - 1)) for each node with T triangles and degree d, 0 if d < 2.
+    """
+    triangles = triangle_counts(indptr, indices, backend)
+    degrees = np.diff(indptr)
+    pairs = degrees * (degrees - 1)
+    return np.divide(2 * triangles, pairs, out=np.zeros(len(degrees)), where=pairs > 0)
+
+
+def mixing_matrices(codes, sources, targets, n_labels, backend=None):
+    """
+    Counts the label mixing matrix of each row of codes, as tagra.utils.mixing_matrix.
+
+    Used by the permutation test, where each row holds the labels of one shuffle.
+
+    Parameters:
+    - codes (np.ndarray): An (n_rows, n_nodes) matrix of integer codes.
+    - sources, targets (np.ndarray): Edge endpoints as node positions.
+    - n_labels (int): Number of distinct codes (the largest of the rows).
+    - backend (str, optional): See resolve_backend.
+
+    Returns:
+    - np.ndarray: An (n_rows, n_labels, n_labels) integer array.
+    """
+    codes = np.ascontiguousarray(codes, dtype=np.int64)
+    sources, targets = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)
+    if resolve_backend(backend) == 'numba':
+        with kernel_lock():
+            return _mixing_matrices_numba(codes, sources, targets, n_labels)
+    n_rows = codes.shape[0]
+    offsets = (np.arange(n_rows) * n_labels * n_labels)[:, None]
+    not_loop = sources != targets
+    code_sources, code_targets = codes[:, sources], codes[:, targets]
+    total = n_rows * n_labels * n_labels
+    counts = np.bincount((offsets + code_sources * n_labels + code_targets).ravel(), minlength=total)
+    counts += np.bincount((offsets + code_targets[:, not_loop] * n_labels + code_sources[:, not_loop]).ravel(),
+                          minlength=total)
+    return counts.reshape(n_rows, n_labels, n_labels)
+
+
+def neighbor_mean(indptr, indices, values, backend=None):
+    """
+    Averages the rows of values over the neighbors of every node, one step of label propagation.
+
+    Parameters:
+    - indptr, indices (np.ndarray): CSR adjacency, see adjacency_csr.
+    - values (np.ndarray): An (n_nodes, n_columns) matrix, e.g. label distributions.
+    - backend (str, optional): See resolve_backend.
+
+    Returns:
+    - np.ndarray: An (n_nodes, n_columns) float matrix; the rows of nodes without neighbors are 0.
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    if resolve_backend(backend) == 'numba':
+        with kernel_lock():
+            return _neighbor_mean_numba(indptr, indices, values)
+    n_nodes = len(indptr) - 1
+    degrees = np.diff(indptr)
+    weights = np.repeat(np.divide(1.0, degrees, out=np.zeros(n_nodes), where=degrees > 0), degrees)
+    adjacency = sparse.csr_matrix((weights, indices, indptr), shape=(n_nodes, n_nodes))
+    return adjacency @ values
+
+
+if NUMBA_AVAILABLE:
+
+    @numba.njit(parallel=True, cache=True)
+    def _start_numba(n):
+        total = 0
+        for i in prange(n):
+            total += i
+        return total
+
+    @numba.njit(parallel=True, cache=True)
+    def _neighbor_label_counts_numba(indptr, indices, codes, n_labels):
+        n_nodes = len(indptr) - 1
+        counts = np.zeros((n_nodes, n_labels), dtype=np.int64)
+        for u in prange(n_nodes):
+            for i in range(indptr[u], indptr[u + 1]):
+                counts[u, codes[indices[i]]] += 1
+        return counts
+
+    @numba.njit(parallel=True, cache=True)
+    def _triangle_counts_numba(indptr, indices):
+        n_nodes = len(indptr) - 1
+        triangles = np.zeros(n_nodes, dtype=np.int64)
+        for u in prange(n_nodes):
+            count = 0
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                # Common neighbors of u and v, by merging their sorted neighbor lists
+                a, a_end = indptr[u], indptr[u + 1]
+                b, b_end = indptr[v], indptr[v + 1]
+                while a < a_end and b < b_end:
+                    if indices[a] < indices[b]:
+                        a += 1
+                    elif indices[a] > indices[b]:
+                        b += 1
+                    else:
+                        count += 1
+                        a += 1
+                        b += 1
+            triangles[u] = count // 2
+        return triangles
+
+    @numba.njit(parallel=True, cache=True)
+    def _mixing_matrices_numba(codes, sources, targets, n_labels):
+        n_rows = codes.shape[0]
+        counts = np.zeros((n_rows, n_labels, n_labels), dtype=np.int64)
+        for r in prange(n_rows):
+            for e in range(len(sources)):
+                s, t = codes[r, sources[e]], codes[r, targets[e]]
+                counts[r, s, t] += 1
+                if sources[e] != targets[e]:
+                    counts[r, t, s] += 1
+        return counts
+
+    @numba.njit(parallel=True, cache=True)
+    def _neighbor_mean_numba(indptr, indices, values):
+        n_nodes, n_columns = values.shape
+        result = np.zeros((n_nodes, n_columns))
+        for u in prange(n_nodes):
+            degree = indptr[u + 1] - indptr[u]
+            if degree == 0:
+                continue
+            for i in range(indptr[u], indptr[u + 1]):
+                for c in range(n_columns):
+                    result[u, c] += values[indices[i], c]
+            for c in range(n_columns):
+                result[u, c] /= degree
+        return result
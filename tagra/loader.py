@@ -0,0 +1,188 @@
+import datetime
+from typing import List, Optional, Union
+import numpy as np
+import pandas as pd
+
+from .store import is_feature_store, open_feature_store
+
+
+SUPPORTED_FORMATS = ", ".join(["CSV", "Excel (.xlsx)", "Pickle", "JSON", "Parquet", "Feather", "HDF5 (.hdf, .h5)",
+                               "TaGra feature store (.features)"])
+# Cells read as missing values in CSV files, the default na_values of pandas.read_csv
+CSV_NULL_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>',
+                   'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+def load_dataframe(
+    data: Union[str, pd.DataFrame],
+    columns: Optional[List[str]] = None,
+    exclude_columns: Optional[List[str]] = None,
+    downcast: bool = True,
+    downcast_floats: bool = False,
+    category_threshold: float = 0.5,
+    verbose: bool = False,
+) -> pd.DataFrame:
+    """
+    Loads a dataframe from a file, reading only the requested columns.
+
+    Column selection is pushed down to the reader for Parquet, Feather and CSV files; the other
+    formats are read in full and projected afterwards. CSV files are parsed with the multithreaded
+    pyarrow reader when pyarrow is installed, with the missing values and the (unparsed) dates of
+    pandas.read_csv. The path of the file is stored in df.attrs['source_path'],
+    so that later stages can name their outputs after it even when they receive the parsed frame.
+
+    Args:
+        data: Path to the input file or a pandas DataFrame. A DataFrame is returned as it is
+            (projected on the requested columns), without downcasting.
+        columns: Columns to load. If None, all columns are loaded.
+        exclude_columns: Columns not to load. Names that are not in the file are ignored.
+        downcast: Whether to downcast int64 to int32 when the values fit, and to convert
+            low-cardinality string columns to 'category'.
+        downcast_floats: Whether downcasting also converts float64 to float32 when the values are
+            in range, which keeps about 7 significant digits instead of 16.
+        category_threshold: A string column is converted to 'category' if its ratio of unique
+            values to rows is at most this value.
+        verbose: Whether to print progress messages.
+
+    Returns:
+        The loaded pandas DataFrame.
+
+    Raises:
+        ValueError: If the input is not a supported file or a pandas DataFrame.
+    """
+    if isinstance(data, pd.DataFrame):
+        selected = _select_columns(list(data.columns), columns, exclude_columns)
+        return data if len(selected) == data.shape[1] else data[selected]
+    if not isinstance(data, str):
+        raise ValueError("Invalid input. Must be a path to a file or a pandas DataFrame.")
+
+    if data.endswith('.csv'):
+        df = _read_csv(data, columns, exclude_columns)
+    elif data.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        names = pq.read_schema(data).names
+        df = pd.read_parquet(data, columns=_select_columns(names, columns, exclude_columns, drop_index_columns=True))
+    elif is_feature_store(data):
+        store = open_feature_store(data)
+        df = store.to_dataframe(columns=_select_columns(store.columns, columns, exclude_columns))
+    elif data.endswith('.feather'):
+        import pyarrow.ipc as ipc
+        names = ipc.open_file(data).schema.names
+        df = pd.read_feather(data, columns=_select_columns(names, columns, exclude_columns, drop_index_columns=True))
+    else:
+        if data.endswith('.xlsx'):
+            df = pd.read_excel(data, index_col=None)
+        elif data.endswith('.pickle'):
+            df = pd.read_pickle(data)
+        elif data.endswith('.json'):
+            df = pd.read_json(data)
+        elif data.endswith('.hdf') or data.endswith('.h5'):
+            df = pd.read_hdf(data)
+        else:
+            # Suggesting action to the user
+            raise ValueError(f"The file format is not supported. Please convert your file to one of the following supported formats: {SUPPORTED_FORMATS}.")
+        selected = set(_select_columns(list(df.columns), columns, exclude_columns))
+        if len(selected) != df.shape[1]:
+            df = df.drop(columns=[c for c in df.columns if c not in selected])
+
+    if downcast:
+        df = downcast_dataframe(df, category_threshold=category_threshold, floats=downcast_floats)
+    df.attrs['source_path'] = data
+    if verbose:
+        print(f"{datetime.datetime.now()}: Loaded {df.shape[0]} rows and {df.shape[1]} columns from {data} "
+              f"({df.memory_usage(deep=True).sum() / 2**20:.1f} MiB).")
+    return df
+
+
+def downcast_dataframe(df: pd.DataFrame, category_threshold: float = 0.5, floats: bool = False) -> pd.DataFrame:
+    """
+    Downcasts numeric columns and converts low-cardinality string columns to 'category', in place.
+
+    int64 columns become int32 when their range fits, and string columns whose ratio of unique
+    values to rows is at most category_threshold become 'category'. With floats, float64 columns
+    also become float32 when their values are in range; this rounds them, so it is not the default.
+
+    Returns:
+        The same DataFrame, for chaining.
+    """
+    int32 = np.iinfo(np.int32)
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == np.float64:
+            if floats:
+                df[col] = pd.to_numeric(series, downcast='float')
+        elif series.dtype == np.int64:
+            if len(series) > 0 and series.min() >= int32.min and series.max() <= int32.max:
+                df[col] = series.astype(np.int32)
+        elif series.dtype == object and len(series) > 0:
+            if pd.api.types.infer_dtype(series, skipna=True) == 'string' \
+                    and series.nunique() / len(series) <= category_threshold:
+                df[col] = series.astype('category')
+    return df
+
+
+def source_name(data: Union[str, pd.DataFrame, None]) -> Optional[str]:
+    """Return the path an input was loaded from, if it is known."""
+    if isinstance(data, str):
+        return data
+    if isinstance(data, pd.DataFrame):
+        return data.attrs.get('source_path')
+    return None
+
+
+def _read_csv(path: str, columns: Optional[List[str]], exclude_columns: Optional[List[str]]) -> pd.DataFrame:
+    """Read a CSV file, detecting a leading index column from the header only."""
+    try:
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        pa_csv = None
+
+    if pa_csv is not None:
+        import pyarrow as pa
+        # Missing values as pandas reads them, also in string columns
+        convert_options = pa_csv.ConvertOptions(null_values=CSV_NULL_VALUES, strings_can_be_null=True)
+        # Only the first block is parsed to get the header and the column types, which pyarrow infers from
+        # that block too
+        schema = pa_csv.open_csv(path, convert_options=convert_options).schema
+        names = schema.names
+    else:
+        names = pd.read_csv(path, nrows=0).columns.tolist()
+    # check if the first column looks like an index (e.g., unnamed or follows a specific pattern)
+    index_name = names[0] if (names[0] == '' or names[0].startswith('Unnamed') or names[0].isdigit()) else None
+    selected = _select_columns([n for n in names if n != index_name], columns, exclude_columns)
+    usecols = ([index_name] if index_name is not None else []) + selected
+
+    if pa_csv is not None:
+        # pandas does not parse dates and times unless asked, so they are kept as strings
+        convert_options.column_types = {field.name: pa.string() for field in schema if field.name in usecols
+                                        and pa.types.is_temporal(field.type)}
+        convert_options.include_columns = usecols
+        table = pa_csv.read_csv(path,
+                                read_options=pa_csv.ReadOptions(use_threads=True),
+                                convert_options=convert_options)
+        df = table.to_pandas()
+        # Missing strings are None in pyarrow and NaN in pandas
+        for name in table.column_names:
+            if pa.types.is_string(table.schema.field(name).type) and table.column(name).null_count:
+                df[name] = df[name].where(df[name].notna(), np.nan)
+    else:
+        df = pd.read_csv(path, usecols=usecols)[usecols]
+    if index_name is not None:
+        df = df.set_index(index_name)
+        if index_name == '' or index_name.startswith('Unnamed'):
+            df.index.name = None
+    return df
+
+
+def _select_columns(names: List[str], columns: Optional[List[str]], exclude_columns: Optional[List[str]],
+                    drop_index_columns: bool = False) -> List[str]:
+    """Return the names to load, keeping the file order."""
+    if drop_index_columns:
+        names = [n for n in names if not n.startswith('__index_level_')]
+    if columns is not None:
+        keep = set(columns)
+        names = [n for n in names if n in keep]
+    if exclude_columns:
+        drop = set(exclude_columns)
+        names = [n for n in names if n not in drop]
+    return names
@@ -0,0 +1,181 @@
+import datetime
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+SUPPORTED_MANIFOLDS = ['Isomap', 'TSNE', 'UMAP']
+UMAP_N_NEIGHBORS = 15
+
+
+def compute_manifold(
+    values: np.ndarray,
+    manifold_method: str = 'UMAP',
+    manifold_dim: int = 2,
+    sample_size: Optional[int] = None,
+    strata: Optional[np.ndarray] = None,
+    n_interpolation_neighbors: int = 5,
+    precomputed_knn: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    random_state: int = 42,
+    verbose: bool = True,
+) -> np.ndarray:
+    """
+    Computes a low-dimensional embedding of the rows of a feature matrix.
+
+    If sample_size is smaller than the number of rows, the manifold is fitted on a stratified
+    subsample only. The remaining rows are placed with the fitted model's transform when it
+    exists (Isomap, UMAP), or by inverse-distance weighted interpolation of the embeddings of
+    their nearest sampled rows otherwise (TSNE).
+
+    Args:
+        values: Feature matrix with one row per data point.
+        manifold_method: 'Isomap', 'TSNE' or 'UMAP'.
+        manifold_dim: Number of output dimensions.
+        sample_size: Number of rows used to fit the manifold. If None, all rows are used.
+        strata: Optional labels, one per row, used to stratify the subsample (e.g. the target column).
+        n_interpolation_neighbors: Number of sampled neighbors used to place each remaining row
+            when the method has no transform.
+        precomputed_knn: Optional (distances, indices) of every row, self included in the first column,
+            as returned by tagra.graph.compute_knn. UMAP uses the first UMAP_N_NEIGHBORS columns
+            instead of running its own neighbor search. Ignored by the other methods and when
+            fitting on a subsample.
+        random_state: Seed for the manifold and the subsample.
+        verbose: Whether to print progress messages.
+
+    Returns:
+        An array of shape (n_rows, manifold_dim) with the embedding of every row.
+
+    Raises:
+        ValueError: If the manifold method is not supported.
+    """
+    n = values.shape[0]
+    if sample_size is None or sample_size >= n:
+        if manifold_method == 'UMAP' and precomputed_knn is not None:
+            distances, indices = precomputed_knn
+            if indices.shape[1] < UMAP_N_NEIGHBORS:
+                raise ValueError(f"precomputed_knn must have at least {UMAP_N_NEIGHBORS} columns for UMAP.")
+            manifold = _make_manifold(manifold_method, manifold_dim, random_state,
+                                      precomputed_knn=(indices[:, :UMAP_N_NEIGHBORS], distances[:, :UMAP_N_NEIGHBORS]))
+            if verbose:
+                print(f"{datetime.datetime.now()}: Using precomputed nearest neighbors for UMAP.")
+        else:
+            manifold = _make_manifold(manifold_method, manifold_dim, random_state)
+        embedding = manifold.fit_transform(values)
+        if verbose:
+            _print_settings(manifold, manifold_method, manifold_dim)
+        return embedding
+
+    sample = stratified_sample(n, sample_size, strata=strata, random_state=random_state)
+    rest = np.setdiff1d(np.arange(n), sample, assume_unique=True)
+    if verbose:
+        print(f"{datetime.datetime.now()}: Fitting {manifold_method} on a stratified subsample of "
+              f"{len(sample)} out of {n} rows.")
+
+    manifold = _make_manifold(manifold_method, manifold_dim, random_state)
+    embedding = np.empty((n, manifold_dim), dtype=float)
+    embedding[sample] = manifold.fit_transform(values[sample])
+    if verbose:
+        _print_settings(manifold, manifold_method, manifold_dim)
+
+    if len(rest) > 0:
+        if hasattr(manifold, 'transform'):
+            embedding[rest] = manifold.transform(values[rest])
+            if verbose:
+                print(f"{datetime.datetime.now()}: Placed the remaining {len(rest)} rows with {manifold_method}.transform.")
+        else:
+            embedding[rest] = _interpolate_embedding(values[sample], embedding[sample], values[rest],
+                                                     n_interpolation_neighbors)
+            if verbose:
+                print(f"{datetime.datetime.now()}: Placed the remaining {len(rest)} rows by "
+                      f"{n_interpolation_neighbors}-NN interpolation.")
+    return embedding
+
+
+def stratified_sample(
+    n: int,
+    sample_size: int,
+    strata: Optional[np.ndarray] = None,
+    random_state: int = 42,
+) -> np.ndarray:
+    """
+    Draws a sample of row indices without replacement, proportionally to each stratum.
+
+    Every non-empty stratum gets at least one row, as long as sample_size allows it.
+
+    Args:
+        n: Number of rows.
+        sample_size: Number of rows to draw.
+        strata: Optional labels, one per row. If None, a uniform sample is drawn.
+        random_state: Seed for the sampling.
+
+    Returns:
+        The sorted array of sampled row indices.
+    """
+    rng = np.random.default_rng(random_state)
+    sample_size = min(sample_size, n)
+    if strata is None:
+        return np.sort(rng.choice(n, size=sample_size, replace=False))
+
+    # NaN labels get their own stratum
+    codes, _ = pd.factorize(pd.Series(strata), use_na_sentinel=False)
+    counts = np.bincount(codes)
+    quotas = counts * sample_size / n
+    allocation = np.floor(quotas).astype(int)
+    if len(counts) <= sample_size:
+        allocation = np.maximum(allocation, 1)
+    # Distribute the remaining rows by largest fractional part, or take back from the largest strata
+    remainder = sample_size - allocation.sum()
+    order = np.argsort(-(quotas - np.floor(quotas)))
+    while remainder > 0:
+        for stratum in order:
+            if remainder == 0:
+                break
+            if allocation[stratum] < counts[stratum]:
+                allocation[stratum] += 1
+                remainder -= 1
+    while remainder < 0:
+        allocation[np.argmax(allocation)] -= 1
+        remainder += 1
+
+    sample = [rng.choice(np.flatnonzero(codes == stratum), size=size, replace=False)
+              for stratum, size in enumerate(allocation)]
+    return np.sort(np.concatenate(sample))
+
+
+def _make_manifold(manifold_method: str, manifold_dim: int, random_state: int,
+                   precomputed_knn: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+    """Initialize the manifold method."""
+    if manifold_method == 'Isomap':
+        from sklearn.manifold import Isomap
+        return Isomap(n_components=manifold_dim)
+    elif manifold_method == 'TSNE':
+        from sklearn.manifold import TSNE
+        return TSNE(n_components=manifold_dim, random_state=random_state)
+    elif manifold_method == 'UMAP':
+        from umap.umap_ import UMAP
+        return UMAP(n_components=manifold_dim,
+                    random_state=random_state,  # For reproducibility
+                    n_neighbors=UMAP_N_NEIGHBORS,    # Default=15, adjust based on data size
+                    min_dist=0.1,      # Default=0.1, controls cluster tightness
+                    precomputed_knn=precomputed_knn if precomputed_knn is not None else (None, None, None))
+    raise ValueError(f"Unsupported manifold method: {manifold_method}. "
+                     f"Choose from {SUPPORTED_MANIFOLDS}")
+
+
+def _interpolate_embedding(sample_values: np.ndarray, sample_embedding: np.ndarray,
+                           query_values: np.ndarray, k: int) -> np.ndarray:
+    """Place query rows at the inverse-distance weighted mean embedding of their nearest sampled rows."""
+    k = min(k, sample_values.shape[0])
+    distances, indices = cKDTree(sample_values).query(query_values, k=k)
+    if k == 1:
+        distances, indices = distances[:, None], indices[:, None]
+    weights = 1.0 / (distances + 1e-12)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum('ij,ijk->ik', weights, sample_embedding[indices])
+
+
+def _print_settings(manifold, manifold_method: str, manifold_dim: int) -> None:
+    print(f"{datetime.datetime.now()}: Applied {manifold_method} with settings: "
+          f"n_components={manifold_dim}, "
+          f"n_neighbors={manifold.n_neighbors if hasattr(manifold, 'n_neighbors') else 'N/A'}")
@@ -0,0 +1,210 @@
+import re
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+from .kernels import GOWER_BLOCK_ELEMENTS
+
+
+SUPPORTED_DTYPES = ['float64', 'float32']
+# Approximate size of a networkx node with a few attributes, and of an undirected edge (both adjacency entries)
+GRAPH_NODE_BYTES = 350
+GRAPH_EDGE_BYTES = 150
+# Neighbors searched by UMAP and t-SNE (3 * perplexity) for each row
+UMAP_NEIGHBORS = 15
+TSNE_NEIGHBORS = 90
+# Lanczos vectors kept by scipy's eigsh for the spectral embedding
+SPECTRAL_VECTORS = 20
+_UNITS = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+
+def parse_memory(value: Union[int, float, str]) -> int:
+    """
+    Converts a memory size to bytes.
+
+    Parameters:
+    - value (int, float or str): A number of bytes, or a string such as '512MB' or '2.5 GB' (binary units).
+
+    Returns:
+    - int: The size in bytes.
+    """
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    match = re.fullmatch(r'\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)I?B?\s*', str(value).upper())
+    if match is None:
+        raise ValueError(f"Invalid memory size: {value}. Use a number of bytes or a string like '2GB'.")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def format_memory(n_bytes: float) -> str:
+    """Formats a number of bytes with a binary unit, e.g. '1.50 GB'."""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(n_bytes) < 1024:
+            return f"{n_bytes:.2f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.2f} TB"
+
+
+def estimate_memory(
+    n_rows: int,
+    n_features: int,
+    dtype: str = 'float64',
+    method: str = 'knn',
+    k: int = 5,
+    n_edges: Optional[float] = None,
+    manifold_method: Optional[str] = None,
+    manifold_sample_size: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Estimates the memory used by the main arrays and the graph of a run, by step.
+
+    The estimates count the large arrays each step allocates (the feature matrix, neighbor lists,
+    dense distance or similarity matrices) and the networkx graph, not the Python overhead.
+
+    Parameters:
+    - n_rows (int): Number of rows of the dataset.
+    - n_features (int): Number of columns of the feature matrix.
+    - dtype (str): 'float64' or 'float32', the type of the feature matrix.
+    - method (str): Graph method: 'knn', 'distance', 'similarity' or 'gower'.
+    - k (int): Number of neighbors of the 'knn' and 'gower' methods.
+    - n_edges (float, optional): Expected number of edges of the 'distance' method.
+    - manifold_method (str, optional): 'UMAP', 'Isomap', 'TSNE', 'spectral' or None.
+    - manifold_sample_size (int, optional): Rows the manifold is fitted on.
+
+    Returns:
+    - dict: Step -> estimated bytes, for 'features', 'graph' and, if any, 'manifold'.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype: {dtype}. Choose from {SUPPORTED_DTYPES}")
+    itemsize = np.dtype(dtype).itemsize
+    features = n_rows * n_features * itemsize
+    # cKDTree keeps its own float64 copy of the data and an index array
+    tree = n_rows * (n_features * 8 + 8)
+    nodes = n_rows * GRAPH_NODE_BYTES
+    if method == 'knn':
+        graph = tree + n_rows * (k + 1) * 16 + n_rows * k * GRAPH_EDGE_BYTES + nodes
+    elif method == 'distance':
+        n_edges = n_edges if n_edges is not None else n_rows * k / 2
+        # query_pairs returns an (edges, 2) integer array before the edges are added
+        graph = tree + n_edges * (16 + GRAPH_EDGE_BYTES) + nodes
+    elif method == 'similarity':
+        # Dense similarity matrix and the boolean mask of the pairs above the threshold
+        graph = n_rows * n_rows * (itemsize + 1) + nodes + (n_edges or 0) * GRAPH_EDGE_BYTES
+    elif method == 'gower':
+        # Blocks of GOWER_BLOCK_ELEMENTS distances (the block, the city block and the Hamming distances),
+        # the scaled numeric copy and the neighbor lists
+        block = min(n_rows * n_rows, max(GOWER_BLOCK_ELEMENTS, n_rows))
+        graph = 3 * block * 8 + n_rows * n_features * 8 + n_rows * (k + 1) * 16 + n_rows * k * GRAPH_EDGE_BYTES + nodes
+    else:
+        raise ValueError(f"Unsupported method: {method}")
+    estimate = {'features': int(features), 'graph': int(graph)}
+
+    if manifold_method == 'spectral':
+        # Embeds the whole graph: the adjacency and its normalized copy (both edge directions), and the
+        # Lanczos vectors
+        n_graph_edges = n_edges if n_edges is not None else n_rows * k
+        estimate['manifold'] = int(2 * 2 * n_graph_edges * 12 + n_rows * SPECTRAL_VECTORS * 8)
+    elif manifold_method is not None:
+        m = min(n_rows, manifold_sample_size or n_rows)
+        if manifold_method == 'Isomap':
+            # Dense geodesic distance matrix
+            manifold = m * m * 8
+        elif manifold_method == 'TSNE':
+            manifold = m * TSNE_NEIGHBORS * 3 * 8
+        else:
+            # Neighbor lists and the fuzzy graph (rows, columns, weights)
+            manifold = m * UMAP_NEIGHBORS * (16 + 3 * 8)
+        estimate['manifold'] = int(manifold + m * n_features * itemsize)
+    return estimate
+
+
+def check_memory_budget(estimate: Dict[str, int], memory_budget: Union[int, float, str], what: str = 'The run') -> None:
+    """
+    Fails fast if the estimated memory exceeds the budget.
+
+    Parameters:
+    - estimate (dict): Step -> estimated bytes, as returned by estimate_memory.
+    - memory_budget (int, float or str): The budget, see parse_memory.
+    - what (str): Description of what is estimated, for the error message.
+
+    Raises:
+    - MemoryError: If the sum of the estimates exceeds the budget, with the estimate of each step.
+    """
+    budget = parse_memory(memory_budget)
+    total = sum(estimate.values())
+    if total > budget:
+        details = ', '.join(f"{step} {format_memory(size)}" for step, size in
+                            sorted(estimate.items(), key=lambda item: -item[1]))
+        raise MemoryError(f"{what} needs about {format_memory(total)} ({details}), more than the memory "
+                          f"budget of {format_memory(budget)}.")
+
+
+class MemoryTracker:
+    """
+    Tracks the peak memory allocated while each stage of a run is active, with tracemalloc.
+
+    tracemalloc traces the allocations of the whole process, so the peak of a stage is the peak of
+    the process while the stage ran, including the stages running at the same time in other threads.
+    Allocations made in other processes are not traced. Tracing slows allocations down, so a tracker
+    is only used when asked for.
+
+    Usage:
+        with MemoryTracker() as tracker:
+            with tracker.stage('graph'):
+                ...
+        tracker.peaks['graph']
+    """
+
+    def __init__(self):
+        self.peaks: Dict[str, int] = {}
+        self.allocated: Dict[str, int] = {}
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> 'MemoryTracker':
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+        tracemalloc.reset_peak()
+        return self
+
+    def stop(self) -> None:
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def __enter__(self) -> 'MemoryTracker':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Context manager recording the peak and net memory allocated while a stage runs."""
+        with self._lock:
+            self._active[name] = self._update()
+        try:
+            yield
+        finally:
+            with self._lock:
+                current = self._update()
+                self.allocated[name] = current - self._active.pop(name)
+
+    def peak(self) -> int:
+        """The highest peak of the tracked stages."""
+        return max(self.peaks.values(), default=0)
+
+    def _update(self) -> int:
+        # The peak since the last stage started or ended belongs to all the stages active in between
+        if not tracemalloc.is_tracing():
+            return 0
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for name in self._active:
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+        return current
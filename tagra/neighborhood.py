@@ -0,0 +1,182 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from .context import AnalysisContext
+from .kernels import neighbor_mean
+
+
+# Rows of each Parquet row group written by export_neighborhood_features
+CHUNK_ROWS = 1_000_000
+# Values converted to float64 at once by multi_hop_features (64 MB per block of columns)
+VALUE_BLOCK_ELEMENTS = 2 ** 23
+
+
+def multi_hop_features(indptr, indices, label_codes=(), n_labels=(), values=None, hops=3, backend=None):
+    """
+    Computes multi-hop label distributions and mean neighbor values with sparse matrix products.
+
+    The label distribution of hop h of a node is the distribution of the labels at the end of a random
+    walk of h steps from the node: the one-hot label matrix Y multiplied h times by the row-normalized
+    adjacency P (P @ Y at hop 1 is the fraction of the neighbors with each label). All the attributes
+    are stacked in one matrix, so each hop is a single sparse product over the edges, with the compiled
+    kernel when numba is installed (see tagra.kernels.neighbor_mean). The values are averaged by blocks
+    of columns, so a memory-mapped matrix (e.g. of a tagra.store.FeatureStore) is never copied as a
+    whole; only the float32 results are held in memory.
+
+    Parameters:
+    - indptr, indices (np.ndarray): CSR adjacency, see tagra.kernels.adjacency_csr.
+    - label_codes (list): Integer code of each node for each attribute, see tagra.utils.node_label_codes.
+    - n_labels (list): Number of labels of each attribute.
+    - values (np.ndarray, optional): An (n_nodes, n_columns) matrix of node values, averaged over the
+      neighbors (hop 1 only).
+    - hops (int): Number of hops of the label distributions.
+    - backend (str, optional): See tagra.kernels.resolve_backend.
+
+    Returns:
+    - (list, np.ndarray or None): For each attribute, the list of the (n_nodes, n_labels) float32
+      distributions of hops 1 to hops, and the (n_nodes, n_columns) float32 mean neighbor values.
+      The rows of nodes without neighbors are 0, as is the mass of the walks that reach them.
+
+    Raises:
+    - ValueError: If hops is not positive.
+    """
+    if hops < 1:
+        raise ValueError("hops must be a positive integer.")
+    n_nodes = len(indptr) - 1
+    offsets = np.r_[0, np.cumsum(n_labels)].astype(np.int64)
+    one_hot = np.zeros((n_nodes, int(offsets[-1])))
+    for codes, offset in zip(label_codes, offsets):
+        one_hot[np.arange(n_nodes), offset + np.asarray(codes)] = 1
+
+    distributions = [[] for _ in label_codes]
+    stacked = one_hot
+    for _ in range(hops):
+        if stacked.shape[1] == 0:
+            break
+        stacked = neighbor_mean(indptr, indices, stacked, backend=backend)
+        for i in range(len(label_codes)):
+            distributions[i].append(stacked[:, offsets[i]:offsets[i + 1]].astype(np.float32))
+    del stacked
+
+    means = None
+    if values is not None and values.shape[1]:
+        # The values are only averaged over the direct neighbors
+        means = np.empty((n_nodes, values.shape[1]), dtype=np.float32)
+        block = max(1, VALUE_BLOCK_ELEMENTS // max(n_nodes, 1))
+        for start in range(0, values.shape[1], block):
+            means[:, start:start + block] = neighbor_mean(indptr, indices, values[:, start:start + block],
+                                                          backend=backend)
+    return distributions, means
+
+
+def neighborhood_feature_chunks(graph, target_attributes=None, values=None, value_columns=None, hops=3,
+                                chunk_size=CHUNK_ROWS, backend=None):
+    """
+    Computes graph-derived features of every node and yields them as DataFrames of chunk_size rows.
+
+    Columns: 'node_index', 'degree' (number of neighbors in the CSR adjacency, a self-loop counting
+    once), 'hop{h}_{attribute}_{label}' (fraction of the h-step random walks ending on the label, see
+    multi_hop_features) and 'mean_{column}' (mean value of the column over the neighbors).
+
+    Parameters:
+    - graph (networkx.Graph or tagra.context.AnalysisContext): The graph, or its context to reuse its
+      adjacency and labels.
+    - target_attributes (str or list, optional): Node attributes whose label distributions are computed.
+    - values (np.ndarray or pd.DataFrame, optional): Node values averaged over the neighbors, with one row
+      per node in list(graph.nodes) order, e.g. the preprocessed feature matrix the graph was built from
+      (a memory-mapped tagra.store.FeatureStore matrix is read by blocks of columns).
+    - value_columns (list, optional): Names of the value columns. Defaults to the DataFrame columns, or
+      to their positions.
+    - hops (int): Number of hops of the label distributions.
+    - chunk_size (int): Rows of each yielded DataFrame.
+    - backend (str, optional): See tagra.kernels.resolve_backend.
+
+    Yields:
+    - pd.DataFrame: The features of chunk_size consecutive nodes.
+
+    Raises:
+    - ValueError: If values does not have one row per node.
+    """
+    context = graph if isinstance(graph, AnalysisContext) else AnalysisContext(graph)
+    if isinstance(target_attributes, str):
+        target_attributes = [target_attributes]
+    target_attributes = target_attributes or []
+    nodes = context.nodes()
+    if isinstance(values, pd.DataFrame):
+        value_columns = value_columns or list(values.columns)
+        values = values.to_numpy(dtype=np.float64)
+    if values is not None:
+        if values.shape[0] != len(nodes):
+            raise ValueError(f"values has {values.shape[0]} rows, but the graph has {len(nodes)} nodes.")
+        value_columns = value_columns or list(range(values.shape[1]))
+
+    indptr, indices = context.adjacency()
+    codes = [context.label_codes(attribute) for attribute in target_attributes]
+    distributions, means = multi_hop_features(indptr, indices, [c for c, _ in codes],
+                                              [len(labels) for _, labels in codes], values=values,
+                                              hops=hops, backend=backend)
+    degree = np.diff(indptr)
+
+    columns = []
+    for attribute, (_, labels), hop_distributions in zip(target_attributes, codes, distributions):
+        for hop, distribution in enumerate(hop_distributions, start=1):
+            columns += [(f"hop{hop}_{attribute}_{label}", distribution[:, j]) for j, label in enumerate(labels)]
+    if means is not None:
+        columns += [(f"mean_{column}", means[:, j]) for j, column in enumerate(value_columns)]
+
+    for start in range(0, max(len(nodes), 1), chunk_size):
+        stop = start + chunk_size
+        chunk = {'node_index': nodes[start:stop], 'degree': degree[start:stop]}
+        chunk.update((name, column[start:stop]) for name, column in columns)
+        yield pd.DataFrame(chunk)
+
+
+def export_neighborhood_features(graph, output_path, target_attributes=None, values=None, value_columns=None,
+                                 hops=3, chunk_size=CHUNK_ROWS, backend=None, verbose=True):
+    """
+    Writes the graph-derived features of every node to a Parquet file, for downstream models.
+
+    The features (see neighborhood_feature_chunks) are computed in batch with sparse products and held
+    in memory as float32 columns, 4 bytes per node and column; the DataFrame and Arrow tables are built
+    and written one row group of chunk_size rows at a time.
+
+    Parameters:
+    - graph (networkx.Graph or tagra.context.AnalysisContext): The graph, or its context.
+    - output_path (str): Path of the Parquet file.
+    - target_attributes, values, value_columns, hops, chunk_size, backend: See neighborhood_feature_chunks.
+    - verbose (bool): Whether to print progress messages.
+
+    Returns:
+    - str: The path of the Parquet file.
+
+    Raises:
+    - ValueError: If output_path is not a .parquet path.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if not output_path.endswith('.parquet'):
+        raise ValueError(f"Invalid neighborhood features path: {output_path}. Must end with '.parquet'.")
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    writer = None
+    n_rows = 0
+    try:
+        for chunk in neighborhood_feature_chunks(graph, target_attributes, values=values, value_columns=value_columns,
+                                                 hops=hops, chunk_size=chunk_size, backend=backend):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+            n_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if verbose:
+        print(f"{datetime.datetime.now()}: Saved the neighborhood features of {n_rows} nodes to {output_path}.")
+    return output_path
@@ -0,0 +1,561 @@
+import datetime
+import multiprocessing
+import os
+import pickle
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .analysis import (
+    output_paths,
+    plot_analysis,
+    structural_metrics,
+    target_metrics,
+    write_metrics
+)
+from .coarsen import coarsen_graph
+from .context import AnalysisContext
+from .graph import compute_knn, create_graph, estimate_edge_counts, get_feature_matrix
+from .kernels import kernel_lock, start_threading_layer
+from .loader import load_dataframe
+from .manifold import UMAP_N_NEIGHBORS, compute_manifold
+from .memory import MemoryTracker, check_memory_budget, estimate_memory, format_memory, parse_memory
+from .neighborhood import export_neighborhood_features
+from .preprocessing import preprocess_dataframe
+from .projection import project_dataframe, projection_column_names
+from .spectral import spectral_embedding
+from .utils import plot_super_graph
+
+
+SUPPORTED_EXECUTORS = ['thread', 'process', 'main']
+
+
+class Pipeline:
+    """
+    Runs a set of stages that depend on each other as a DAG on a pool of workers.
+
+    Each stage is a function called with the results of its dependencies, in the order they were
+    declared. A stage is started as soon as all its dependencies are done, so independent stages
+    run concurrently. Stages with executor 'main' run in the calling thread, one at a time (e.g.
+    matplotlib plots, which are not thread-safe); stages with executor 'process' must be picklable,
+    as must their inputs and result.
+
+    Parameters:
+    - n_workers (int, optional): Number of workers of the pool. Defaults to the number of CPUs.
+    - executor (str): Default executor of the stages: 'thread', 'process' or 'main'.
+    - verbose (bool): Whether to print the start and end of each stage.
+    - track_memory (bool): Whether to record the peak memory of each stage with tracemalloc (see
+      tagra.memory.MemoryTracker). Stages run in other processes are not tracked.
+    """
+
+    def __init__(self, n_workers: Optional[int] = None, executor: str = 'thread', verbose: bool = True,
+                 track_memory: bool = False):
+        if executor not in SUPPORTED_EXECUTORS:
+            raise ValueError(f"Unsupported executor: {executor}. Choose from {SUPPORTED_EXECUTORS}")
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.executor = executor
+        self.verbose = verbose
+        self.memory_tracker = MemoryTracker() if track_memory else None
+        self.stages: Dict[str, Tuple[Callable, Tuple[str, ...], str]] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self.start_time: Optional[float] = None
+        self.wall_time: Optional[float] = None
+
+    def add_stage(self, name: str, func: Callable, deps: Sequence[str] = (), executor: Optional[str] = None) -> 'Pipeline':
+        """
+        Adds a stage. Dependencies must be added before the stages that use them.
+
+        Raises:
+            ValueError: If the name is taken, a dependency is unknown or the executor is not supported.
+        """
+        executor = executor or self.executor
+        if name in self.stages:
+            raise ValueError(f"Stage {name} already exists.")
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {missing}")
+        if executor not in SUPPORTED_EXECUTORS:
+            raise ValueError(f"Unsupported executor: {executor}. Choose from {SUPPORTED_EXECUTORS}")
+        self.stages[name] = (func, tuple(deps), executor)
+        return self
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Runs every stage and returns their results by name.
+
+        Pool stages are submitted by the completion callbacks of their dependencies, so they start
+        even while the main thread is busy with a main stage. The first exception raised by a stage
+        is re-raised after cancelling the stages not started yet.
+        """
+        results: Dict[str, Any] = {}
+        pending = dict(self.stages)
+        pools = {}
+        events = queue.Queue()
+        lock = threading.RLock()
+        stopped = []
+        self.timings = {}
+        self.start_time = time.time()
+        if self.memory_tracker is not None:
+            self.memory_tracker.start()
+        # Numba's threads are started here, in the calling thread, rather than by a kernel in a worker
+        start_threading_layer()
+
+        def schedule():
+            # Called with the lock held: start the stages whose dependencies are done
+            if stopped:
+                return
+            # Claim every ready stage before submitting any: a future that is already done runs its
+            # callback, and thus a nested schedule(), inside add_done_callback
+            ready = [(name, pending.pop(name)) for name in
+                     [n for n, (_, deps, _) in pending.items() if all(dep in results for dep in deps)]]
+            for name, (func, deps, executor) in ready:
+                args = [results[dep] for dep in deps]
+                if self.memory_tracker is not None and executor != 'process':
+                    func = partial(_tracked_call, self.memory_tracker, name, func)
+                if executor == 'main':
+                    events.put(('main', name, (func, args)))
+                    continue
+                if executor not in pools:
+                    if executor == 'process':
+                        # Spawned rather than forked: the parent may have started numba's thread pool
+                        pools[executor] = ProcessPoolExecutor(max_workers=self.n_workers,
+                                                              mp_context=multiprocessing.get_context('spawn'))
+                    else:
+                        pools[executor] = ThreadPoolExecutor(max_workers=self.n_workers)
+                self._print(f"Starting stage {name} ({executor}).")
+                future = pools[executor].submit(_timed_call, func, *args)
+                future.add_done_callback(partial(finished, name))
+
+        def finished(name, future):
+            # Exceptions raised in a done callback are only logged by concurrent.futures, so every failure
+            # is posted to the main thread instead
+            try:
+                result, timing = future.result()
+                complete(name, result, timing)
+            except BaseException as e:
+                events.put(('error', name, e))
+                return
+            events.put(('done', name, None))
+
+        def complete(name, result, timing):
+            with lock:
+                results[name], self.timings[name] = result, timing
+                self._print(f"Finished stage {name} in {self._duration(name):.2f}s.")
+                schedule()
+
+        try:
+            with lock:
+                schedule()
+            for _ in range(len(self.stages)):
+                kind, name, payload = events.get()
+                if kind == 'error':
+                    raise payload
+                if kind == 'main':
+                    func, args = payload
+                    self._print(f"Starting stage {name} (main).")
+                    complete(name, *_timed_call(func, *args))
+        finally:
+            with lock:
+                stopped.append(True)
+            for pool in pools.values():
+                pool.shutdown(wait=True, cancel_futures=True)
+            if self.memory_tracker is not None:
+                self.memory_tracker.stop()
+        self.wall_time = time.time() - self.start_time
+        return results
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        The chain of dependent stages with the longest total duration in the last run, and that duration.
+        It bounds the wall time of the pipeline however many workers are used.
+        """
+        longest: Dict[str, Tuple[float, List[str]]] = {}
+        # Stages are stored in insertion order, which is a topological order
+        for name, (_, deps, _) in self.stages.items():
+            best = max((longest[dep] for dep in deps), key=lambda item: item[0], default=(0.0, []))
+            longest[name] = (best[0] + self._duration(name), best[1] + [name])
+        if not longest:
+            return [], 0.0
+        duration, path = max(longest.values(), key=lambda item: item[0])
+        return path, duration
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Timings of the last run: wall time, critical path and start/duration of each stage, and with
+        memory tracking the peak and net allocated bytes of each stage.
+        """
+        path, duration = self.critical_path()
+        summary = {
+            'wall_time': self.wall_time,
+            'critical_path': path,
+            'critical_path_time': duration,
+            'total_stage_time': sum(self._duration(name) for name in self.timings),
+            'stages': {name: {'start': begin - self.start_time, 'duration': end - begin}
+                       for name, (begin, end) in self.timings.items()},
+        }
+        if self.memory_tracker is not None:
+            summary['peak_memory'] = self.memory_tracker.peak()
+            for name, stage in summary['stages'].items():
+                stage['peak_memory'] = self.memory_tracker.peaks.get(name)
+                stage['allocated_memory'] = self.memory_tracker.allocated.get(name)
+        return summary
+
+    def report(self) -> List[str]:
+        """Formats the timings of the last run, marking the stages on the critical path."""
+        summary = self.summary()
+        on_path = set(summary['critical_path'])
+        tracked = self.memory_tracker is not None
+        lines = ["Pipeline Report", "===============",
+                 f"{'Stage':<20}{'Start (s)':>10}{'Time (s)':>10}" + (f"{'Peak memory':>14}" if tracked else "")]
+        for name, timing in sorted(summary['stages'].items(), key=lambda item: item[1]['start']):
+            memory = ""
+            if tracked:
+                memory = f"{format_memory(timing['peak_memory']) if timing['peak_memory'] is not None else '-':>14}"
+            lines.append(f"{name:<20}{timing['start']:>10.2f}{timing['duration']:>10.2f}{memory}{'  *' if name in on_path else ''}")
+        lines.append(f"Critical path (*): {' -> '.join(summary['critical_path'])} ({summary['critical_path_time']:.2f}s)")
+        if tracked:
+            lines.append(f"Peak memory: {format_memory(summary['peak_memory'])}")
+        lines.append(f"Wall time: {summary['wall_time']:.2f}s, sum of stage times: {summary['total_stage_time']:.2f}s "
+                     f"({self.n_workers} {self.executor} workers)")
+        return lines
+
+    def _duration(self, name: str) -> float:
+        begin, end = self.timings.get(name, (0.0, 0.0))
+        return end - begin
+
+    def _print(self, message: str) -> None:
+        if self.verbose:
+            print(f"{datetime.datetime.now()}: {message}")
+
+
+def _timed_call(func: Callable, *args) -> Tuple[Any, Tuple[float, float]]:
+    """Call func and return its result with its start and end time (wall clock, comparable across processes)."""
+    begin = time.time()
+    result = func(*args)
+    return result, (begin, time.time())
+
+
+def _tracked_call(tracker: MemoryTracker, name: str, func: Callable, *args) -> Any:
+    """Call func while recording its memory as stage name."""
+    with tracker.stage(name):
+        return func(*args)
+
+
+def build_pipeline(config: Dict[str, Any]) -> Pipeline:
+    """
+    Builds the TaGra pipeline of a configuration, as run by go.py.
+
+    The stages are: loading, preprocessing (with the optional projection), the feature matrix, the shared
+    nearest neighbors, the manifold fit in parallel with the graph construction, then the structural
+    metrics, the target statistics and the plots in parallel, and finally the report. With a
+    'coarsen_method' the graph is also coarsened into a super-graph, which is saved and drawn. The
+    manifold and the plots run in the main thread, except the 'spectral' manifold, which embeds the
+    graph once it is built. With the 'process' executor only the stages before the graph run in worker
+    processes: the graph and analysis stages share an AnalysisContext, whose memo cannot be shared
+    across processes, so they run on a thread pool.
+
+    Args:
+        config: A configuration, see tagra.config.load_config. 'n_workers' and 'pipeline_executor'
+            set the pool.
+
+    Returns:
+        The pipeline; run() returns the results of every stage, the metrics under 'report'.
+    """
+    config = dict(config)
+    target_columns = config['target_columns'] if isinstance(config['target_columns'], list) else [config['target_columns']]
+    target_columns = [col for col in target_columns if col is not None]
+    # In multi-target mode the targets are analyzed separately: the first one stratifies the preprocessing
+    # and the others are only kept out of the features
+    config['multi_target'] = config['multi_target'] and len(target_columns) > 1
+    # UMAP and the kNN graph share one neighbor search
+    share_knn = (config['share_knn'] and config['method'] == 'knn'
+                 and config['manifold_method'] == 'UMAP' and config['manifold_sample_size'] is None)
+    paths = output_paths(config['output_directory'], config['overwrite'],
+                         degree_distribution_filename=config['degree_distribution_filename'],
+                         prob_heatmap_filename=config['prob_heatmap_filename'],
+                         community_filename=config['community_filename'],
+                         graph_visualization_filename=config['graph_visualization_filename'],
+                         network_metrics_filename=config['network_metrics_filename'],
+                         metrics_filename=config['metrics_filename'],
+                         super_graph_filename=config['super_graph_filename'],
+                         super_graph_visualization_filename=config['super_graph_visualization_filename'],
+                         neighborhood_features_filename=config['neighborhood_features_filename'])
+
+    pipeline = Pipeline(n_workers=config['n_workers'], executor=config['pipeline_executor'], verbose=config['verbose'],
+                        track_memory=config['track_memory'])
+    # Stages that take or return the AnalysisContext; None keeps the default executor
+    context_executor = 'thread' if config['pipeline_executor'] == 'process' else None
+    pipeline.add_stage('load', partial(_load_stage, config, target_columns))
+    pipeline.add_stage('preprocess', partial(_preprocess_stage, config, target_columns), ['load'])
+    pipeline.add_stage('features', partial(_features_stage, config), ['preprocess'])
+    graph_deps = ['load', 'preprocess']
+    if share_knn:
+        pipeline.add_stage('knn', partial(_knn_stage, config), ['features'])
+        graph_deps.append('knn')
+    if config['manifold_method'] not in (None, 'spectral'):
+        # UMAP's numba parallel kernels block the interpreter exit when run from a worker thread, so the
+        # manifold runs in the main thread while the graph is built on the pool
+        pipeline.add_stage('manifold', partial(_manifold_stage, config),
+                           ['features', 'preprocess'] + (['knn'] if share_knn else []), executor='main')
+    pipeline.add_stage('graph', partial(_graph_stage, config, target_columns), graph_deps, executor=context_executor)
+    if config['manifold_method'] == 'spectral':
+        # The spectral embedding places the nodes from the graph itself, so it follows the graph
+        pipeline.add_stage('manifold', partial(_spectral_stage, config), ['graph'], executor=context_executor)
+    pipeline.add_stage('structure', partial(_structure_stage, config), ['graph', 'preprocess'],
+                       executor=context_executor)
+    pipeline.add_stage('targets', partial(_targets_stage, config), ['graph'], executor=context_executor)
+    # The community plot waits for the communities of the structural metrics, the other plots do not
+    plot_paths = dict(paths, community_filename=None, network_metrics_filename=None, metrics_filename=None,
+                      super_graph_filename=None, super_graph_visualization_filename=None,
+                      neighborhood_features_filename=None)
+    pipeline.add_stage('plots', partial(_plots_stage, config, plot_paths),
+                       ['graph'] + (['manifold'] if config['manifold_method'] is not None else []), executor='main')
+    if paths['community_filename'] is not None:
+        pipeline.add_stage('community_plot', partial(_community_plot_stage, config, paths['community_filename']),
+                           ['graph', 'structure'], executor='main')
+    if config['coarsen_method'] is not None:
+        pipeline.add_stage('coarsen', partial(_coarsen_stage, config, target_columns, paths['super_graph_filename']),
+                           ['graph'], executor=context_executor)
+        if paths['super_graph_visualization_filename'] is not None:
+            pipeline.add_stage('super_graph_plot',
+                               partial(_super_graph_plot_stage, config, target_columns,
+                                       paths['super_graph_visualization_filename']),
+                               ['coarsen'], executor='main')
+    if paths['neighborhood_features_filename'] is not None:
+        pipeline.add_stage('neighborhood_features',
+                           partial(_neighborhood_features_stage, config, target_columns,
+                                   paths['neighborhood_features_filename']),
+                           ['graph', 'preprocess'], executor=context_executor)
+    pipeline.add_stage('report', partial(_report_stage, config, paths), ['structure', 'targets'])
+    return pipeline
+
+
+def run_pipeline(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs the TaGra pipeline of a configuration, see build_pipeline.
+
+    Returns:
+        The metrics computed by the analysis, with the pipeline timings under 'pipeline'.
+    """
+    pipeline = build_pipeline(config)
+    results = pipeline.run()
+    metrics = results['report']
+    metrics['pipeline'] = pipeline.summary()
+    if config['verbose']:
+        for line in pipeline.report():
+            print(line)
+    return metrics
+
+
+def _load_stage(config, target_columns):
+    # The input is parsed once and shared by preprocessing and graph creation
+    return load_dataframe(
+        config['input_dataframe'],
+        exclude_columns=[col for col in config['ignore_columns'] if col not in target_columns],
+        downcast=config['downcast'],
+        downcast_floats=config['downcast_floats'],
+        verbose=config['verbose']
+    )
+
+
+def _preprocess_stage(config, target_columns, input_dataframe):
+    multi_target = config['multi_target']
+    # preprocess_dataframe extends the column lists in place; copies keep the config (and default_config) intact
+    df_preprocessed, _, preprocessor = preprocess_dataframe(
+        input_dataframe=input_dataframe,
+        output_directory=config['output_directory'],
+        preprocessed_filename=config['preprocessed_filename'],
+        inferred_columns_filename=config['inferred_columns_filename'],
+        numeric_columns=list(config['numeric_columns']),
+        categorical_columns=list(config['categorical_columns']),
+        target_columns=target_columns[0] if multi_target else config['target_columns'],
+        unknown_column_action=config['unknown_column_action'],
+        ignore_columns=list(config['ignore_columns']) + (target_columns[1:] if multi_target else []),
+        numeric_threshold=config['numeric_threshold'],
+        numeric_scaling=config['numeric_scaling'],
+        categorical_encoding=config['categorical_encoding'],
+        nan_action=config['nan_action'],
+        nan_threshold=config['nan_threshold'],
+        n_jobs=config['preprocessing_n_jobs'],
+        dtype=config['dtype'],
+        verbose=config['verbose'],
+        # The manifold is a stage of its own, run in parallel with the graph construction
+        manifold_method=None,
+        preprocessor_filename=config['preprocessor_filename'],
+        return_preprocessor=True,
+        overwrite=config['overwrite']
+    )
+    # Labels used to stratify the manifold subsample
+    target_name = target_columns[0] if multi_target or len(target_columns) == 1 else tuple(target_columns)
+    strata = df_preprocessed[target_name].values if target_columns and target_name in df_preprocessed.columns else None
+
+    projection_info = None
+    numeric_columns = preprocessor.numeric_columns or None
+    if config['projection_method'] is not None:
+        df_preprocessed, projection_info = project_dataframe(
+            df_preprocessed,
+            numeric_columns=numeric_columns,
+            projection_method=config['projection_method'],
+            projection_dim=config['projection_dim'],
+            output_directory=config['output_directory'],
+            projection_filename=config['projection_filename'],
+            knn_overlap_k=config['k'],
+            verbose=config['verbose']
+        )
+        if projection_info['projection_dim'] < projection_info['projection_input_dim']:
+            # The projected coordinates replace the numeric columns; targets and ignored columns are kept out
+            numeric_columns = projection_column_names(projection_info['projection_dim'])
+    return {'dataframe': df_preprocessed, 'numeric_columns': numeric_columns,
+            'projection_info': projection_info, 'strata': strata, 'preprocessor': preprocessor}
+
+
+def _features_stage(config, preprocessed):
+    values, _ = get_feature_matrix(preprocessed['dataframe'], preprocessed['numeric_columns'], dtype=config['dtype'])
+    if config['memory_budget'] is not None:
+        # Fail before the neighbor search, the manifold and the graph if they cannot fit
+        estimate = estimate_memory(len(values), values.shape[1], dtype=values.dtype.name, method=config['method'],
+                                   k=config['k'], n_edges=_expected_edges(config, values),
+                                   manifold_method=config['manifold_method'],
+                                   manifold_sample_size=config['manifold_sample_size'])
+        check_memory_budget(estimate, config['memory_budget'], what=f"The graph of {len(values)} rows")
+        if config['verbose']:
+            print(f"{datetime.datetime.now()}: Estimated memory: {format_memory(sum(estimate.values()))} "
+                  f"(budget {format_memory(parse_memory(config['memory_budget']))}).")
+    return values
+
+
+def _expected_edges(config, values):
+    """Expected number of edges of the 'distance' method, within its budgets."""
+    if config['method'] != 'distance':
+        return None
+    if config['distance_threshold'] is not None:
+        n_edges = estimate_edge_counts(values, [config['distance_threshold']])[0]
+    elif config['target_degree'] is not None:
+        n_edges = len(values) * config['target_degree'] / 2
+    else:
+        return None
+    if config['max_degree'] is not None:
+        n_edges = min(n_edges, len(values) * config['max_degree'] / 2)
+    if config['max_edges'] is not None:
+        n_edges = min(n_edges, config['max_edges'])
+    return n_edges
+
+
+def _knn_stage(config, values):
+    return compute_knn(values, max(config['k'], UMAP_N_NEIGHBORS - 1))
+
+
+def _manifold_stage(config, values, preprocessed, knn=None):
+    manifold_dim = 2
+    if values.shape[1] < manifold_dim:
+        if config['verbose']:
+            print(f"{datetime.datetime.now()}: manifold_dim is larger than number of numeric columns. Skipping...")
+        return None
+    # UMAP runs numba parallel code concurrently with the kernels of the analysis stages
+    with kernel_lock():
+        return compute_manifold(np.asarray(values, dtype=float),
+                                manifold_method=config['manifold_method'],
+                                manifold_dim=manifold_dim,
+                                sample_size=config['manifold_sample_size'],
+                                strata=preprocessed['strata'],
+                                precomputed_knn=knn,
+                                verbose=config['verbose'])
+
+
+def _spectral_stage(config, context):
+    return spectral_embedding(context, dim=2, method=config['spectral_method'], verbose=config['verbose'])
+
+
+def _graph_stage(config, target_columns, input_dataframe, preprocessed, knn=None):
+    node_attributes = config['node_attributes']
+    # The 'gower' method compares label-encoded categorical columns by code; one-hot columns are numeric
+    categorical_columns = (preprocessed['preprocessor'].categorical_columns
+                           if config['method'] == 'gower' and config['categorical_encoding'] == 'label' else None)
+    graph = create_graph(
+        input_dataframe=input_dataframe,
+        output_directory=config['output_directory'],
+        graph_filename=config['graph_filename'],
+        inferred_columns_filename=config['inferred_columns_filename'],
+        numeric_columns=preprocessed['numeric_columns'],
+        categorical_columns=categorical_columns,
+        preprocessed_dataframe=preprocessed['dataframe'],
+        similarity_threshold=config['similarity_threshold'],
+        distance_threshold=config['distance_threshold'],
+        target_degree=config['target_degree'],
+        max_degree=config['max_degree'],
+        max_edges=config['max_edges'],
+        dtype=config['dtype'],
+        method=config['method'],
+        k=config['k'],
+        knn=knn,
+        node_attributes=node_attributes,
+        index_filename=config['index_filename'],
+        index_method=config['index_method'],
+        index_labels=[col for col in target_columns if node_attributes is None or col in node_attributes],
+        verbose=config['verbose'],
+        overwrite=config['overwrite']
+    )
+    # The context is shared by the analysis stages, so they reuse each other's intermediate results
+    return AnalysisContext(graph)
+
+
+def _structure_stage(config, context, preprocessed):
+    return structural_metrics(context.graph, context, projection_info=preprocessed['projection_info'],
+                              path_length_samples=config['path_length_samples'],
+                              betweenness_samples=config['betweenness_samples'],
+                              pagerank_centrality=config['pagerank_centrality'],
+                              estimate_time_budget=config['estimate_time_budget'],
+                              spectral_eigenvalues=config['spectral_eigenvalues'],
+                              spectral_method=config['spectral_method'], verbose=config['verbose'])
+
+
+def _targets_stage(config, context):
+    return target_metrics(context, config['target_columns'], multi_target=config['multi_target'],
+                          verbose=config['verbose'])
+
+
+def _plots_stage(config, paths, context, pos=None):
+    plot_analysis(context.graph, context, paths, config['target_columns'], multi_target=config['multi_target'],
+                  pos=pos, verbose=config['verbose'])
+
+
+def _community_plot_stage(config, community_path, context, structure):
+    if structure['community_count'] == 0:
+        return
+    plot_analysis(context.graph, context, {'community_filename': community_path}, config['target_columns'],
+                  multi_target=config['multi_target'], neighborhood=False, verbose=config['verbose'])
+
+
+def _coarsen_stage(config, target_columns, super_graph_path, context):
+    super_graph = coarsen_graph(context.graph, method=config['coarsen_method'], target_attributes=target_columns,
+                                max_nodes=config['coarsen_max_nodes'], context=context, verbose=config['verbose'])
+    if super_graph_path is not None:
+        with open(super_graph_path, 'wb') as f:
+            pickle.dump(super_graph, f)
+        if config['verbose']:
+            print(f"{datetime.datetime.now()}: Super-graph saved in {super_graph_path}")
+    return super_graph
+
+
+def _super_graph_plot_stage(config, target_columns, outpath, super_graph):
+    plot_super_graph(super_graph, target_columns[0] if target_columns else None, outpath, config['verbose'])
+
+
+def _neighborhood_features_stage(config, target_columns, outpath, context, preprocessed):
+    # The nodes of the graph are the rows of the preprocessed dataframe, in order
+    values, columns = get_feature_matrix(preprocessed['dataframe'], preprocessed['numeric_columns'])
+    return export_neighborhood_features(context, outpath, target_attributes=target_columns, values=values,
+                                        value_columns=columns, hops=config['neighborhood_hops'],
+                                        verbose=config['verbose'])
+
+
+def _report_stage(config, paths, structure, targets):
+    metrics = dict(structure, **targets)
+    write_metrics(metrics, paths, config['target_columns'], multi_target=config['multi_target'],
+                  verbose=config['verbose'])
+    return metrics
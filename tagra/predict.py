@@ -0,0 +1,236 @@
+import datetime
+import time
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+from .context import AnalysisContext
+from .kernels import neighbor_mean
+from .query import load_index
+
+
+PREDICT_METHODS = ['propagation', 'vote']
+# Records scored at once by LabelPredictor.predict_records
+RECORDS_BATCH_SIZE = 10_000
+
+
+def propagate_labels(indptr, indices, codes, n_labels, max_iter=100, tol=1e-4, backend=None):
+    """
+    Spreads the labels of the labeled nodes over the graph by iterated neighbor averaging.
+
+    Each iteration replaces the label distribution of every node by the mean distribution of its
+    neighbors (one sparse product, see tagra.kernels.neighbor_mean) and resets the labeled nodes to
+    their own labels, so the unlabeled nodes converge to the harmonic solution of Zhu and Ghahramani.
+    The iterations stop early when no value changes by more than tol. With max_iter=1 the result is
+    the vote of the labeled neighbors of each node.
+
+    Parameters:
+    - indptr, indices (np.ndarray): CSR adjacency, see tagra.kernels.adjacency_csr.
+    - codes (np.ndarray): Label code of each node, -1 for the unlabeled nodes.
+    - n_labels (int): Number of labels.
+    - max_iter (int): Maximum number of iterations.
+    - tol (float): Largest change of a value below which the iterations stop.
+    - backend (str, optional): See tagra.kernels.resolve_backend.
+
+    Returns:
+    - (np.ndarray, int): The (n_nodes, n_labels) label distributions, whose rows sum to 1 (0 for the
+      nodes no labeled node reaches), and the number of iterations run.
+    """
+    codes = np.asarray(codes)
+    labeled = np.flatnonzero(codes >= 0)
+    seeds = np.zeros((len(codes), n_labels))
+    seeds[labeled, codes[labeled]] = 1
+    distributions = seeds
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        updated = neighbor_mean(indptr, indices, distributions, backend=backend)
+        updated[labeled] = seeds[labeled]
+        change = np.abs(updated - distributions).max(initial=0)
+        distributions = updated
+        if change < tol:
+            break
+    totals = distributions.sum(axis=1, keepdims=True)
+    return np.divide(distributions, totals, out=np.zeros_like(distributions), where=totals > 0), iteration
+
+
+class LabelPredictor:
+    """
+    Predicts a node attribute from the labels of the other nodes of the graph.
+
+    The label distributions of all the nodes are computed once, when the predictor is created:
+    - 'propagation': label propagation until convergence, see propagate_labels;
+    - 'vote': the label distribution of the labeled neighbors of each node (one propagation step).
+    Nodes keep their own label if they are labeled. New records are scored against the graph by
+    averaging the distributions of their k nearest rows in a NeighborIndex of the graph, e.g. the one
+    saved by create_graph (index_filename), see predict_records.
+
+    Parameters:
+    - graph (networkx.Graph or tagra.context.AnalysisContext): The graph, or its context to reuse its
+      adjacency and labels.
+    - target_attribute (str): The node attribute to predict. Nodes without it are unlabeled.
+    - method (str): 'propagation' or 'vote'.
+    - labeled (iterable, optional): Nodes whose labels are used. Defaults to all the nodes with a label;
+      pass a subset to evaluate the predictions on the others (see evaluate_label_prediction).
+    - max_iter (int): Maximum number of propagation iterations.
+    - tol (float): Convergence threshold of the propagation.
+    - backend (str, optional): See tagra.kernels.resolve_backend.
+
+    Attributes:
+    - classes (np.ndarray): The labels, one per column of distributions.
+    - distributions (np.ndarray): The (n_nodes, n_classes) label distribution of each node.
+    - n_iterations (int): Number of propagation iterations run.
+    """
+
+    def __init__(self, graph, target_attribute, method='propagation', labeled=None, max_iter=100, tol=1e-4,
+                 backend=None):
+        if method not in PREDICT_METHODS:
+            raise ValueError(f"Unsupported prediction method: {method}. Choose from {PREDICT_METHODS}")
+        self.context = graph if isinstance(graph, AnalysisContext) else AnalysisContext(graph)
+        self.target_attribute = target_attribute
+        self.method = method
+        codes, self.classes, self.labeled = _label_codes(self.context, target_attribute, labeled)
+        indptr, indices = self.context.adjacency()
+        self.distributions, self.n_iterations = propagate_labels(
+            indptr, indices, codes, len(self.classes), max_iter=max_iter if method == 'propagation' else 1,
+            tol=tol, backend=backend)
+
+    def predict_proba(self, nodes=None) -> pd.DataFrame:
+        """Label distribution of nodes (all of them by default), one column per class."""
+        nodes = self.context.nodes() if nodes is None else list(nodes)
+        return pd.DataFrame(self.distributions[self._positions(nodes)], index=pd.Index(nodes, dtype=object),
+                            columns=self.classes)
+
+    def predict(self, nodes=None) -> np.ndarray:
+        """Most likely label of nodes (all of them by default); None for the nodes no label reaches."""
+        nodes = self.context.nodes() if nodes is None else list(nodes)
+        return _most_likely(self.distributions[self._positions(nodes)], self.classes)
+
+    def predict_records(self, records, index, preprocessor=None, k=5, batch_size=RECORDS_BATCH_SIZE,
+                        return_probabilities=False):
+        """
+        Predicts the labels of new records from the label distributions of their nearest graph rows.
+
+        Parameters:
+        - records (np.ndarray, pd.DataFrame or list of dict): Preprocessed feature rows in the columns of
+          the index, or raw records if preprocessor is given.
+        - index (tagra.query.NeighborIndex or str): Index of the graph rows, or the path of the saved one.
+          Row i of the index must be node i of the graph, as with create_graph.
+        - preprocessor (tagra.preprocessing.Preprocessor, optional): The fitted preprocessing of the records.
+        - k (int): Number of nearest rows averaged.
+        - batch_size (int): Records searched at once.
+        - return_probabilities (bool): Whether to also return the (n_records, n_classes) distributions.
+
+        Returns:
+        - np.ndarray: The predicted label of each record (None if no neighbor has a label distribution),
+          and the distributions if return_probabilities is True.
+
+        Raises:
+        - ValueError: If the index and the graph have different numbers of rows.
+        """
+        if isinstance(index, str):
+            index = load_index(index)
+        if len(index) != len(self.distributions):
+            raise ValueError(f"The index has {len(index)} rows but the graph has {len(self.distributions)} nodes.")
+        if preprocessor is not None:
+            records = preprocessor.transform(records)
+        if isinstance(records, pd.DataFrame):
+            records = records[index.feature_columns].to_numpy(dtype=float)
+        records = np.atleast_2d(np.asarray(records, dtype=float))
+        probabilities = np.empty((len(records), len(self.classes)))
+        for start in range(0, len(records), batch_size):
+            _, neighbors = index.query(records[start:start + batch_size], k)
+            probabilities[start:start + batch_size] = self.distributions[neighbors].mean(axis=1)
+        predictions = _most_likely(probabilities, self.classes)
+        return (predictions, probabilities) if return_probabilities else predictions
+
+    def _positions(self, nodes):
+        positions = pd.Index(self.context.nodes(), dtype=object).get_indexer(pd.Index(nodes, dtype=object))
+        if (positions < 0).any():
+            raise ValueError(f"Nodes not in the graph: {[n for n, p in zip(nodes, positions) if p < 0]}")
+        return positions
+
+
+def evaluate_label_prediction(graph, target_attribute, method='propagation', test_fraction=0.2, random_state=0,
+                              max_iter=100, tol=1e-4, backend=None, verbose=True) -> Dict[str, Any]:
+    """
+    Measures the accuracy and throughput of LabelPredictor by hiding the labels of some nodes.
+
+    Parameters:
+    - graph (networkx.Graph or tagra.context.AnalysisContext): The graph.
+    - target_attribute (str): The node attribute to predict.
+    - method (str): 'propagation' or 'vote'.
+    - test_fraction (float): Fraction of the labeled nodes whose labels are hidden and predicted.
+    - random_state (int): Seed of the choice of the hidden nodes.
+    - max_iter, tol, backend: See LabelPredictor.
+    - verbose (bool): Whether to print the results.
+
+    Returns:
+    - dict: 'accuracy' (over the hidden nodes that received a prediction), 'coverage' (fraction of the
+      hidden nodes that received one), 'baseline_accuracy' (majority class of the visible labels),
+      'iterations', 'seconds' and 'nodes_per_second'.
+    """
+    context = graph if isinstance(graph, AnalysisContext) else AnalysisContext(graph)
+    nodes = context.nodes()
+    codes, classes, labeled = _label_codes(context, target_attribute)
+    rng = np.random.default_rng(random_state)
+    hidden = rng.choice(labeled, int(round(test_fraction * len(labeled))), replace=False)
+    visible = np.setdiff1d(labeled, hidden)
+
+    start = time.perf_counter()
+    predictor = LabelPredictor(context, target_attribute, method=method, labeled=[nodes[i] for i in visible],
+                               max_iter=max_iter, tol=tol, backend=backend)
+    seconds = time.perf_counter() - start
+
+    true_labels = classes[codes[hidden]]
+    predictions = _most_likely(predictor.distributions[hidden], predictor.classes)
+    predicted = predictor.distributions[hidden].sum(axis=1) > 0
+    majority = pd.Series(classes[codes[visible]]).mode()[0] if len(visible) else None
+    results = {
+        'accuracy': float(np.mean(predictions[predicted] == true_labels[predicted])) if predicted.any() else float('nan'),
+        'coverage': float(predicted.mean()) if len(hidden) else float('nan'),
+        'baseline_accuracy': float(np.mean(true_labels == majority)) if len(hidden) else float('nan'),
+        'iterations': predictor.n_iterations,
+        'seconds': seconds,
+        'nodes_per_second': len(nodes) / seconds if seconds > 0 else float('inf'),
+    }
+    if verbose:
+        print(f"{datetime.datetime.now()}: {method} of '{target_attribute}' on {len(hidden)} hidden nodes: accuracy "
+              f"{results['accuracy']:.4f} (majority class {results['baseline_accuracy']:.4f}), coverage "
+              f"{results['coverage']:.4f}, {results['iterations']} iterations in {seconds:.3f}s.")
+    return results
+
+
+def _label_codes(context, target_attribute, labeled=None):
+    """Codes of the labels of the nodes (-1 for the unlabeled ones), the classes and the labeled positions."""
+    codes, labels = context.label_codes(target_attribute)
+    # node_label_codes gives nodes without the attribute the label 'None', which can also be a real class,
+    # so the unlabeled nodes are read from the graph
+    missing = np.array([_is_missing(context.graph.nodes[node].get(target_attribute)) for node in context.nodes()],
+                       dtype=bool)
+    present = np.zeros(len(labels), dtype=bool)
+    present[codes[~missing]] = True
+    classes = labels[present]
+    remap = np.full(len(labels), -1, dtype=np.int64)
+    remap[present] = np.arange(present.sum())
+    codes = np.where(missing, -1, remap[codes])
+    if labeled is not None:
+        positions = pd.Index(context.nodes(), dtype=object).get_indexer(pd.Index(list(labeled), dtype=object))
+        if (positions < 0).any():
+            raise ValueError("Labeled nodes must be nodes of the graph.")
+        keep = np.zeros(len(codes), dtype=bool)
+        keep[positions] = True
+        codes = np.where(keep, codes, -1)
+    return codes, classes, np.flatnonzero(codes >= 0)
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _most_likely(distributions, classes):
+    """Class of the largest value of each row, None for the rows without any."""
+    predictions = np.asarray(classes, dtype=object)[distributions.argmax(axis=1)] if len(classes) else \
+        np.full(len(distributions), None, dtype=object)
+    predictions[distributions.sum(axis=1) == 0] = None
+    return predictions
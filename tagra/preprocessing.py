@@ -3,7 +3,11 @@ import os
 import numpy as np
 import pandas as pd
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.preprocessing import StandardScaler, MinMaxScaler, OneHotEncoder, LabelEncoder
+from .loader import load_dataframe, source_name
+from .manifold import compute_manifold
+from .store import is_feature_store, save_feature_store
 import pdb
 def preprocess_dataframe(input_dataframe=None, 
                          output_directory="results/", 
@@ -22,6 +26,13 @@ def preprocess_dataframe(input_dataframe=None,
                          verbose=True, 
                          manifold_method='UMAP', 
                          manifold_dim=2,
+                         manifold_sample_size=None,
+                         downcast=True,
+                         downcast_floats=False,
+                         dtype=None,
+                         n_jobs=None,
+                         preprocessor_filename=None,
+                         return_preprocessor=False,
                          overwrite=False):
 
     if verbose:
@@ -33,7 +44,7 @@ def preprocess_dataframe(input_dataframe=None,
         f"\tnumeric_threshold: {numeric_threshold}, numeric_scaling: {numeric_scaling}, \n"
         f"\tcategorical_encoding: {categorical_encoding}, nan_action: {nan_action}, \n"
         f"\tnan_threshold: {nan_threshold}, verbose: {verbose}, \n"
-        f"\tmanifold_method: {manifold_method}, manifold_dim: {manifold_dim}\n")
+        f"\tmanifold_method: {manifold_method}, manifold_dim: {manifold_dim}, manifold_sample_size: {manifold_sample_size}\n")
 
     # Output path managing
     if output_directory is None:
@@ -42,8 +53,9 @@ def preprocess_dataframe(input_dataframe=None,
         os.mkdir(output_directory)
         print(f"{datetime.datetime.now()}: Output directory created: {output_directory}.")
     if preprocessed_filename is None:
-        if isinstance(input_dataframe, str):
-            basename = os.path.basename(input_dataframe)
+        source_path = source_name(input_dataframe)
+        if source_path is not None:
+            basename = os.path.basename(source_path)
             base, ext = os.path.splitext(basename)
             if overwrite:
                 preprocessed_filename = f"{base}_preprocessed{ext}"
@@ -66,28 +78,7 @@ def preprocess_dataframe(input_dataframe=None,
 
     # Load dataframe
     if isinstance(input_dataframe, str):
-        if input_dataframe.endswith('.csv'):
-            # read the first row of the CSV to determine if the first column is an index
-            peek_df = pd.read_csv(input_dataframe, nrows=1)
-            # check if the first column looks like an index (e.g., unnamed or follows a specific pattern)
-            if peek_df.columns[0].startswith('Unnamed') or peek_df.columns[0].isdigit():
-                df = pd.read_csv(input_dataframe, index_col=0)
-            else:
-                df = pd.read_csv(input_dataframe)
-        elif input_dataframe.endswith('.xlsx'):
-            df = pd.read_excel(input_dataframe, index_col=None)
-        elif input_dataframe.endswith('.pickle'):
-            df = pd.read_pickle(input_dataframe)
-        elif input_dataframe.endswith('.json'):
-            df = pd.read_json(input_dataframe)
-        elif input_dataframe.endswith('.parquet'):
-            df = pd.read_parquet(input_dataframe)
-        elif input_dataframe.endswith('.hdf') or input_dataframe.endswith('.h5'):
-            df = pd.read_hdf(input_dataframe)
-        else:
-            # Suggesting action to the user
-            supported_formats = ", ".join(["CSV", "Excel (.xlsx)", "Pickle", "JSON", "Parquet", "HDF5 (.hdf, .h5)"])
-            raise ValueError(f"The file format is not supported. Please convert your file to one of the following supported formats: {supported_formats}.")
+        df = load_dataframe(input_dataframe, downcast=downcast, downcast_floats=downcast_floats, verbose=verbose)
     elif isinstance(input_dataframe, pd.DataFrame):
         df = input_dataframe.copy()
     else:
@@ -156,11 +147,11 @@ def preprocess_dataframe(input_dataframe=None,
                     numeric_columns.append(col)
                     if verbose:
                         print(f"{datetime.datetime.now()}: Column '{col}' added to numeric columns by inference.")
-                elif df[col].dtype == 'bool' or np.issubdtype(df[col].dtype, np.datetime64):
+                elif df[col].dtype == 'bool' or pd.api.types.is_datetime64_any_dtype(df[col].dtype):
                     ignore_columns.append(col)
                     if verbose:
                         print(f"{datetime.datetime.now()}: Column '{col}' added to ignored columns by inference.")
-                elif df[col].dtype == 'object':
+                elif df[col].dtype == 'object' or isinstance(df[col].dtype, pd.CategoricalDtype):
                     categorical_columns.append(col)
                     if verbose:
                         print(f"{datetime.datetime.now()}: Column '{col}' added to categorical column columns by inference.")      
@@ -190,12 +181,11 @@ def preprocess_dataframe(input_dataframe=None,
         df = df.drop(columns=target_columns)
     
     if len(target_columns) != 0:
-        unique_targets = np.unique(df[target_col_name].values)
-        N_col = df.shape[0]
+        # One pass over the target column for all the classes
+        proportions = df[target_col_name].value_counts(normalize=True, sort=False).sort_index()
         print(f"Target class proportions")
-        for target in unique_targets:
-            n_target = df[df[target_col_name] == target].shape[0]
-            print(f"\t{target}: {n_target / N_col * 100}%")
+        for target, proportion in proportions.items():
+            print(f"\t{target}: {proportion * 100}%")
     print(f"--------------------------\nEnd of the report.")
 
     # NaNs
@@ -204,37 +194,44 @@ def preprocess_dataframe(input_dataframe=None,
         if verbose:
             print(f"{datetime.datetime.now()}: Dropped rows with NaN values.")
     elif nan_action == 'drop column':
-        df.dropna(axis=1, thresh=int(nan_threshold * df.shape[0]), inplace=True)
+        # Columns whose ratio of NaNs is above nan_threshold, except the target
+        nan_ratios = df.isna().mean()
+        dropped = [col for col in df.columns if nan_ratios[col] > nan_threshold and col != target_col_name]
+        df = df.drop(columns=dropped)
+        numeric_columns = [col for col in numeric_columns if col not in dropped]
+        categorical_columns = [col for col in categorical_columns if col not in dropped]
         if verbose:
-            print(f"{datetime.datetime.now()}: Dropped columns with NaN values above threshold.")
-    elif nan_action == 'infer':
-        for col in numeric_columns:
-            df[col] = df[col].fillna(df[col].mean())
-            if verbose:
-                print(f"{datetime.datetime.now()}: Filled NaN values in numeric column '{col}' with mean.")
-        for col in categorical_columns:
-            df[col] = df[col].fillna(df[col].mode()[0])
-            if verbose:
-                print(f"{datetime.datetime.now()}: Filled NaN values in categorical column '{col}' with mode.")
+            print(f"{datetime.datetime.now()}: Dropped columns with NaN values above threshold: {dropped}.")
+
+    # Means and modes of all the columns, computed by blocks of columns in n_jobs threads. They fill the
+    # missing values here and in new records (see Preprocessor); filling with them leaves them unchanged.
+    fill_values = column_fill_values(df, numeric_columns, categorical_columns, n_jobs=n_jobs)
+    if nan_action == 'infer':
+        df = df.fillna({col: value for col, value in fill_values.items() if value is not None})
         if verbose:
-            print(f"{datetime.datetime.now()}: Filled NaN values with column means.")
+            print(f"{datetime.datetime.now()}: Filled NaN values in {len(numeric_columns)} numeric columns with "
+                  f"their means and in {len(categorical_columns)} categorical columns with their modes.")
 
-    # Preprocessing numerical cols
+    # Preprocessing numerical cols: one copy of the columns, in the requested type, scaled in place
     if numeric_scaling == 'standard':
-        scaler = StandardScaler()
+        scaler = StandardScaler(copy=False)
     elif numeric_scaling == 'minmax':
-        scaler = MinMaxScaler()
-    df[numeric_columns] = scaler.fit_transform(df[numeric_columns])
+        scaler = MinMaxScaler(copy=False)
+    df[numeric_columns] = scaler.fit_transform(df[numeric_columns].to_numpy(dtype=dtype))
     if verbose:
         print(f"{datetime.datetime.now()}: Scaled numeric columns using {numeric_scaling} scaling.")
 
     # Preprocessing cat cols
     if categorical_encoding == 'one-hot':
+        label_classes = None
         df = pd.get_dummies(df, columns=categorical_columns)
     elif categorical_encoding == 'label':
-        encoder = LabelEncoder()
+        # Codes of the sorted categories, the classes and codes LabelEncoder would give, by blocks of columns
+        encoded = _map_column_blocks(lambda cols: {col: _label_codes(df[col]) for col in cols},
+                                     categorical_columns, n_jobs)
+        label_classes = {}
         for col in categorical_columns:
-            df[col] = encoder.fit_transform(df[col])
+            df[col], label_classes[col] = encoded[col]
     if verbose:
         print(f"{datetime.datetime.now()}: Encoded categorical columns using {categorical_encoding} encoding.")
 
@@ -246,37 +243,15 @@ def preprocess_dataframe(input_dataframe=None,
             if verbose:
                 print(f"{datetime.datetime.now()}: manifold_dim is larger than number of numeric columns. Skipping...")
         else:
-            # Initialize manifold method
-            if manifold_method == 'Isomap':
-                from sklearn.manifold import Isomap
-                manifold = Isomap(n_components=manifold_dim)
-            elif manifold_method == 'TSNE':
-                from sklearn.manifold import TSNE
-                manifold = TSNE(n_components=manifold_dim)
-            elif manifold_method == 'UMAP':
-                from umap.umap_ import UMAP
-                manifold = UMAP(n_components=manifold_dim, 
-                            random_state=42,  # For reproducibility
-                            n_neighbors=15,    # Default=15, adjust based on data size
-                            min_dist=0.1)      # Default=0.1, controls cluster tightness
-            else:
-                raise ValueError(f"Unsupported manifold method: {manifold_method}. "
-                                f"Choose from ['Isomap', 'TSNE', 'UMAP']")
-
-            # Common processing for all manifold methods
-            manifold_numeric_columns = [f'manifold_{i}' for i in range(manifold_dim)]
-            
-            # Fit-transform and preserve original index
-            manifold_transform = manifold.fit_transform(df[numeric_columns])
-            df_manifold = df.copy()
-            df_manifold = df_manifold.drop(columns=numeric_columns)
-            df_manifold[manifold_numeric_columns] = manifold_transform
+            # Fit-transform, on a stratified subsample if requested
+            strata = df[target_col_name].values if len(target_columns) != 0 else None
+            manifold_transform = compute_manifold(df[numeric_columns].values,
+                                                  manifold_method=manifold_method,
+                                                  manifold_dim=manifold_dim,
+                                                  sample_size=manifold_sample_size,
+                                                  strata=strata,
+                                                  verbose=verbose)
             manifold_positions = manifold_transform  # For visualization coordinates
-            
-            if verbose:
-                print(f"{datetime.datetime.now()}: Applied {manifold_method} with settings: "
-                    f"n_components={manifold_dim}, "
-                    f"n_neighbors={manifold.n_neighbors if hasattr(manifold, 'n_neighbors') else 'N/A'}")
 
     # Save columns category
     inferred_columns_dictionary = {}
@@ -291,7 +266,11 @@ def preprocess_dataframe(input_dataframe=None,
             print(f"{datetime.datetime.now()}: Saved inferred columns dictionary to {inferred_columns_dictionary_path}.")
 
     # Save
-    if output_path.endswith('.pickle'):
+    if is_feature_store(output_path):
+        # The matrix holds the preprocessed numeric columns, in their dtype (float64 unless dtype is given)
+        save_feature_store(df, output_path, feature_columns=numeric_columns, dtype=dtype or 'float64',
+                           verbose=verbose)
+    elif output_path.endswith('.pickle'):
         df.to_pickle(output_path)
     elif output_path.endswith('.csv'):
         df.to_csv(output_path, index=False)
@@ -306,4 +285,159 @@ def preprocess_dataframe(input_dataframe=None,
     if verbose:
         print(f"{datetime.datetime.now()}: Saved preprocessed DataFrame to {output_path}.")
 
-    return df, manifold_positions
\ No newline at end of file
+    preprocessor = Preprocessor(numeric_columns, categorical_columns, fill_values, scaler,
+                                categorical_encoding, label_classes, list(df.columns), df.dtypes.to_dict())
+    if preprocessor_filename is not None:
+        if preprocessor_filename.endswith('.pickle') is False:
+            raise ValueError("Invalid preprocessor_filename. Must be a path to a pickle file.")
+        preprocessor_path = os.path.join(output_directory, preprocessor_filename)
+        with open(preprocessor_path, 'wb') as file:
+            pickle.dump(preprocessor, file)
+        if verbose:
+            print(f"{datetime.datetime.now()}: Saved fitted preprocessor to {preprocessor_path}.")
+
+    if return_preprocessor:
+        return df, manifold_positions, preprocessor
+    return df, manifold_positions
+
+
+def column_fill_values(df, numeric_columns, categorical_columns, n_jobs=None):
+    """
+    Computes the mean of each numeric column and the mode of each categorical column.
+
+    The means of a block of columns are computed with one vectorized reduction and the modes by
+    counting the codes of the sorted categories; blocks of columns are processed in parallel threads.
+
+    Parameters:
+    - df (pd.DataFrame): The data.
+    - numeric_columns, categorical_columns (list): The columns.
+    - n_jobs (int, optional): Number of threads; None for 1, -1 for all the CPUs.
+
+    Returns:
+    - dict: Column -> mean or mode (the smallest value on ties, as Series.mode; None for a column
+      without values), numeric columns first.
+    """
+    means = _map_column_blocks(lambda cols: df[cols].mean().to_dict(), numeric_columns, n_jobs)
+    modes = _map_column_blocks(lambda cols: {col: _mode(df[col]) for col in cols}, categorical_columns, n_jobs)
+    return {**means, **modes}
+
+
+def _map_column_blocks(func, columns, n_jobs=None):
+    """Applies func to blocks of columns in n_jobs threads and merges the returned dicts, in column order."""
+    columns = list(columns)
+    n_jobs = os.cpu_count() if n_jobs == -1 else (n_jobs or 1)
+    n_blocks = max(1, min(len(columns), n_jobs))
+    if n_blocks == 1:
+        return func(columns) if columns else {}
+    size = -(-len(columns) // n_blocks)
+    blocks = [columns[start:start + size] for start in range(0, len(columns), size)]
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(blocks)) as pool:
+        for result in pool.map(func, blocks):
+            results.update(result)
+    return results
+
+
+def _sorted_codes(series):
+    """Codes of the values of a column among its sorted distinct values (-1 for missing values), and those values."""
+    # Strings and numbers have no common order (pandas would put the numbers first), as with LabelEncoder
+    if pd.api.types.infer_dtype(series, skipna=True) in ('mixed', 'mixed-integer'):
+        raise ValueError(f"Column '{series.name}' mixes values of different types, which cannot be sorted. "
+                         f"Convert it to str first.")
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes.astype(np.int64), np.asarray(uniques)
+
+
+def _label_codes(series):
+    """Label codes and classes of a column as LabelEncoder gives them: missing values are a last class, NaN."""
+    codes, classes = _sorted_codes(series)
+    if (codes < 0).any():
+        codes[codes < 0] = len(classes)
+        classes = np.append(classes.astype(object), np.nan)
+    return codes, classes
+
+
+def _mode(series):
+    """
+    Most frequent value of a column, the smallest one on ties (the first one when the values cannot be
+    sorted, as Series.mode), or None if all the values are missing.
+    """
+    try:
+        codes, uniques = _sorted_codes(series)
+    except ValueError:
+        codes, uniques = pd.factorize(series)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    return uniques[counts.argmax()] if counts.sum() > 0 else None
+
+
+class Preprocessor:
+    """
+    Fitted state of preprocess_dataframe, used to apply the same preprocessing to new records.
+
+    Missing values are filled with the column means and modes of the preprocessed data, numeric columns
+    are scaled with the fitted scaler and categorical columns are encoded with the categories seen
+    during preprocessing. Columns that were not preprocessed (e.g. targets and ignored columns) are
+    passed through.
+
+    Parameters:
+    - numeric_columns, categorical_columns (list): Columns preprocessed as numeric and as categorical.
+    - fill_values (dict): Value used to fill the missing values of each numeric and categorical column.
+    - scaler: The fitted StandardScaler or MinMaxScaler.
+    - categorical_encoding (str): 'one-hot' or 'label'.
+    - label_classes (dict): The classes of each categorical column, for label encoding.
+    - columns (list): Columns of the preprocessed DataFrame.
+    - dtypes (dict): Dtypes of the preprocessed DataFrame.
+    """
+
+    def __init__(self, numeric_columns, categorical_columns, fill_values, scaler,
+                 categorical_encoding, label_classes, columns, dtypes):
+        self.numeric_columns = list(numeric_columns)
+        self.categorical_columns = list(categorical_columns)
+        self.fill_values = fill_values
+        self.scaler = scaler
+        self.categorical_encoding = categorical_encoding
+        self.label_classes = label_classes
+        self.columns = columns
+        self.dtypes = dtypes
+
+    def transform(self, records):
+        """
+        Preprocesses new records.
+
+        Parameters:
+        - records (pd.DataFrame, dict or list of dict): The records, with the columns of the input DataFrame.
+
+        Returns:
+        - pd.DataFrame: The preprocessed records, with the columns of the preprocessed DataFrame.
+          Pass-through columns that are missing from the records are NaN.
+
+        Raises:
+        - ValueError: If a categorical value was not seen during preprocessing, with label encoding.
+        """
+        if isinstance(records, dict):
+            records = [records]
+        df = pd.DataFrame(records).reset_index(drop=True)
+        for col in self.numeric_columns + self.categorical_columns:
+            if col not in df.columns:
+                df[col] = np.nan
+            if self.fill_values[col] is not None:
+                df[col] = df[col].astype(object).where(df[col].notna(), self.fill_values[col])
+
+        if len(self.numeric_columns) > 0:
+            df[self.numeric_columns] = self.scaler.transform(df[self.numeric_columns].to_numpy(dtype=float))
+        if self.categorical_encoding == 'one-hot':
+            df = pd.get_dummies(df, columns=self.categorical_columns)
+        elif self.categorical_encoding == 'label':
+            for col in self.categorical_columns:
+                # The classes are sorted, possibly with a last NaN class; an index lookup matches both
+                codes = pd.Index(self.label_classes[col]).get_indexer(df[col].values)
+                if (codes < 0).any():
+                    raise ValueError(f"Unknown category in column '{col}'.")
+                df[col] = codes
+
+        # Unseen one-hot categories are dropped and the missing ones are 0, as in the preprocessed data
+        df = df.reindex(columns=self.columns)
+        for col in self.columns:
+            if self.dtypes[col] == bool:
+                df[col] = df[col].eq(True)
+        return df
\ No newline at end of file
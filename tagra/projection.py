@@ -0,0 +1,218 @@
+import datetime
+import hashlib
+import os
+import pickle
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import NearestNeighbors
+
+
+SUPPORTED_PROJECTIONS = ["pca", "svd", "random"]
+
+
+def project_dataframe(
+    preprocessed_dataframe: pd.DataFrame,
+    numeric_columns: Optional[List[str]] = None,
+    projection_method: str = "pca",
+    projection_dim: int = 50,
+    output_directory: Optional[str] = None,
+    projection_filename: Optional[str] = None,
+    knn_overlap_k: int = 5,
+    knn_overlap_samples: int = 1000,
+    random_state: int = 42,
+    verbose: bool = True,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Projects the numeric columns of a preprocessed dataframe to a lower dimension before neighbor search.
+
+    The projected coordinates replace the numeric columns and are stored as
+    'projection_0', ..., 'projection_{d-1}'. Non-numeric columns are kept as they are.
+
+    Args:
+        preprocessed_dataframe: The preprocessed pandas DataFrame.
+        numeric_columns: Columns to project. Defaults to all numeric columns, as in create_graph.
+        projection_method: 'pca' (randomized PCA), 'svd' (truncated SVD) or 'random' (sparse random projection).
+        projection_dim: Number of output dimensions.
+        output_directory: Directory where the projection cache is stored.
+        projection_filename: Name of the pickle file used to cache the fitted projection. If None, no cache is used.
+        knn_overlap_k: Number of neighbors used to measure neighborhood preservation.
+        knn_overlap_samples: Number of rows sampled to measure neighborhood preservation.
+        random_state: Seed for the projection and the sampled rows.
+        verbose: Whether to print progress messages.
+
+    Returns:
+        A tuple (projected dataframe, projection info). The info dictionary holds the method, the
+        input and output dimensions, the explained variance (when available), the mean kNN overlap
+        with the full-dimensional neighborhoods and whether the projection was loaded from cache.
+
+    Raises:
+        ValueError: If invalid inputs are provided.
+    """
+    if projection_method not in SUPPORTED_PROJECTIONS:
+        raise ValueError(f"Unsupported projection method: {projection_method}. "
+                         f"Choose from {SUPPORTED_PROJECTIONS}")
+
+    if numeric_columns is None or len(numeric_columns) == 0:
+        numeric_columns = preprocessed_dataframe.select_dtypes(include=["number"]).columns.tolist()
+    values = preprocessed_dataframe[numeric_columns].to_numpy()
+    if values.shape[1] == 0:
+        raise ValueError("No numeric columns found in the preprocessed dataframe.")
+
+    info = {
+        "projection_method": projection_method,
+        "projection_input_dim": values.shape[1],
+        "projection_dim": projection_dim,
+        "projection_explained_variance": None,
+        "projection_knn_overlap": None,
+        "projection_from_cache": False,
+    }
+    if projection_dim >= values.shape[1]:
+        if verbose:
+            print(f"{datetime.datetime.now()}: projection_dim ({projection_dim}) is not smaller than the number "
+                  f"of numeric columns ({values.shape[1]}). Skipping projection...")
+        info["projection_dim"] = values.shape[1]
+        return preprocessed_dataframe, info
+
+    # Cache managing
+    cache_path = None
+    if projection_filename is not None:
+        if not projection_filename.endswith(".pickle"):
+            raise ValueError("projection_filename must end with '.pickle'.")
+        output_directory = output_directory or "./"
+        os.makedirs(output_directory, exist_ok=True)
+        cache_path = os.path.join(output_directory, projection_filename)
+
+    fingerprint = _fingerprint(values)
+    cached = _load_cached_projection(cache_path, projection_method, projection_dim, numeric_columns, fingerprint)
+    if cached is not None:
+        if verbose:
+            print(f"{datetime.datetime.now()}: Loaded cached {projection_method} projection from {cache_path}.")
+        model, projected = cached["model"], cached["projected"]
+        info["projection_from_cache"] = True
+    else:
+        if verbose:
+            print(f"{datetime.datetime.now()}: Projecting {values.shape[1]} numeric columns to "
+                  f"{projection_dim} dimensions using {projection_method}...")
+        model = _make_projection(projection_method, projection_dim, random_state)
+        projected = model.fit_transform(values)
+        if cache_path is not None:
+            with open(cache_path, "wb") as f:
+                pickle.dump({"method": projection_method,
+                             "dim": projection_dim,
+                             "columns": list(numeric_columns),
+                             "fingerprint": fingerprint,
+                             "model": model,
+                             "projected": projected}, f)
+            if verbose:
+                print(f"{datetime.datetime.now()}: Saved projection cache to {cache_path}.")
+
+    if hasattr(model, "explained_variance_ratio_"):
+        info["projection_explained_variance"] = float(np.sum(model.explained_variance_ratio_))
+
+    info["projection_knn_overlap"] = knn_overlap(values, projected, k=knn_overlap_k,
+                                                 n_samples=knn_overlap_samples, random_state=random_state)
+    if verbose:
+        print(f"{datetime.datetime.now()}: Mean {knn_overlap_k}-NN overlap with the full-dimensional "
+              f"neighborhoods: {info['projection_knn_overlap']:.4f}")
+
+    projection_columns = projection_column_names(projected.shape[1])
+    df_projected = preprocessed_dataframe.drop(columns=numeric_columns)
+    df_projected = pd.concat(
+        [df_projected, pd.DataFrame(projected, index=preprocessed_dataframe.index, columns=projection_columns)],
+        axis=1,
+    )
+    return df_projected, info
+
+
+def projection_column_names(projection_dim: int) -> List[str]:
+    """
+    Names of the columns that hold the projected coordinates.
+
+    Args:
+        projection_dim: Number of output dimensions.
+
+    Returns:
+        The column names 'projection_0', ..., 'projection_{d-1}'.
+    """
+    return [f"projection_{i}" for i in range(projection_dim)]
+
+
+def knn_overlap(
+    full_values: np.ndarray,
+    projected_values: np.ndarray,
+    k: int = 5,
+    n_samples: int = 1000,
+    random_state: int = 42,
+) -> float:
+    """
+    Measures how well a projection preserves the k-nearest neighborhoods.
+
+    Args:
+        full_values: Feature matrix before the projection.
+        projected_values: Feature matrix after the projection, row-aligned with full_values.
+        k: Number of neighbors to compare.
+        n_samples: Number of query rows, sampled uniformly. All rows are used if there are fewer.
+        random_state: Seed for the row sampling.
+
+    Returns:
+        The mean fraction of each sampled row's k nearest neighbors in the full space that are also
+        among its k nearest neighbors in the projected space.
+    """
+    n = full_values.shape[0]
+    k = min(k, n - 1)
+    if k < 1:
+        return 1.0
+    rng = np.random.default_rng(random_state)
+    sample = rng.choice(n, size=min(n_samples, n), replace=False)
+
+    full_neighbors = _sample_neighbors(full_values, sample, k)
+    projected_neighbors = _sample_neighbors(projected_values, sample, k)
+    overlaps = [len(np.intersect1d(a, b)) / k for a, b in zip(full_neighbors, projected_neighbors)]
+    return float(np.mean(overlaps))
+
+
+def _sample_neighbors(values: np.ndarray, sample: np.ndarray, k: int) -> np.ndarray:
+    """Return the k nearest neighbors of the sampled rows, excluding the rows themselves."""
+    nn = NearestNeighbors(n_neighbors=k + 1).fit(values)
+    _, indices = nn.kneighbors(values[sample])
+    # Duplicated rows may push the query row out of the first position, so drop it explicitly
+    neighbors = np.empty((len(sample), k), dtype=indices.dtype)
+    for row, (i, idx) in enumerate(zip(sample, indices)):
+        neighbors[row] = idx[idx != i][:k]
+    return neighbors
+
+
+def _make_projection(projection_method: str, projection_dim: int, random_state: int):
+    """Initialize the projection model."""
+    if projection_method == "pca":
+        from sklearn.decomposition import PCA
+        return PCA(n_components=projection_dim, svd_solver="randomized", random_state=random_state)
+    elif projection_method == "svd":
+        from sklearn.decomposition import TruncatedSVD
+        return TruncatedSVD(n_components=projection_dim, algorithm="randomized", random_state=random_state)
+    from sklearn.random_projection import SparseRandomProjection
+    return SparseRandomProjection(n_components=projection_dim, random_state=random_state)
+
+
+def _fingerprint(values: np.ndarray) -> str:
+    """Hash the feature matrix so that a cached projection is only reused on the same data."""
+    digest = hashlib.sha1(np.ascontiguousarray(values).data)
+    digest.update(str(values.shape).encode())
+    digest.update(str(values.dtype).encode())
+    return digest.hexdigest()
+
+
+def _load_cached_projection(cache_path: Optional[str], projection_method: str, projection_dim: int,
+                            numeric_columns: List[str], fingerprint: str) -> Optional[Dict[str, Any]]:
+    """Load a cached projection if it matches the current settings and data."""
+    if cache_path is None or not os.path.exists(cache_path):
+        return None
+    with open(cache_path, "rb") as f:
+        cached = pickle.load(f)
+    if (cached.get("method") == projection_method
+            and cached.get("dim") == projection_dim
+            and cached.get("columns") == list(numeric_columns)
+            and cached.get("fingerprint") == fingerprint):
+        return cached
+    return None
@@ -0,0 +1,245 @@
+import asyncio
+import datetime
+import pickle
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+INDEX_METHODS = ['kdtree', 'brute']
+# Number of distances computed at once by the brute-force search
+BRUTE_BLOCK_CELLS = 2**22
+
+
+class NeighborIndex:
+    """
+    Nearest-neighbor index over the feature rows of a graph, which can be saved next to it.
+
+    Row i of the index is node i of the graph built by create_graph. The index also keeps the
+    labels of some node attributes as integer codes, so that the label distribution of the
+    neighbors of a query is computed without loading the graph.
+
+    Parameters:
+    - values (np.ndarray): The feature matrix, one row per node.
+    - feature_columns (list): Names of the columns of values, in the preprocessed dataframe.
+    - method (str): 'kdtree' (scipy cKDTree) or 'brute' (exact blocked search, better for many dimensions).
+    - labels (dict, optional): Attribute name -> array of the label of each node.
+    """
+
+    def __init__(self, values: np.ndarray, feature_columns: List[str], method: str = 'kdtree',
+                 labels: Optional[Dict[str, Any]] = None):
+        if method not in INDEX_METHODS:
+            raise ValueError(f"Unsupported index method: {method}. Use one of {INDEX_METHODS}.")
+        self.values = np.ascontiguousarray(values, dtype=float)
+        if self.values.ndim != 2 or len(self.values) == 0:
+            raise ValueError("The index needs a non-empty 2D feature matrix.")
+        self.feature_columns = list(feature_columns)
+        self.method = method
+        self.tree = cKDTree(self.values) if method == 'kdtree' else None
+        self.squared_norms = (self.values ** 2).sum(axis=1) if method == 'brute' else None
+        # Labels are stored as codes into the sorted classes of each attribute
+        self.label_classes = {}
+        self.label_codes = {}
+        for attribute, values in (labels or {}).items():
+            values = pd.Series(np.asarray(values, dtype=object))
+            if len(values) != len(self.values):
+                raise ValueError(f"Labels of {attribute} must have one value per row.")
+            codes, classes = pd.factorize(values.astype(str).where(values.notna(), None), sort=True)
+            self.label_classes[attribute] = np.asarray(classes, dtype=object)
+            self.label_codes[attribute] = codes
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def query(self, points: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k nearest rows of each point.
+
+        Parameters:
+        - points (np.ndarray): Points of shape (m, d), or a single point of shape (d,).
+        - k (int): Number of neighbors; at most the number of rows.
+
+        Returns:
+        - tuple: (distances, indices), both of shape (m, k), sorted by increasing distance.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if points.shape[1] != self.values.shape[1]:
+            raise ValueError(f"Points must have {self.values.shape[1]} features, got {points.shape[1]}.")
+        if k < 1:
+            raise ValueError("k must be a positive integer.")
+        k = min(int(k), len(self.values))
+        if self.method == 'kdtree':
+            distances, indices = self.tree.query(points, k=k)
+            return distances.reshape(len(points), k), indices.reshape(len(points), k)
+
+        distances = np.empty((len(points), k))
+        indices = np.empty((len(points), k), dtype=np.int64)
+        block = max(1, BRUTE_BLOCK_CELLS // len(self.values))
+        for start in range(0, len(points), block):
+            chunk = points[start:start + block]
+            squared = (chunk ** 2).sum(axis=1)[:, None] - 2 * chunk @ self.values.T + self.squared_norms
+            nearest = np.argpartition(squared, k - 1, axis=1)[:, :k] if k < len(self.values) else \
+                np.tile(np.arange(k), (len(chunk), 1))
+            nearest_squared = np.take_along_axis(squared, nearest, axis=1)
+            order = np.argsort(nearest_squared, axis=1, kind='stable')
+            indices[start:start + len(chunk)] = np.take_along_axis(nearest, order, axis=1)
+            distances[start:start + len(chunk)] = np.sqrt(np.maximum(np.take_along_axis(nearest_squared, order, axis=1), 0))
+        return distances, indices
+
+    def label_counts(self, indices: np.ndarray) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Counts the labels of the neighbors of each query, with one bincount per attribute.
+
+        Parameters:
+        - indices (np.ndarray): Neighbor indices of shape (m, k), as returned by query.
+
+        Returns:
+        - dict: Attribute -> (classes, counts), counts of shape (m, len(classes)). Missing labels are not counted.
+        """
+        result = {}
+        for attribute, codes in self.label_codes.items():
+            classes = self.label_classes[attribute]
+            neighbor_codes = codes[indices]
+            rows = np.broadcast_to(np.arange(len(indices))[:, None], indices.shape)
+            valid = neighbor_codes >= 0
+            counts = np.bincount(rows[valid] * len(classes) + neighbor_codes[valid],
+                                 minlength=len(indices) * len(classes)).reshape(len(indices), len(classes))
+            result[attribute] = (classes, counts)
+        return result
+
+    def save(self, path: str, verbose: bool = False) -> None:
+        """Saves the index to a pickle file."""
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if verbose:
+            print(f"{datetime.datetime.now()}: Saved {self.method} neighbor index to {path}.")
+
+
+def load_index(path: str) -> NeighborIndex:
+    """Loads a NeighborIndex saved by NeighborIndex.save or create_graph."""
+    with open(path, 'rb') as f:
+        index = pickle.load(f)
+    if not isinstance(index, NeighborIndex):
+        raise ValueError(f"{path} does not contain a neighbor index.")
+    return index
+
+
+class AsyncNeighborQuery:
+    """
+    Asynchronous nearest-neighbor queries of new records, micro-batched.
+
+    Concurrent calls of query() are collected for up to max_delay seconds (or until max_batch_size
+    records are waiting) and answered together: the records are preprocessed as one DataFrame and
+    searched with one vectorized index query, in a worker thread so that the event loop is not blocked.
+    A record that fails (e.g. an unknown category) only fails its own request.
+
+    Parameters:
+    - index (NeighborIndex or str): The index, or the path of its pickle file.
+    - preprocessor (tagra.preprocessing.Preprocessor or str, optional): The fitted preprocessing, or
+      the path of its pickle file. If None, records must already be preprocessed.
+    - k (int): Default number of neighbors.
+    - max_batch_size (int): Maximum number of records answered together.
+    - max_delay (float): Maximum time, in seconds, a record waits for others before its batch starts.
+    """
+
+    def __init__(self, index, preprocessor=None, k: int = 5, max_batch_size: int = 256, max_delay: float = 0.002):
+        self.index = load_index(index) if isinstance(index, str) else index
+        if isinstance(preprocessor, str):
+            with open(preprocessor, 'rb') as f:
+                preprocessor = pickle.load(f)
+        self.preprocessor = preprocessor
+        self.k = k
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.batch_sizes = []
+        self._pending = []
+        self._timer = None
+
+    async def query(self, record: Dict[str, Any], k: Optional[int] = None) -> Dict[str, Any]:
+        """
+        The k nearest nodes of a record and the label distribution of its neighborhood.
+
+        Returns:
+        - dict: 'neighbors' (node indices), 'distances' and, if the index has labels,
+          'labels': attribute -> {label: fraction of the neighbors}.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((record, k or self.k, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def query_batch(self, records: List[Dict[str, Any]], k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Answers a list of records at once, synchronously."""
+        k = k or self.k
+        if self.preprocessor is not None:
+            preprocessed = self.preprocessor.transform(records)
+        else:
+            preprocessed = pd.DataFrame(list(records))
+        missing = [col for col in self.index.feature_columns
+                   if col not in preprocessed.columns or preprocessed[col].isna().any()]
+        if missing:
+            raise ValueError(f"The records lack the feature columns {missing}.")
+        distances, indices = self.index.query(preprocessed[self.index.feature_columns].to_numpy(dtype=float), k)
+        label_counts = self.index.label_counts(indices)
+        results = []
+        for i in range(len(indices)):
+            result = {'neighbors': indices[i].tolist(), 'distances': distances[i].tolist()}
+            if label_counts:
+                result['labels'] = _label_distributions(label_counts, i)
+            results.append(result)
+        return results
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        if batch:
+            self.batch_sizes.append(len(batch))
+            asyncio.get_running_loop().create_task(self._answer(batch))
+
+    async def _answer(self, batch) -> None:
+        loop = asyncio.get_running_loop()
+        k = max(request_k for _, request_k, _ in batch)
+        try:
+            results = await loop.run_in_executor(None, self.query_batch, [record for record, _, _ in batch], k)
+        except Exception:
+            # Answer the records one by one, so that a bad record only fails its own request
+            results = []
+            for record, _, _ in batch:
+                try:
+                    results.append(await loop.run_in_executor(None, self.query_batch, [record], k))
+                except Exception as e:
+                    results.append(e)
+            results = [result if isinstance(result, Exception) else result[0] for result in results]
+        for (_, request_k, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(_truncate(result, request_k, self.index) if request_k < k else result)
+
+
+def _truncate(result: Dict[str, Any], k: int, index: NeighborIndex) -> Dict[str, Any]:
+    """Keeps the first k neighbors of a result computed with more neighbors."""
+    neighbors = np.asarray(result['neighbors'][:k])
+    truncated = {'neighbors': neighbors.tolist(), 'distances': result['distances'][:k]}
+    if 'labels' in result:
+        truncated['labels'] = _label_distributions(index.label_counts(neighbors[None, :]), 0)
+    return truncated
+
+
+def _label_distributions(label_counts: Dict[str, Tuple[np.ndarray, np.ndarray]], i: int) -> Dict[str, Dict[str, float]]:
+    """Fractions of the labels among the neighbors of query i, for each attribute."""
+    return {attribute: {str(label): count / max(int(counts[i].sum()), 1)
+                        for label, count in zip(classes, counts[i].tolist()) if count > 0}
+            for attribute, (classes, counts) in label_counts.items()}
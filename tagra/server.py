@@ -0,0 +1,303 @@
+import datetime
+import json
+import pickle
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .analysis import load_graph
+from .context import AnalysisContext
+from .graph import get_feature_matrix
+from .kernels import start_threading_layer
+from .loader import load_dataframe
+from .query import NeighborIndex, load_index
+from .utils import probabilities_to_dict
+
+
+class TagraService:
+    """
+    Keeps a graph, its preprocessed data and a neighbor index in memory and answers queries on them.
+
+    Rows of the preprocessed data are the nodes of the graph, as built by create_graph. The methods are
+    safe to call from several threads: the memoized analysis results are computed under a lock and
+    the neighbor index is read-only.
+
+    Parameters:
+    - graph (networkx.Graph or str): The graph, or a path to its pickle file.
+    - preprocessed_dataframe (pd.DataFrame or str): The preprocessed data the graph was built from.
+    - numeric_columns (list, optional): Columns used for the neighbor search, as in create_graph.
+    - preprocessor (tagra.preprocessing.Preprocessor or str, optional): The fitted preprocessing, or a
+      path to its pickle file, needed to query the neighbors of new records.
+    - target_attribute (str, optional): Node attribute whose label distribution is returned with the neighbors.
+    - index (tagra.query.NeighborIndex or str, optional): A neighbor index of the rows, or the path of the
+      one saved by create_graph. If given, preprocessed_dataframe may be None.
+    """
+
+    def __init__(self, graph, preprocessed_dataframe=None, numeric_columns=None, preprocessor=None,
+                 target_attribute=None, index=None):
+        self.graph = load_graph(graph, verbose=False)
+        self.context = AnalysisContext(self.graph)
+        self.positions = {node: i for i, node in enumerate(self.context.nodes())}
+        if isinstance(index, str):
+            index = load_index(index)
+        if index is None:
+            if preprocessed_dataframe is None:
+                raise ValueError("Either preprocessed_dataframe or index must be provided.")
+            df = load_dataframe(preprocessed_dataframe, downcast=False)
+            index = NeighborIndex(*get_feature_matrix(df, numeric_columns))
+        if len(index) != self.graph.number_of_nodes():
+            raise ValueError(f"The index has {len(index)} rows but the graph has {self.graph.number_of_nodes()} nodes.")
+        self.index = index
+        self.feature_columns = index.feature_columns
+        if isinstance(preprocessor, str):
+            with open(preprocessor, 'rb') as f:
+                preprocessor = pickle.load(f)
+        self.preprocessor = preprocessor
+        self.target_attribute = target_attribute
+        self.lock = threading.Lock()
+        # The requests are answered in threads, which must not be the first to start numba's threads
+        start_threading_layer()
+
+    def neighbors(self, row) -> Dict[str, Any]:
+        """Neighbors of a row in the graph."""
+        node = self._node(row)
+        neighbors = sorted(self.graph.neighbors(node), key=str)
+        result = {'row': node, 'degree': len(neighbors), 'neighbors': neighbors}
+        if self.target_attribute is not None:
+            result['labels'] = self._label_counts(neighbors)
+        return result
+
+    def knn(self, records: Union[Dict[str, Any], List[Dict[str, Any]]], k: int = 5) -> Dict[str, Any]:
+        """
+        The k nearest rows of new records, after applying the fitted preprocessing.
+
+        Raises:
+            ValueError: If there is no preprocessor, or if the preprocessed records lack a feature column.
+        """
+        if self.preprocessor is None:
+            raise ValueError("No fitted preprocessor: the neighbors of new records cannot be computed.")
+        k = int(k)
+        if k < 1:
+            raise ValueError("k must be a positive integer.")
+        preprocessed = self.preprocessor.transform(records)
+        missing = [col for col in self.feature_columns if col not in preprocessed.columns or preprocessed[col].isna().any()]
+        if missing:
+            raise ValueError(f"The records lack the feature columns {missing}.")
+        distances, indices = self.index.query(preprocessed[self.feature_columns].to_numpy(dtype=float), k)
+        k = indices.shape[1]
+        nodes = self.context.nodes()
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            neighbors = [nodes[i] for i in row_indices]
+            result = {'neighbors': neighbors, 'distances': row_distances.tolist()}
+            if self.target_attribute is not None:
+                result['labels'] = self._label_counts(neighbors)
+            results.append(result)
+        return {'k': k, 'results': results}
+
+    def community(self, node) -> Dict[str, Any]:
+        """Girvan-Newman community of a node, with its size."""
+        node = self._node(node)
+        with self.lock:
+            communities = self.context.communities()
+            community_ids = self.context.community_ids()
+        community_id = int(community_ids[self.positions[node]])
+        return {'node': node, 'community': community_id, 'size': len(communities[community_id])}
+
+    def mixing(self, attribute: str) -> Dict[str, Any]:
+        """Neighbor mixing matrix and probabilities P(j|i) of an attribute."""
+        if not any(attribute in data for _, data in self.graph.nodes(data=True)):
+            raise KeyError(f"Attribute {attribute} not found.")
+        with self.lock:
+            labels, mixing = self.context.mixing(attribute)
+            probabilities = self.context.probabilities(attribute)
+        return {'attribute': attribute,
+                'labels': [str(label) for label in labels],
+                'mixing': mixing.tolist(),
+                'probabilities': {f"P({j}|{i})": p for (i, j), p in probabilities_to_dict(labels, probabilities).items()}}
+
+    def _node(self, value):
+        """Find a node from a query value, which may be the string form of an integer node."""
+        if value in self.graph:
+            return value
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            number = None
+        if number is not None and number in self.graph:
+            return number
+        raise KeyError(f"Node {value} not found.")
+
+    def _label_counts(self, nodes) -> Dict[str, int]:
+        labels = pd.Series([self.graph.nodes[node].get(self.target_attribute) for node in nodes], dtype=object)
+        return {str(label): int(count) for label, count in labels.value_counts(dropna=False).items()}
+
+
+def create_server(service: TagraService, host: str = '127.0.0.1', port: int = 0, verbose: bool = False) -> ThreadingHTTPServer:
+    """
+    Creates a threaded HTTP server answering JSON queries on a TagraService.
+
+    Endpoints:
+    - GET /health
+    - GET /neighbors?row=X: neighbors of a row in the graph.
+    - POST /knn with {"record": {...}} or {"records": [...]} and optional "k": nearest rows of new records.
+    - GET /community?node=X: community of a node.
+    - GET /mixing?attribute=Y: mixing matrix of an attribute.
+
+    Errors are returned as {"error": message} with status 400 (invalid query), 404 (unknown node or path)
+    or 500 (any other failure of the service).
+
+    Args:
+        service: The service answering the queries.
+        host: Address to bind.
+        port: Port to bind; 0 picks a free port, see server.server_address.
+        verbose: Whether to log the requests.
+
+    Returns:
+        The server; call serve_forever() to start it, e.g. in a thread.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+            routes = {
+                '/health': lambda: {'status': 'ok', 'nodes': service.graph.number_of_nodes(),
+                                    'edges': service.graph.number_of_edges()},
+                '/neighbors': lambda: service.neighbors(_required(query, 'row')),
+                '/community': lambda: service.community(_required(query, 'node')),
+                '/mixing': lambda: service.mixing(_required(query, 'attribute')),
+            }
+            self._answer(routes.get(url.path))
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path != '/knn':
+                self._answer(None)
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            except json.JSONDecodeError:
+                self._send(400, {'error': 'Invalid JSON body.'})
+                return
+            records = body.get('records', body.get('record'))
+            self._answer(lambda: service.knn(_required({'records': records}, 'records'), k=body.get('k', 5)))
+
+        def _answer(self, route):
+            if route is None:
+                self._send(404, {'error': f"Unknown path {self.path}."})
+                return
+            try:
+                self._send(200, route())
+            except KeyError as e:
+                self._send(404, {'error': str(e.args[0]) if e.args else str(e)})
+            except ValueError as e:
+                self._send(400, {'error': str(e)})
+            except Exception as e:
+                # Any other failure is a bug of the service: answer it instead of dropping the connection
+                self._send(500, {'error': f"{type(e).__name__}: {e}"})
+
+        def _send(self, status, content):
+            body = json.dumps(content, default=_json_default).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if verbose:
+                print(f"{datetime.datetime.now()}: {self.address_string()} {format % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(service: TagraService, host: str = '127.0.0.1', port: int = 8000, verbose: bool = True) -> None:
+    """Serves a TagraService until interrupted."""
+    server = create_server(service, host, port, verbose=verbose)
+    if verbose:
+        print(f"{datetime.datetime.now()}: Serving {service.graph.number_of_nodes()} nodes on "
+              f"http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def service_from_pipeline(results: Dict[str, Any], config: Dict[str, Any]) -> TagraService:
+    """Builds a TagraService from the results of the stages of tagra.pipeline.build_pipeline."""
+    preprocessed = results['preprocess']
+    target_attribute = config['target_columns']
+    if isinstance(target_attribute, list):
+        target_attribute = target_attribute[0] if len(target_attribute) == 1 or config['multi_target'] else str(tuple(target_attribute))
+    return TagraService(results['graph'].graph, preprocessed['dataframe'],
+                        numeric_columns=preprocessed['numeric_columns'],
+                        # New records cannot be projected, so they are only supported without projection
+                        preprocessor=preprocessed['preprocessor'] if preprocessed['projection_info'] is None else None,
+                        target_attribute=target_attribute)
+
+
+class TagraClient:
+    """
+    Client of a TaGra server.
+
+    Parameters:
+    - url (str): Base URL of the server, e.g. 'http://127.0.0.1:8000'.
+    - timeout (float): Timeout of each request, in seconds.
+
+    Methods raise ValueError with the server's message when a query fails.
+    """
+
+    def __init__(self, url: str, timeout: float = 10):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def health(self) -> Dict[str, Any]:
+        return self._request('/health')
+
+    def neighbors(self, row) -> Dict[str, Any]:
+        return self._request('/neighbors', {'row': row})
+
+    def knn(self, records: Union[Dict[str, Any], List[Dict[str, Any]]], k: int = 5) -> Dict[str, Any]:
+        return self._request('/knn', body={'records': records, 'k': k})
+
+    def community(self, node) -> Dict[str, Any]:
+        return self._request('/community', {'node': node})
+
+    def mixing(self, attribute: str) -> Dict[str, Any]:
+        return self._request('/mixing', {'attribute': attribute})
+
+    def _request(self, path: str, query: Optional[Dict[str, Any]] = None, body: Optional[Dict[str, Any]] = None):
+        url = self.url + path + ('?' + urllib.parse.urlencode(query) if query else '')
+        data = json.dumps(body, default=_json_default).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise ValueError(json.loads(e.read()).get('error', str(e))) from None
+
+
+def _required(query: Dict[str, Any], key: str):
+    if query.get(key) is None:
+        raise ValueError(f"Missing parameter '{key}'.")
+    return query[key]
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
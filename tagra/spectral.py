@@ -0,0 +1,223 @@
+import datetime
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import LinearOperator, eigsh, lobpcg
+
+from .context import AnalysisContext
+from .kernels import adjacency_csr
+
+
+SPECTRAL_METHODS = ['eigsh', 'lobpcg']
+# Below this number of nodes the spectrum is computed with a dense eigendecomposition
+DENSE_MAX_NODES = 500
+# Eigenvalues of the normalized Laplacian below this value are counted as zero
+ZERO_EIGENVALUE_TOL = 1e-6
+# Extra vectors of the LOBPCG block, which keep it stable when eigenvalues are repeated (several components)
+LOBPCG_GUARD_VECTORS = 4
+
+
+def normalized_laplacian(sources, targets, n_nodes):
+    """
+    Builds the sparse normalized Laplacian I - D^-1/2 A D^-1/2 of a graph from its edge arrays.
+
+    Directed edges are taken as undirected, and the diagonal of isolated nodes is 0, as in
+    networkx.normalized_laplacian_matrix.
+
+    Parameters:
+    - sources, targets (np.ndarray): Edge endpoints as node positions, see tagra.utils.graph_edge_arrays.
+    - n_nodes (int): Number of nodes.
+
+    Returns:
+    - scipy.sparse.csr_matrix: The (n_nodes, n_nodes) Laplacian.
+    """
+    adjacency = _adjacency_matrix(sources, targets, n_nodes)
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    scaling = sparse.diags(_inverse_sqrt(degrees))
+    return (sparse.diags((degrees > 0).astype(float)) - scaling @ adjacency @ scaling).tocsr()
+
+
+def laplacian_spectrum(graph, n_eigenvalues=6, method='eigsh', tol=0, random_state=0):
+    """
+    Computes the smallest eigenvalues of the normalized Laplacian and their eigenvectors.
+
+    The eigenvalues lie in [0, 2]; the multiplicity of 0 is the number of connected components. The
+    smallest eigenvalues of the Laplacian are the largest of the normalized adjacency D^-1/2 A D^-1/2,
+    which Lanczos ('eigsh') and LOBPCG ('lobpcg') find in a few sparse products. A single Lanczos
+    start vector cannot tell the copies of a repeated eigenvalue apart, so the eigenvectors of 0, known
+    from the connected components, are set directly and projected out of the operator. Graphs of at
+    most DENSE_MAX_NODES nodes are decomposed densely.
+
+    Parameters:
+    - graph (networkx.Graph or tagra.context.AnalysisContext): The graph, or its context to reuse its edge arrays.
+    - n_eigenvalues (int): Number of eigenpairs.
+    - method (str): 'eigsh' or 'lobpcg'.
+    - tol (float): Relative accuracy of the eigenvalues; 0 for machine precision with 'eigsh'.
+    - random_state (int): Seed of the starting vectors.
+
+    Returns:
+    - (np.ndarray, np.ndarray): The eigenvalues in increasing order and the (n_nodes, n_eigenvalues)
+      unit eigenvectors, each with its largest entry positive.
+    """
+    adjacency = _graph_adjacency(graph)
+    return _smallest_eigenpairs(adjacency, n_eigenvalues, method, tol, random_state)
+
+
+def spectral_metrics(graph, n_eigenvalues=6, method='eigsh', verbose=True):
+    """
+    Summarizes the Laplacian spectrum of a graph, to judge how well it separates into clusters.
+
+    Parameters:
+    - graph (networkx.Graph or tagra.context.AnalysisContext): The graph.
+    - n_eigenvalues (int): Number of eigenvalues computed, see laplacian_spectrum.
+    - method (str): 'eigsh' or 'lobpcg'.
+    - verbose (bool): Whether to print progress messages.
+
+    Returns:
+    - (dict, dict): The metrics 'spectral_eigenvalues', 'zero_eigenvalues' (eigenvalues below
+      ZERO_EIGENVALUE_TOL, one per connected component up to n_eigenvalues), 'spectral_gap' (the
+      smallest nonzero eigenvalue, None if all are zero), 'eigengap_clusters' (number of eigenvalues
+      before the largest gap between consecutive ones, the number of clusters it suggests) and
+      'spectral_seconds'; and the per-node column 'fiedler', the eigenvector of the second smallest
+      eigenvalue.
+    """
+    start = time.perf_counter()
+    if verbose:
+        print(f"{datetime.datetime.now()}: Computing the {n_eigenvalues} smallest Laplacian eigenvalues ({method})...")
+    eigenvalues, eigenvectors = laplacian_spectrum(graph, n_eigenvalues, method=method)
+    nonzero = eigenvalues[eigenvalues >= ZERO_EIGENVALUE_TOL]
+    metrics = {
+        'spectral_eigenvalues': eigenvalues.tolist(),
+        'zero_eigenvalues': int(np.sum(eigenvalues < ZERO_EIGENVALUE_TOL)),
+        'spectral_gap': float(nonzero[0]) if len(nonzero) else None,
+        'eigengap_clusters': int(np.argmax(np.diff(eigenvalues)) + 1) if len(eigenvalues) > 1 else len(eigenvalues),
+        'spectral_seconds': time.perf_counter() - start,
+    }
+    columns = {'fiedler': eigenvectors[:, 1]} if eigenvectors.shape[1] > 1 else {}
+    return metrics, columns
+
+
+def spectral_embedding(graph, dim=2, method='eigsh', regularization=0.1, random_state=0, verbose=True):
+    """
+    Places the nodes of a graph with the leading nontrivial eigenvectors of its normalized Laplacian.
+
+    The coordinates are the eigenvectors scaled by D^-1/2, as in Laplacian eigenmaps. On a graph with
+    several components the first eigenvectors would only tell the components apart, so a weight of
+    regularization * mean degree / n_nodes is added between every pair of nodes (regularized spectral
+    clustering): the components stay apart while the nodes within each one are spread out. The
+    all-pairs term is applied as a rank-one update, so the operator stays sparse.
+
+    Parameters:
+    - graph (networkx.Graph or tagra.context.AnalysisContext): The graph.
+    - dim (int): Number of coordinates.
+    - method (str): 'eigsh' or 'lobpcg'.
+    - regularization (float): Weight of the all-pairs term, relative to the mean degree; 0 for none.
+    - random_state (int): Seed of the starting vectors.
+    - verbose (bool): Whether to print progress messages.
+
+    Returns:
+    - np.ndarray: An (n_nodes, dim) array of positions, in the order of the nodes of the graph, which
+      can be passed as pos to analyze_graph.
+    """
+    start = time.perf_counter()
+    adjacency = _graph_adjacency(graph)
+    n_nodes = adjacency.shape[0]
+    if n_nodes == 0:
+        return np.zeros((0, dim))
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    tau = regularization * degrees.mean() if degrees.any() else 0.0
+    _, eigenvectors = _smallest_eigenpairs(adjacency, min(dim + 1, n_nodes), method, 0, random_state, tau=tau)
+    positions = eigenvectors[:, 1:] * _inverse_sqrt(degrees + tau)[:, None]
+    positions = np.pad(positions, ((0, 0), (0, dim - positions.shape[1])))
+    if verbose:
+        print(f"{datetime.datetime.now()}: Spectral embedding of {n_nodes} nodes in {time.perf_counter() - start:.2f}s.")
+    return positions
+
+
+def _graph_adjacency(graph):
+    context = graph if isinstance(graph, AnalysisContext) else AnalysisContext(graph)
+    sources, targets = context.edge_arrays()
+    return _adjacency_matrix(sources, targets, len(context.nodes()))
+
+
+def _adjacency_matrix(sources, targets, n_nodes):
+    """Symmetric sparse adjacency; reciprocal directed edges add up."""
+    indptr, indices = adjacency_csr(sources, targets, n_nodes)
+    adjacency = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n_nodes, n_nodes))
+    adjacency.sum_duplicates()
+    return adjacency
+
+
+def _inverse_sqrt(degrees):
+    return np.divide(1.0, np.sqrt(degrees), out=np.zeros(len(degrees)), where=degrees > 0)
+
+
+def _smallest_eigenpairs(adjacency, n_eigenvalues, method, tol, random_state, tau=0.0):
+    """
+    Smallest eigenpairs of the normalized Laplacian of adjacency + tau / n_nodes on every pair, from the
+    largest eigenpairs of the normalized adjacency.
+    """
+    if method not in SPECTRAL_METHODS:
+        raise ValueError(f"Unsupported spectral method: {method}. Choose from {SPECTRAL_METHODS}")
+    n_nodes = adjacency.shape[0]
+    k = min(n_eigenvalues, n_nodes)
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel() + tau
+    scaling = _inverse_sqrt(degrees)
+    normalized = sparse.diags(scaling) @ adjacency @ sparse.diags(scaling)
+    # Isolated nodes are components of their own, with eigenvalue 0 as in networkx
+    normalized = (normalized + sparse.diags((degrees == 0).astype(float))).tocsr()
+    pair_weight = scaling * np.sqrt(tau / n_nodes)
+
+    if n_nodes <= DENSE_MAX_NODES or k >= n_nodes - 1:
+        dense = normalized.toarray() + np.outer(pair_weight, pair_weight)
+        values, vectors = np.linalg.eigh(dense)
+        values, vectors = values[::-1][:k], vectors[:, ::-1][:, :k]
+    else:
+        # The all-pairs term connects every node, so the graph has components only without it
+        kernel = _component_vectors(adjacency, degrees, k) if tau == 0 else np.zeros((n_nodes, 0))
+        n_free = k - kernel.shape[1]
+
+        def product(x):
+            # Shifted by 2 so that the eigenvalues left lie in [1, 3], above the 0 of the projected-out space
+            y = x - kernel @ (kernel.T @ x)
+            y = normalized @ y + np.multiply.outer(pair_weight, pair_weight @ y) + 2 * y
+            return y - kernel @ (kernel.T @ y)
+
+        values, vectors = np.ones(kernel.shape[1]), kernel
+        if n_free > 0:
+            operator = LinearOperator((n_nodes, n_nodes), dtype=float, matvec=product, matmat=product)
+            rng = np.random.default_rng(random_state)
+            if method == 'eigsh':
+                free_values, free_vectors = eigsh(operator, n_free, which='LA', tol=tol,
+                                                  v0=rng.uniform(-1, 1, n_nodes))
+            else:
+                block = min(k + LOBPCG_GUARD_VECTORS, n_nodes // 2)
+                start = rng.normal(size=(n_nodes, block))
+                free_values, free_vectors = lobpcg(operator, start - kernel @ (kernel.T @ start), largest=True,
+                                                   tol=tol or None, maxiter=500)
+            order = np.argsort(free_values)[::-1][:n_free]
+            values = np.concatenate([values, free_values[order] - 2])
+            vectors = np.column_stack([vectors, free_vectors[:, order]])
+    # Deterministic signs: the largest entry of each eigenvector is positive
+    signs = np.sign(vectors[np.abs(vectors).argmax(axis=0), np.arange(vectors.shape[1])])
+    return np.clip(1 - values, 0, 2), vectors * np.where(signs == 0, 1, signs)
+
+
+def _component_vectors(adjacency, degrees, max_vectors):
+    """
+    Orthonormal eigenvectors of eigenvalue 1 of the normalized adjacency, one per connected component
+    (sqrt of the degrees on the component, the indicator of an isolated node), for the max_vectors
+    largest components.
+    """
+    n_components, component = connected_components(adjacency, directed=False)
+    weights = np.where(degrees > 0, np.sqrt(degrees), 1.0)
+    norms = np.sqrt(np.bincount(component, weights=weights ** 2, minlength=n_components))
+    order = np.argsort(-np.bincount(component, minlength=n_components), kind='stable')
+    rank = np.empty(n_components, dtype=np.int64)
+    rank[order] = np.arange(n_components)
+    kept = rank[component] < max_vectors
+    kernel = np.zeros((len(degrees), min(n_components, max_vectors)))
+    kernel[np.flatnonzero(kept), rank[component[kept]]] = weights[kept] / norms[component[kept]]
+    return kernel
@@ -0,0 +1,210 @@
+import datetime
+import json
+import os
+from typing import List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+
+FEATURE_STORE_EXTENSION = '.features'
+FEATURES_FILENAME = 'features.npy'
+METADATA_FILENAME = 'metadata.json'
+COLUMNS_DIRECTORY = 'columns'
+# Rows written to each Parquet partition of the non-feature columns
+ROWS_PER_PARTITION = 1_000_000
+FORMAT_VERSION = 1
+
+
+def is_feature_store(path) -> bool:
+    """Whether path names a feature store directory (by its extension)."""
+    return isinstance(path, str) and path.rstrip('/').endswith(FEATURE_STORE_EXTENSION)
+
+
+def save_feature_store(
+    df: pd.DataFrame,
+    path: str,
+    feature_columns: Optional[List[str]] = None,
+    dtype: str = 'float32',
+    rows_per_partition: int = ROWS_PER_PARTITION,
+    overwrite: bool = True,
+    verbose: bool = False,
+) -> str:
+    """
+    Saves a preprocessed DataFrame as a feature store, a directory that is opened without parsing.
+
+    The store holds:
+    - features.npy: the feature columns as one C-order matrix of type dtype, opened with memory mapping;
+    - metadata.json: the columns, their dtypes and the partitions;
+    - columns/part-NNNNN.parquet: the other columns (e.g. targets and one-hot indicators) and the index,
+      in partitions of rows_per_partition rows.
+
+    Args:
+        df: The preprocessed DataFrame.
+        path: Directory of the store; it must end with '.features'.
+        feature_columns: Columns stored in the feature matrix. Defaults to all numeric columns, the
+            columns tagra.graph.get_feature_matrix uses by default.
+        dtype: Type of the feature matrix, 'float32' or 'float64'.
+        rows_per_partition: Rows of each Parquet partition.
+        overwrite: Whether to replace an existing store.
+        verbose: Whether to print progress messages.
+
+    Returns:
+        The path of the store.
+
+    Raises:
+        ValueError: If the path or the dtype is invalid, or if the store exists and overwrite is False.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if not is_feature_store(path):
+        raise ValueError(f"Invalid feature store path: {path}. Must end with '{FEATURE_STORE_EXTENSION}'.")
+    if dtype not in ('float32', 'float64'):
+        raise ValueError(f"Unsupported feature store dtype: {dtype}. Choose 'float32' or 'float64'.")
+    if os.path.exists(path):
+        if not overwrite:
+            raise ValueError(f"Feature store {path} already exists.")
+        for root, _, files in os.walk(path, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            os.rmdir(root)
+    os.makedirs(os.path.join(path, COLUMNS_DIRECTORY))
+
+    if feature_columns is None:
+        feature_columns = df.select_dtypes(include=['number']).columns.tolist()
+    other_columns = [col for col in df.columns if col not in set(feature_columns)]
+
+    # The matrix is filled column by column, so no second in-memory copy of the features is made
+    features = np.lib.format.open_memmap(os.path.join(path, FEATURES_FILENAME), mode='w+', dtype=dtype,
+                                         shape=(len(df), len(feature_columns)))
+    for j, col in enumerate(feature_columns):
+        features[:, j] = df[col].to_numpy(dtype=dtype)
+    features.flush()
+    del features
+
+    partitions = []
+    for start in range(0, max(len(df), 1), rows_per_partition):
+        partition = os.path.join(COLUMNS_DIRECTORY, f"part-{len(partitions):05d}.parquet")
+        table = pa.Table.from_pandas(df.iloc[start:start + rows_per_partition][other_columns], preserve_index=True)
+        pq.write_table(table, os.path.join(path, partition))
+        partitions.append(partition)
+
+    metadata = {
+        'format_version': FORMAT_VERSION,
+        'n_rows': len(df),
+        'dtype': dtype,
+        'columns': [str(col) for col in df.columns],
+        'feature_columns': [str(col) for col in feature_columns],
+        'other_columns': [str(col) for col in other_columns],
+        'column_dtypes': {str(col): str(df[col].dtype) for col in df.columns},
+        'partitions': partitions,
+    }
+    with open(os.path.join(path, METADATA_FILENAME), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    if verbose:
+        print(f"{datetime.datetime.now()}: Saved feature store to {path} ({len(df)} rows, "
+              f"{len(feature_columns)} {dtype} features, {len(partitions)} column partitions).")
+    return path
+
+
+class FeatureStore:
+    """
+    A feature store saved by save_feature_store.
+
+    The feature matrix is memory mapped: opening the store reads only the metadata, and the rows are
+    paged in from disk when they are used, so several processes share one copy in the page cache.
+
+    Args:
+        path: Directory of the store.
+        mmap_mode: Memory mapping mode of the feature matrix, see numpy.load ('r' for read-only).
+
+    Attributes:
+        features: The (n_rows, n_features) memory-mapped feature matrix.
+        feature_columns: Names of the feature matrix columns.
+        other_columns: Columns stored in the Parquet partitions.
+        columns: All the columns, in the order of the saved DataFrame.
+    """
+
+    def __init__(self, path: str, mmap_mode: Optional[str] = 'r'):
+        metadata_path = os.path.join(path, METADATA_FILENAME)
+        if not os.path.exists(metadata_path):
+            raise ValueError(f"{path} is not a feature store: {METADATA_FILENAME} not found.")
+        with open(metadata_path) as f:
+            self.metadata = json.load(f)
+        self.path = path
+        self.features = np.load(os.path.join(path, FEATURES_FILENAME), mmap_mode=mmap_mode)
+        self.feature_columns = self.metadata['feature_columns']
+        self.other_columns = self.metadata['other_columns']
+        self.columns = self.metadata['columns']
+
+    def __len__(self) -> int:
+        return self.metadata['n_rows']
+
+    @property
+    def shape(self):
+        return (len(self), len(self.columns))
+
+    def feature_matrix(self, columns: Optional[List[str]] = None, dtype: Optional[str] = None) -> np.ndarray:
+        """
+        Returns feature columns as a matrix.
+
+        The whole matrix, in its stored type, is returned without a copy (the memory map itself);
+        a subset or reordering of the columns, or another dtype, is copied.
+
+        Args:
+            columns: Feature columns to return. Defaults to all of them.
+            dtype: Type of the matrix. Defaults to the stored type.
+
+        Raises:
+            ValueError: If a column is not a feature column.
+        """
+        values = self.features
+        if columns is not None and list(columns) != self.feature_columns:
+            missing = [col for col in columns if col not in self.feature_columns]
+            if missing:
+                raise ValueError(f"Columns {missing} are not feature columns of the store.")
+            position = {col: j for j, col in enumerate(self.feature_columns)}
+            values = np.ascontiguousarray(values[:, [position[col] for col in columns]])
+        if dtype is not None and values.dtype != np.dtype(dtype):
+            values = np.ascontiguousarray(values, dtype=dtype)
+        return values
+
+    @property
+    def index(self) -> pd.Index:
+        """Row index of the saved DataFrame."""
+        return self.read_columns([]).index
+
+    def read_columns(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Reads non-feature columns from the Parquet partitions.
+
+        Args:
+            columns: Columns to read. Defaults to all the non-feature columns.
+        """
+        columns = self.other_columns if columns is None else list(columns)
+        parts = [pd.read_parquet(os.path.join(self.path, partition), columns=columns)
+                 for partition in self.metadata['partitions']]
+        return pd.concat(parts) if len(parts) > 1 else parts[0]
+
+    def to_dataframe(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Loads columns of the store as a DataFrame, in the order of the saved DataFrame.
+
+        Args:
+            columns: Columns to load. Defaults to all of them.
+        """
+        columns = self.columns if columns is None else [col for col in self.columns if col in set(columns)]
+        features = [col for col in columns if col in set(self.feature_columns)]
+        df = self.read_columns([col for col in columns if col not in set(features)])
+        if features:
+            values = pd.DataFrame(self.feature_matrix(features), columns=features, index=df.index)
+            df = pd.concat([df, values], axis=1)
+        return df[columns]
+
+
+def open_feature_store(store: Union[str, FeatureStore], mmap_mode: Optional[str] = 'r') -> FeatureStore:
+    """Opens a feature store from its path; a FeatureStore is returned as it is."""
+    if isinstance(store, FeatureStore):
+        return store
+    return FeatureStore(store, mmap_mode=mmap_mode)
@@ -4,6 +4,8 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import pdb
+from .community import community_assignment, community_composition, community_mixing_matrix
+from .kernels import adjacency_csr, neighbor_label_counts
 
 plt.rcParams.update({
     'font.size': 22,  # General font size
@@ -15,7 +17,7 @@ plt.rcParams.update({
     'figure.titlesize': 26  # Figure title font size
     })
 
-def analyze_neighborhood_attributes(graph, target_attribute, return_probs=False):
+def analyze_neighborhood_attributes(graph, target_attribute, return_probs=False, context=None):
     """
     Analyzes attributes in the neighborhoods of each node in a graph, optionally returning probabilities.
 
@@ -23,60 +25,172 @@ def analyze_neighborhood_attributes(graph, target_attribute, return_probs=False)
     - graph (networkx.Graph): The input graph.
     - attribute_name (str): The name of the node attribute to analyze.
     - return_probs (bool): If True, returns the probability of each attribute in the neighborhood.
+    - context (tagra.context.AnalysisContext, optional): Context of graph, to reuse its adjacency and labels.
 
     Returns:
     - pd.DataFrame: A DataFrame with each row representing a node. Columns include the node's attribute,
                     degree, and either the count or probability of each attribute in its neighborhood.
     """
-    NONE_STR = 'None'
-    unique_attributes = set([graph.nodes[n].get(target_attribute, NONE_STR) for n in graph.nodes])
-    # unique_attributes = set(nx.get_node_attributes(graph, target_attribute).values())
-    data = []
-    for node in graph.nodes:
-        neighbors = list(graph.neighbors(node))
-        neighbor_attrs = [graph.nodes[n].get(target_attribute, NONE_STR) for n in neighbors]
-
-        attr_counts = {}
-        attr_counts[f"node_{target_attribute}"] = graph.nodes[node].get(target_attribute, NONE_STR)
-        attr_counts["node_index"] = node
-        attr_counts["degree"] = len(neighbors)
-
-        for attr in unique_attributes:
-            if return_probs and attr_counts["degree"] > 0:
-                attr_counts[f"p_{attr}"] = neighbor_attrs.count(attr) / attr_counts["degree"]
-            else:
-                attr_counts[f"n_{attr}"] = neighbor_attrs.count(attr)
-
-        data.append(attr_counts)
-
-    cols = ["node_index", f"node_{target_attribute}", "degree"] + \
-           [f"{'p' if return_probs else 'n'}_{attr}" for attr in unique_attributes]
-    df = pd.DataFrame(data, columns=cols)
+    nodes = context.nodes() if context is not None else list(graph.nodes)
+    codes, labels = context.label_codes(target_attribute) if context is not None else node_label_codes(graph, target_attribute)
+    if context is not None:
+        indptr, indices = context.adjacency()
+    else:
+        sources, targets = graph_edge_arrays(graph)
+        indptr, indices = adjacency_csr(sources, targets, len(nodes), directed=graph.is_directed())
+    if graph.is_multigraph():
+        # Parallel edges lead to the same neighbor
+        rows = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+        keep = np.r_[True, (rows[1:] != rows[:-1]) | (indices[1:] != indices[:-1])]
+        indptr = np.r_[0, np.cumsum(np.bincount(rows[keep], minlength=len(nodes)))]
+        indices = indices[keep]
+    # One pass over the adjacency, with the compiled kernel when numba is installed
+    counts = neighbor_label_counts(indptr, indices, codes, len(labels))
+    degree = np.diff(indptr)
+
+    prefix = 'p' if return_probs else 'n'
+    df = pd.DataFrame({"node_index": nodes, f"node_{target_attribute}": labels[codes], "degree": degree})
+    code_of = {label: code for code, label in enumerate(labels)}
+    for attr in set(labels):
+        column = counts[:, code_of[attr]]
+        if return_probs:
+            column = np.divide(column, degree, out=np.full(len(nodes), np.nan), where=degree > 0)
+        df[f"{prefix}_{attr}"] = column
 
     return df
 
+def graph_edge_arrays(graph):
+    """
+    Returns the edges of a graph as two integer arrays of node positions.
+
+    Parameters:
+    - graph (networkx.Graph): The input graph.
+
+    Returns:
+    - (np.ndarray, np.ndarray): Source and target positions of each edge, where the position of a node
+                                is its index in list(graph.nodes).
+    """
+    position = {node: i for i, node in enumerate(graph.nodes)}
+    edges = np.fromiter((position[n] for edge in graph.edges() for n in edge), dtype=np.int64,
+                        count=2 * graph.number_of_edges()).reshape(-1, 2)
+    return edges[:, 0], edges[:, 1]
+
+def node_label_codes(graph, target_attribute):
+    """
+    Encodes the target attribute of each node as an integer code.
+
+    Parameters:
+    - graph (networkx.Graph): The input graph.
+    - target_attribute (str): The name of the node attribute to encode. Missing values are encoded as 'None'.
+
+    Returns:
+    - (np.ndarray, np.ndarray): The code of each node, in list(graph.nodes) order, and the label of each code,
+                                in order of first appearance.
+    """
+    NONE_STR = 'None'
+    values = pd.Series([graph.nodes[n].get(target_attribute, NONE_STR) for n in graph.nodes], dtype=object)
+    codes, labels = pd.factorize(values, use_na_sentinel=False)
+    return codes, np.asarray(labels, dtype=object)
+
+def mixing_matrix(codes, sources, targets, n_labels):
+    """
+    Counts, for each pair of labels (i, j), the neighbors with label j of the nodes with label i.
+
+    Each undirected edge is counted in both directions and a self-loop once, so that row i sums to the
+    total degree of the nodes with label i, as in analyze_neighborhood_attributes.
+
+    Parameters:
+    - codes (np.ndarray): Integer label code of each node.
+    - sources, targets (np.ndarray): Edge endpoints as node positions, see graph_edge_arrays.
+    - n_labels (int): Number of distinct codes.
+
+    Returns:
+    - np.ndarray: An (n_labels, n_labels) integer matrix.
+    """
+    code_sources, code_targets = codes[sources], codes[targets]
+    not_loop = sources != targets
+    counts = np.bincount(code_sources * n_labels + code_targets, minlength=n_labels * n_labels)
+    counts += np.bincount(code_targets[not_loop] * n_labels + code_sources[not_loop], minlength=n_labels * n_labels)
+    return counts.reshape(n_labels, n_labels)
+
+def stacked_mixing_matrices(codes, sources, targets, n_labels):
+    """
+    Computes the mixing matrices of several attributes with a single pass over the edges.
+
+    The attribute codes are stacked in one (nodes, attributes) matrix and each attribute is given its own
+    block of flat cell ids, so that one bincount counts every matrix at once. The counting convention is
+    the one of mixing_matrix.
+
+    Parameters:
+    - codes (np.ndarray or list): An (n_nodes, n_attributes) matrix of integer codes, or one code array per attribute.
+    - sources, targets (np.ndarray): Edge endpoints as node positions, see graph_edge_arrays.
+    - n_labels (list): Number of distinct codes of each attribute.
+
+    Returns:
+    - list: One (n_labels[a], n_labels[a]) integer matrix per attribute.
+    """
+    stacked = np.column_stack(codes).astype(np.int64) if isinstance(codes, list) else np.asarray(codes, dtype=np.int64)
+    n_labels = np.asarray(n_labels, dtype=np.int64)
+    sizes = n_labels * n_labels
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    total = int(sizes.sum())
+
+    # (edges, attributes) matrices of flat cell ids, shifted into each attribute's block
+    code_sources, code_targets = stacked[sources], stacked[targets]
+    not_loop = sources != targets
+    counts = np.bincount((offsets + code_sources * n_labels + code_targets).ravel(), minlength=total)
+    counts += np.bincount((offsets + code_targets[not_loop] * n_labels + code_sources[not_loop]).ravel(), minlength=total)
+    return [counts[o:o + s].reshape(c, c) for o, s, c in zip(offsets, sizes, n_labels)]
+
+def neighbor_mixing_matrix(graph, target_attribute):
+    """
+    Computes the label mixing matrix of a graph with a single pass over its edges.
+
+    Returns:
+    - (np.ndarray, np.ndarray): The labels and the mixing matrix, see mixing_matrix.
+    """
+    codes, labels = node_label_codes(graph, target_attribute)
+    sources, targets = graph_edge_arrays(graph)
+    return labels, mixing_matrix(codes, sources, targets, len(labels))
+
+def mixing_probabilities(mixing):
+    """
+    Row-normalizes a mixing matrix: entry (i, j) is P(j|i), the probability that a neighbor of a node
+    with label i has label j. Rows of labels with no neighbors are 0.
+    """
+    totals = mixing.sum(axis=1, keepdims=True)
+    return np.divide(mixing, totals, out=np.zeros(mixing.shape, dtype=float), where=totals > 0)
+
+def probabilities_to_dict(labels, prob_matrix):
+    """Convert a probability matrix to the {(label_i, label_j): P(j|i)} dictionary returned by print_neighbors_prob."""
+    return {(label_i, label_j): prob_matrix[i, j]
+            for i, label_i in enumerate(labels) for j, label_j in enumerate(labels)}
+
 def print_neighbors_prob(df_neigh, label_col):
-    # pdb.set_trace()
-    probabilities = {}
-    for label_i in df_neigh[f'node_{label_col}'].unique():
-        nodes_with_label_i = df_neigh[df_neigh[f'node_{label_col}'] == label_i]
-        total_degree_i = nodes_with_label_i['degree'].sum()
-        for label_j in df_neigh[f'node_{label_col}'].unique():
-            col_name = f'n_{label_j}'
-            total_neighbors_with_label_j = nodes_with_label_i[col_name].sum()
-            probabilities[(label_i, label_j)] = total_neighbors_with_label_j / total_degree_i if total_degree_i else 0
-
-    return probabilities
+    labels = df_neigh[f'node_{label_col}'].unique()
+    # One grouped sum over the neighbor counts instead of one boolean mask per pair of labels
+    totals = df_neigh.groupby(f'node_{label_col}', sort=False, dropna=False)[['degree'] + [f'n_{label}' for label in labels]].sum()
+    totals = totals.loc[labels]
+    mixing = totals[[f'n_{label}' for label in labels]].to_numpy()
+    degree = totals['degree'].to_numpy()[:, None]
+    prob_matrix = np.divide(mixing, degree, out=np.zeros(mixing.shape, dtype=float), where=degree > 0)
+    return probabilities_to_dict(labels, prob_matrix)
 
 def heat_map_prob(probabilities, df_neigh, label_col, prob_heatmap_path, verbose):
+    labels = list(df_neigh[f'node_{label_col}'].unique())
+    position = {label: i for i, label in enumerate(labels)}
+    prob_matrix = np.zeros((len(labels), len(labels)))
+    for (i, j), prob in probabilities.items():
+        prob_matrix[position[i], position[j]] = prob
+    heat_map_mixing(labels, prob_matrix, prob_heatmap_path, verbose)
 
-    # Convert labels to string for better handling
-    labels = sorted([str(label) for label in df_neigh[f'node_{label_col}'].unique()])
-    probabilities = {(str(k[0]), str(k[1])): v for k, v in probabilities.items()}
-    prob_matrix = pd.DataFrame(index=labels, columns=labels, data=0.0)
+def heat_map_mixing(labels, prob_matrix, prob_heatmap_path, verbose):
 
-    for (i, j), prob in probabilities.items():
-        prob_matrix.loc[i, j] = prob
+    # Convert labels to string for better handling
+    str_labels = [str(label) for label in labels]
+    order = np.argsort(str_labels, kind='stable')
+    labels = [str_labels[i] for i in order]
+    prob_matrix = np.asarray(prob_matrix)[np.ix_(order, order)]
 
     fig, ax = plt.subplots(figsize=(8, 6))
     cax = ax.matshow(prob_matrix, cmap='seismic', vmin=0, vmax=1)
@@ -87,7 +201,7 @@ def heat_map_prob(probabilities, df_neigh, label_col, prob_heatmap_path, verbose
 
     for i in range(len(labels)):
         for j in range(len(labels)):
-            value = prob_matrix.iloc[i, j]
+            value = prob_matrix[i, j]
             color = 'w' if value < 0.35 else ('w' if value > 0.65 else 'black')
             text = ax.text(j, i, f"{value:.2f}",
                            ha="center", va="center", color=color, fontsize = text_size)
@@ -124,53 +238,34 @@ def plot_distribution(data_dict, outpath, verbose, bins = None, double_log = Tru
         fig.savefig(outpath, dpi = 300)
         if verbose: print(f"{datetime.datetime.now()}: {data_dict['title']} saved in {outpath}")
 
-def plot_community_composition(G, attribute_name, communities, outpath, verbose, palette = 'seismic'):
-    NONE_STR = 'None'
-    # communities_generator = nx.algorithms.community.girvan_newman(G)
-    # top_level_communities = next(communities_generator)
-    # communities = [list(c) for c in sorted(top_level_communities, key=len, reverse=True)]
+def plot_community_composition(G, attribute_name, communities, outpath, verbose, palette = 'seismic', context = None):
+    # Node -> community id and label code arrays; the composition is one bincount, see tagra.community
+    nodes = context.nodes() if context is not None else list(G.nodes)
+    community_ids, _ = community_assignment(nodes, communities)
     if attribute_name is not None:
-        labels_per_node = [G.nodes[n].get(attribute_name, NONE_STR) for n in G.nodes]
-        unique_labels = set(labels_per_node)
+        codes, unique_labels = context.label_codes(attribute_name) if context is not None else node_label_codes(G, attribute_name)
     else:
-        labels_per_node = [0 for node in G.nodes()]
-        unique_labels = [0]
-
-    community_compositions = {}
-    cmap = plt.get_cmap(palette)
+        codes, unique_labels = np.zeros(len(nodes), dtype=np.int64), np.array([0])
+    composition = community_composition(community_ids, codes, len(communities), len(unique_labels))
 
-    if attribute_name is not None:
-        for comm_id, community in enumerate(communities):
-            if len(community) == 1:
-                continue
-            labels_community = [G.nodes[node].get(attribute_name, NONE_STR) for node in community]
-            community_compositions[comm_id] = {label: 0 for label in unique_labels}
-            measured_unique_labels, counts = np.unique(labels_community, return_counts=True)
-            for label, count in zip(measured_unique_labels, counts):
-                community_compositions[comm_id][label] = count
-    else:
-        for comm_id, community in enumerate(communities):
-            labels_community = [0 for _ in community]
-            unique_labels, counts = np.unique(labels_community, return_counts=True)
-            community_compositions[comm_id] = {label: 0 for label in unique_labels}
-            for label, count in zip(unique_labels, counts):
-                community_compositions[comm_id][label] = count
-    
-    if len(community_compositions) == 0:
+    # Communities of a single node are not shown when coloring by an attribute
+    sizes = composition.sum(axis=1)
+    indices = np.flatnonzero(sizes > 1) if attribute_name is not None else np.arange(len(communities))
+    if len(indices) == 0:
         print(f"{datetime.datetime.now()}: No communities with more than 1 node found")
         return 0
-    indices = list(community_compositions.keys())
+    cmap = plt.get_cmap(palette)
     bar_width = 0.9
     fig, ax = plt.subplots(figsize=(8,6))
 
-    bottoms = [0] * len(indices)
+    bottoms = np.zeros(len(indices))
     colors = {label: cmap(i) for label, i in zip(unique_labels, np.linspace(0, 1, len(unique_labels)))}
 
     # Plot bars
-    for label in unique_labels:
-        values = [community_compositions[idx].get(label, 0) for idx in indices]
+    for code, label in enumerate(unique_labels):
+        values = composition[indices, code]
         ax.bar(indices, values, bar_width, label=f"{attribute_name}={label}", bottom=bottoms, color=colors[label])
-        bottoms = [bottom + value for bottom, value in zip(bottoms, values)]
+        bottoms = bottoms + values
     y_mx = max(bottoms)
     y_max = max(y_mx * 1.1, 1)
     ax.set_xticks([])
@@ -187,7 +282,7 @@ def plot_community_composition(G, attribute_name, communities, outpath, verbose,
         if verbose: print(f"{datetime.datetime.now()}: Community composition saved in {outpath}")
     
     return 1
-def matplotlib_graph_visualization(G, attribute, outpath, verbose, palette = 'seismic', pos = None):
+def matplotlib_graph_visualization(G, attribute, outpath, verbose, palette = 'seismic', pos = None, context = None):
     NONE_STR = 'None'
     plt.figure(figsize=(10, 10))
     if pos is None:
@@ -200,7 +295,10 @@ def matplotlib_graph_visualization(G, attribute, outpath, verbose, palette = 'se
     cmap = plt.get_cmap(palette)
     if attribute is not None:
         classification_attribute_name = attribute
-        y = np.array([G.nodes[node].get(classification_attribute_name, NONE_STR) for node in G.nodes()])
+        if context is not None:
+            y = context.node_labels(classification_attribute_name)
+        else:
+            y = np.array([G.nodes[node].get(classification_attribute_name, NONE_STR) for node in G.nodes()])
         unique = np.unique(y)
         unique_to_int = {key: index for index, key in enumerate(unique)}
         color_array = [cmap(r) for r in np.linspace(0, 1, len(unique))]
@@ -215,36 +313,84 @@ def matplotlib_graph_visualization(G, attribute, outpath, verbose, palette = 'se
         plt.savefig(outpath, dpi = 300)
         if verbose: print(f'{datetime.datetime.now()}: Graph saved in {outpath}')
 
-def measure_mixing_matrix(G, communities):
-    community_edge_count = {(i, j): 0 for i in communities.keys() for j in communities.keys()}
+def plot_super_graph(S, attribute, outpath, verbose, palette = 'seismic', pos = None):
+    """
+    Draws a super-graph built by tagra.coarsen.coarsen_graph: node areas proportional to the number of
+    original nodes, edge widths to the number of original edges, colors by the majority label.
 
-    # Create a mapping from node to its community
-    node_to_community = {}
-    for community, nodes in communities.items():
-        for node in nodes:
-            node_to_community[node] = community
+    Parameters:
+    - S (networkx.Graph): The super-graph.
+    - attribute (str, optional): Target attribute stored in the super-graph, for the colors.
+    - outpath (str): Path of the image; if None, the figure is not saved.
+    - verbose (bool): Whether to print progress messages.
+    - palette (str): Matplotlib colormap.
+    - pos (dict, optional): Super-node positions; by default a weighted spring layout.
+    """
+    plt.figure(figsize=(10, 10))
+    if pos is None:
+        pos = nx.spring_layout(S, weight='weight', seed=2112)
+    sizes = np.array([S.nodes[node].get('size', 1) for node in S.nodes()], dtype=float)
+    weights = np.array([data.get('weight', 1) for _, _, data in S.edges(data=True)], dtype=float)
+    node_size = 20 + 1000 * sizes / sizes.max() if len(sizes) else []
+    width = 0.2 + 4 * weights / weights.max() if len(weights) else []
+
+    cmap = plt.get_cmap(palette)
+    if attribute is not None:
+        labels = np.array([str(S.nodes[node].get(attribute)) for node in S.nodes()])
+        unique = np.unique(labels)
+        colors = {label: cmap(r) for label, r in zip(unique, np.linspace(0, 1, len(unique)))}
+        node_color = [colors[label] for label in labels]
+        for label in unique:
+            plt.scatter([], [], color=colors[label], label=f"{attribute}={label}")
+        plt.legend(loc='upper left')
+    else:
+        node_color = [cmap(0)] * S.number_of_nodes()
+
+    nx.draw(S, pos, with_labels=False, node_size=node_size, width=width, edge_color='gray',
+            alpha=0.8, node_color=node_color)
+    plt.title(f"Super-graph of {int(sizes.sum())} nodes in {S.number_of_nodes()} groups")
+    if outpath:
+        plt.savefig(outpath, dpi = 300)
+        if verbose: print(f'{datetime.datetime.now()}: Super-graph saved in {outpath}')
+
+def measure_mixing_matrix(G, communities, sparse=False):
+    """
+    Counts the edges between each pair of communities.
+
+    Parameters:
+    - G (networkx.Graph): The graph. Each undirected edge is counted in both directions.
+    - communities (dict): {community key: nodes}, covering every node of the graph exactly.
+    - sparse (bool): If True, returns the scipy.sparse matrix of tagra.community.community_mixing_matrix,
+      indexed by the position of the community keys, instead of a dict with an entry for every pair,
+      which grows as the square of the number of communities.
 
+    Returns:
+    - dict: {(key_i, key_j): number of edges} for every pair of community keys, 0 if they are not connected.
+
+    Raises:
+    - ValueError: If the nodes of the communities do not match the nodes of the graph.
+    """
+    nodes = list(G.nodes)
+    try:
+        community_ids, keys = community_assignment(nodes, communities)
+    except ValueError:
+        community_ids, keys = None, None
     # Check if all nodes in the graph are covered by the communities
-    graph_nodes = set(G.nodes())
-    community_nodes = set(node_to_community.keys())
-    if graph_nodes != community_nodes:
-        missing_in_communities = graph_nodes - community_nodes
-        missing_in_graph = community_nodes - graph_nodes
+    if community_ids is None or (community_ids < 0).any():
+        graph_nodes = set(nodes)
+        community_nodes = {node for members in communities.values() for node in members}
         raise ValueError(
             f"The nodes in the communities do not match the nodes in the graph.\n"
-            f"Nodes in the graph not in communities: {missing_in_communities}\n"
-            f"Nodes in communities not in the graph: {missing_in_graph}"
+            f"Nodes in the graph not in communities: {graph_nodes - community_nodes}\n"
+            f"Nodes in communities not in the graph: {community_nodes - graph_nodes}"
         )
 
-    # Iterate over all edges in the graph
-    for source, target in G.edges():
-        if source in node_to_community and target in node_to_community:
-            c_source = node_to_community[source]
-            c_target = node_to_community[target]
-            if not G.is_directed():
-                community_edge_count[c_source, c_target] += 1
-                community_edge_count[c_target, c_source] += 1
-            else:
-                community_edge_count[c_source, c_target] += 1
-
+    sources, targets = graph_edge_arrays(G)
+    matrix = community_mixing_matrix(community_ids, sources, targets, len(keys), directed=G.is_directed())
+    if sparse:
+        return matrix
+    community_edge_count = {(key_i, key_j): 0 for key_i in keys for key_j in keys}
+    matrix = matrix.tocoo()
+    for i, j, count in zip(matrix.row.tolist(), matrix.col.tolist(), matrix.data.tolist()):
+        community_edge_count[keys[i], keys[j]] = count
     return community_edge_count
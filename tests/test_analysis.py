@@ -7,7 +7,8 @@ import tempfile
 import pickle
 from datetime import datetime
 
-from tagra.analysis import analyze_graph
+from tagra.analysis import analyze_graph, format_metrics_report, target_statistics, save_metrics, load_metrics
+from tagra.context import AnalysisContext
 
 class TestAnalyzeGraph(unittest.TestCase):
 
@@ -31,29 +32,127 @@ class TestAnalyzeGraph(unittest.TestCase):
         self.test_dir.cleanup()
 
     def test_analyze_graph_with_attribute(self):
-        # Run analyze_graph with an attribute
-        analyze_graph(
-            graph_path=self.graph_path,
-            attribute='club',
-            clustering_method='hierarchical',
-            inconsistency_threshold=0.1,
+        # Run analyze_graph with an attribute, on the graph saved in a pickle file
+        metrics = analyze_graph(
+            self.graph_path,
+            target_attributes='club',
             verbose=False,
-            plot_graph=True,
-            neigh_prob_path=os.path.join(self.temp_dir, 'neighbor_stat.dat'),
-            degree_distribution_outpath=os.path.join(self.temp_dir, 'degree_distribution.png'),
-            betweenness_distribution_outpath=os.path.join(self.temp_dir, 'betweenness_distribution.png'),
-            prob_heatmap_path=os.path.join(self.temp_dir, 'prob_heatmap.png'),
-            community_composition_outpath=os.path.join(self.temp_dir, 'community_composition.png'),
-            graph_visualization_path=os.path.join(self.temp_dir, 'graph_visualization.png')
+            output_directory=self.temp_dir,
+            neigh_prob_filename='neighbor_stat.dat',
+            degree_distribution_filename='degree_distribution.png',
+            prob_heatmap_filename='prob_heatmap.png',
+            community_filename='community_composition.png',
+            graph_visualization_filename='graph_visualization.png',
+            metrics_filename='metrics.json',
+            overwrite=True
         )
 
         # Check if the output files were created
         self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'neighbor_stat.dat')))
         self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'degree_distribution.png')))
-        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'betweenness_distribution.png')))
         self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'prob_heatmap.png')))
         self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'community_composition.png')))
         self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'graph_visualization.png')))
+        saved = load_metrics(os.path.join(self.temp_dir, 'metrics.json'))
+        self.assertEqual(saved['nodes'], metrics['nodes'])
+
+class TestMultiTarget(unittest.TestCase):
+
+    def setUp(self):
+        self.G = nx.karate_club_graph()
+        rng = np.random.default_rng(0)
+        for node, data in self.G.nodes(data=True):
+            data['random'] = int(rng.integers(3))
+            data['constant'] = 'a'
+
+    def test_target_statistics_match_single_target(self):
+        context = AnalysisContext(self.G)
+        stats = target_statistics(context, ['club', 'random', 'constant'], random_state=0, verbose=False)
+        single = analyze_graph(self.G, target_attributes='club', verbose=False,
+                               degree_distribution_filename=None)
+        for key in ['chi2_stat', 'chi2_p_value', 'homophily_score']:
+            self.assertAlmostEqual(stats['club'][key], single[key])
+        self.assertLess(stats['club']['homophily_p_value'], 0.05)
+        self.assertGreater(stats['club']['homophily_z_score'], 2)
+        self.assertEqual(stats['random']['n_labels'], 3)
+        self.assertIsNone(stats['constant']['homophily_score'])
+
+    def test_permutations_are_reproducible(self):
+        first = target_statistics(AnalysisContext(self.G), ['club', 'random'], random_state=1, verbose=False)
+        second = target_statistics(AnalysisContext(self.G), ['random'], random_state=1, verbose=False)
+        self.assertEqual(first, target_statistics(AnalysisContext(self.G), ['club', 'random'], random_state=1, verbose=False))
+        self.assertAlmostEqual(first['random']['homophily_score'], second['random']['homophily_score'])
+        # The permutation null of an attribute does not depend on the other attributes tested with it
+        self.assertEqual(first['random']['homophily_p_value'], second['random']['homophily_p_value'])
+        self.assertAlmostEqual(first['random']['homophily_z_score'], second['random']['homophily_z_score'])
+        other = target_statistics(AnalysisContext(self.G), ['random'], random_state=2, verbose=False)
+        self.assertNotEqual(other['random']['homophily_z_score'], second['random']['homophily_z_score'])
+
+    def test_analyze_graph_multi_target(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            metrics = analyze_graph(self.G, target_attributes=['club', 'random'], multi_target=True,
+                                    verbose=False, output_directory=temp_dir, overwrite=True,
+                                    prob_heatmap_filename='heatmap.png',
+                                    neigh_prob_filename='neigh_prob.txt',
+                                    network_metrics_filename='report.txt')
+            self.assertEqual(set(metrics['targets']), {'club', 'random'})
+            self.assertNotIn('chi2_stat', metrics)
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, 'heatmap_club.png')))
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, 'heatmap_random.png')))
+            with open(os.path.join(temp_dir, 'report.txt')) as f:
+                self.assertIn('Multi-Target Analysis', f.read())
+
+class TestMetricsExport(unittest.TestCase):
+
+    def setUp(self):
+        self.G = nx.karate_club_graph()
+        self.metrics = analyze_graph(self.G, target_attributes='club', verbose=False)
+
+    def test_returned_metrics(self):
+        node_metrics = self.metrics['node_metrics']
+        self.assertEqual(list(node_metrics['node']), list(self.G.nodes))
+        self.assertEqual(list(node_metrics['degree']), [d for _, d in self.G.degree()])
+        self.assertAlmostEqual(self.metrics['avg_clustering'], nx.average_clustering(self.G))
+        clustering = nx.clustering(self.G)
+        np.testing.assert_allclose(node_metrics['clustering'], [clustering[n] for n in self.G.nodes])
+        self.assertEqual(node_metrics['community'].nunique(), self.metrics['community_count'])
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for filename in ['metrics.json', 'metrics.parquet']:
+                path = os.path.join(temp_dir, filename)
+                save_metrics(self.metrics, path)
+                loaded = load_metrics(path)
+                self.assertAlmostEqual(loaded['homophily_score'], self.metrics['homophily_score'])
+                self.assertEqual(loaded['community_count'], self.metrics['community_count'])
+                pd.testing.assert_frame_equal(loaded['node_metrics'], self.metrics['node_metrics'], check_dtype=False)
+            with self.assertRaises(ValueError):
+                save_metrics(self.metrics, os.path.join(temp_dir, 'metrics.txt'))
+
+    def test_sampled_estimates(self):
+        metrics = analyze_graph(self.G, verbose=False, path_length_samples=34, betweenness_samples=34,
+                                pagerank_centrality=True)
+        self.assertAlmostEqual(metrics['avg_path_length'], nx.average_shortest_path_length(self.G))
+        self.assertEqual(metrics['diameter_upper'], nx.diameter(self.G))
+        betweenness = nx.betweenness_centrality(self.G)
+        np.testing.assert_allclose(metrics['node_metrics']['betweenness'], [betweenness[n] for n in self.G.nodes])
+        self.assertIn('pagerank', metrics['node_metrics'])
+        self.assertNotIn('betweenness', self.metrics['node_metrics'])
+        report = "\n".join(format_metrics_report(metrics))
+        self.assertIn("Diameter: between 5 and 5", report)
+
+    def test_spectrum(self):
+        metrics = analyze_graph(self.G, verbose=False, spectral_eigenvalues=4)
+        self.assertEqual(metrics['zero_eigenvalues'], 1)
+        self.assertEqual(len(metrics['spectral_eigenvalues']), 4)
+        self.assertIn('fiedler', metrics['node_metrics'])
+        self.assertIn("Laplacian Spectrum:", "\n".join(format_metrics_report(metrics)))
+
+    def test_analyze_graph_writes_metrics(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            analyze_graph(self.G, verbose=False, output_directory=temp_dir, overwrite=True,
+                          metrics_filename='metrics.json')
+            self.assertEqual(load_metrics(os.path.join(temp_dir, 'metrics.json'))['nodes'], 34)
 
 if __name__ == '__main__':
     unittest.main()
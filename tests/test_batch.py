@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from tagra.batch import expand_datasets, run_batch
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.temp_dir = self.test_dir.name
+        rng = np.random.default_rng(0)
+        for i in range(2):
+            df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 40), rng.normal(5, 1, 40)],
+                               'x2': rng.normal(0, 1, 80),
+                               'target': np.repeat(['a', 'b'], 40)})
+            df.to_csv(os.path.join(self.temp_dir, f'data{i}.csv'), index=False)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_expand_glob_and_manifest(self):
+        datasets = expand_datasets(os.path.join(self.temp_dir, '*.csv'))
+        self.assertEqual([os.path.basename(d['input_dataframe']) for d in datasets], ['data0.csv', 'data1.csv'])
+
+        manifest_path = os.path.join(self.temp_dir, 'manifest.json')
+        with open(manifest_path, 'w') as f:
+            json.dump({'defaults': {'k': 3}, 'datasets': ['data0.csv', {'input_dataframe': 'data1.csv', 'k': 7}]}, f)
+        datasets = expand_datasets(manifest_path)
+        self.assertEqual(datasets[0], {'k': 3, 'input_dataframe': os.path.join(self.temp_dir, 'data0.csv')})
+        self.assertEqual(datasets[1]['k'], 7)
+
+        with self.assertRaises(ValueError):
+            expand_datasets([{'input_dataframe': 'data0.csv', 'unknown_setting': 1}])
+        with self.assertRaises(ValueError):
+            expand_datasets(os.path.join(self.temp_dir, '*.parquet'))
+
+    def test_run_batch(self):
+        datasets = [os.path.join(self.temp_dir, 'data0.csv'),
+                    {'input_dataframe': os.path.join(self.temp_dir, 'data1.csv'), 'k': 7},
+                    os.path.join(self.temp_dir, 'missing.csv')]
+        base_config = {'output_directory': self.temp_dir, 'target_columns': 'target', 'manifold_method': None,
+                       'verbose': False, 'overwrite': True, 'graph_visualization_filename': None}
+        summary_path = os.path.join(self.temp_dir, 'summary.csv')
+        summary = run_batch(datasets, base_config, max_workers=2, summary_filename=summary_path, verbose=False)
+        self.assertEqual(list(summary['status']), ['ok', 'ok', 'failed'])
+        self.assertEqual(list(summary['nodes'][:2]), [80, 80])
+        self.assertGreater(summary['edges'][1], summary['edges'][0])
+        self.assertTrue(os.path.isdir(os.path.join(self.temp_dir, 'data0')))
+        self.assertEqual(len(pd.read_csv(summary_path)), 3)
+
+    def test_same_file_names(self):
+        datasets = []
+        for i in range(2):
+            os.makedirs(os.path.join(self.temp_dir, f'dir{i}'))
+            datasets.append(os.path.join(self.temp_dir, f'dir{i}', 'data.csv'))
+            os.rename(os.path.join(self.temp_dir, f'data{i}.csv'), datasets[-1])
+        base_config = {'output_directory': self.temp_dir, 'target_columns': 'target', 'manifold_method': None,
+                       'verbose': False, 'overwrite': True, 'graph_visualization_filename': None}
+        summary = run_batch(datasets, base_config, max_workers=2, verbose=False)
+        self.assertEqual(list(summary['status']), ['ok', 'ok'])
+        self.assertEqual(list(summary['output_directory']),
+                         [os.path.join(self.temp_dir, 'data_0'), os.path.join(self.temp_dir, 'data_1')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+import networkx as nx
+import numpy as np
+from tagra.coarsen import coarsen_graph, expand_super_nodes, super_node_members
+from tagra.context import AnalysisContext
+from tagra.utils import plot_super_graph
+
+class TestCoarsen(unittest.TestCase):
+
+    def setUp(self):
+        self.G = nx.karate_club_graph()
+
+    def check_totals(self, S):
+        self.assertEqual(sum(S.nodes[i]['size'] for i in S), self.G.number_of_nodes())
+        internal = sum(S.nodes[i]['internal_edges'] for i in S)
+        self.assertEqual(internal + S.size('weight'), self.G.number_of_edges())
+
+    def test_communities(self):
+        communities = [list(c) for c in nx.algorithms.community.greedy_modularity_communities(self.G)]
+        S = coarsen_graph(self.G, communities=communities, target_attributes='club', verbose=False)
+        self.assertEqual(S.number_of_nodes(), len(communities))
+        self.check_totals(S)
+        for i, community in enumerate(communities):
+            self.assertEqual(sorted(super_node_members(S, i)), sorted(community))
+            self.assertEqual(S.nodes[i]['internal_edges'], self.G.subgraph(community).number_of_edges())
+            clubs = [self.G.nodes[node]['club'] for node in community]
+            self.assertEqual(S.nodes[i]['club_composition'], {club: clubs.count(club) for club in set(clubs)})
+            self.assertEqual(S.nodes[i]['club_purity'], max(map(clubs.count, clubs)) / len(clubs))
+        for i, j, weight in S.edges(data='weight'):
+            self.assertEqual(weight, nx.cut_size(self.G, communities[i], communities[j]))
+        subgraph = expand_super_nodes(S, self.G, [0, 1])
+        self.assertEqual(subgraph.number_of_nodes(), len(communities[0]) + len(communities[1]))
+
+    def test_methods(self):
+        louvain = coarsen_graph(self.G, method='louvain', context=AnalysisContext(self.G), verbose=False)
+        self.check_totals(louvain)
+        matching = coarsen_graph(self.G, method='matching', max_nodes=5, verbose=False)
+        self.assertLessEqual(matching.number_of_nodes(), 5)
+        self.check_totals(matching)
+        with self.assertRaises(ValueError):
+            coarsen_graph(self.G, method='spectral', verbose=False)
+        with self.assertRaises(ValueError):
+            coarsen_graph(nx.DiGraph(self.G), verbose=False)
+
+    def test_matching_large(self):
+        G = nx.fast_gnp_random_graph(5000, 0.002, seed=1)
+        S = coarsen_graph(G, method='matching', max_nodes=200, verbose=False)
+        self.assertLessEqual(S.number_of_nodes(), 200)
+        self.assertEqual(sum(S.nodes[i]['size'] for i in S), G.number_of_nodes())
+        assignment = S.graph['assignment']
+        self.assertEqual(len(assignment), G.number_of_nodes())
+        np.testing.assert_array_equal(np.bincount(assignment), [S.nodes[i]['size'] for i in S])
+
+    def test_plot(self):
+        S = coarsen_graph(self.G, target_attributes='club', verbose=False)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'super_graph.png')
+            plot_super_graph(S, 'club', path, False)
+            self.assertTrue(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()
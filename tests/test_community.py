@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+import networkx as nx
+import numpy as np
+from tagra.community import (
+    community_assignment,
+    community_composition,
+    community_mixing_matrix,
+    community_statistics
+)
+from tagra.context import AnalysisContext
+from tagra.utils import graph_edge_arrays, measure_mixing_matrix, node_label_codes, plot_community_composition
+
+class TestCommunity(unittest.TestCase):
+
+    def setUp(self):
+        self.G = nx.karate_club_graph()
+        self.G.add_edge(0, 0)
+        self.nodes = list(self.G.nodes)
+        self.communities = [list(c) for c in nx.algorithms.community.greedy_modularity_communities(self.G)]
+        self.ids, _ = community_assignment(self.nodes, self.communities)
+        self.sources, self.targets = graph_edge_arrays(self.G)
+
+    def test_assignment(self):
+        for i, community in enumerate(self.communities):
+            self.assertTrue(all(self.ids[self.nodes.index(node)] == i for node in community))
+        ids, keys = community_assignment(self.nodes, {'a': [0, 1], 'b': [2]})
+        self.assertEqual(keys, ['a', 'b'])
+        self.assertEqual(list(ids[:4]), [0, 0, 1, -1])
+        with self.assertRaises(ValueError):
+            community_assignment(self.nodes, [[0, 1000]])
+
+    def test_mixing_matrix(self):
+        matrix = community_mixing_matrix(self.ids, self.sources, self.targets, len(self.communities)).toarray()
+        expected = np.zeros_like(matrix)
+        for u, v in self.G.edges():
+            expected[self.ids[u], self.ids[v]] += 1
+            expected[self.ids[v], self.ids[u]] += 1
+        np.testing.assert_array_equal(matrix, expected)
+        degrees = dict(self.G.degree())
+        for i, community in enumerate(self.communities):
+            self.assertEqual(matrix[i].sum(), sum(degrees[node] for node in community))
+
+    def test_statistics(self):
+        codes, labels = node_label_codes(self.G, 'club')
+        statistics = community_statistics(self.ids, self.sources, self.targets, len(self.communities),
+                                          label_codes=codes, n_labels=len(labels))
+        for i, community in enumerate(self.communities):
+            row = statistics.iloc[i]
+            self.assertEqual(row['size'], len(community))
+            self.assertEqual(row['internal_edges'], self.G.subgraph(community).number_of_edges())
+            self.assertEqual(row['cut_edges'], nx.cut_size(self.G, community))
+            self.assertAlmostEqual(row['conductance'], nx.conductance(self.G, community))
+            composition = community_composition(self.ids, codes, len(self.communities), len(labels))[i]
+            fractions = composition[composition > 0] / len(community)
+            self.assertAlmostEqual(row['purity'], fractions.max())
+            self.assertAlmostEqual(row['entropy'], -(fractions * np.log2(fractions)).sum())
+
+    def test_context_statistics(self):
+        context = AnalysisContext(self.G)
+        statistics = context.community_statistics('club')
+        self.assertIs(statistics, context.community_statistics('club'))
+        self.assertEqual(statistics['size'].sum(), self.G.number_of_nodes())
+        self.assertTrue(set(statistics['majority_label']) <= {'Mr. Hi', 'Officer'})
+
+    def test_measure_mixing_matrix(self):
+        communities = {f"c{i}": community for i, community in enumerate(self.communities)}
+        counts = measure_mixing_matrix(self.G, communities)
+        keys = list(communities)
+        # Every pair has an entry, as before the sparse option
+        self.assertEqual(list(counts), [(key_i, key_j) for key_i in keys for key_j in keys])
+        matrix = community_mixing_matrix(self.ids, self.sources, self.targets, len(keys)).toarray()
+        for i, key_i in enumerate(keys):
+            for j, key_j in enumerate(keys):
+                self.assertEqual(counts[key_i, key_j], matrix[i, j])
+        self.assertEqual(measure_mixing_matrix(self.G, communities, sparse=True).sum(), 2 * self.G.number_of_edges())
+        with self.assertRaises(ValueError):
+            measure_mixing_matrix(self.G, {'a': self.communities[0]})
+
+    def test_plot_community_composition(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'communities.png')
+            self.assertEqual(plot_community_composition(self.G, 'club', self.communities, path, False), 1)
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(plot_community_composition(self.G, 'club', [[node] for node in self.G], None, False), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,25 +1,24 @@
 import unittest
 import json
 import os
-from tagra.config import load_config, save_config
+from tagra.config import default_config, load_config, save_config
 
 class TestConfig(unittest.TestCase):
 
     def setUp(self):
         self.config_path = "test_config.json"
         self.config = {
+            "input_dataframe": "data.csv",
             "nan_action": "infer",
             "nan_threshold": 0.6,
             "numeric_scaling": "standard",
             "categorical_encoding": "one-hot",
             "manifold_method": None,
-            "manifold_dim": 2,
-            "verbose": True,
+            "verbose": False,
             "method": "knn",
-            "threshold": 0.75,
             "k": 5,
-            "clustering_method": "hierarchical",
-            "inconsistency_threshold": 0.1
+            "dtype": "float32",
+            "memory_budget": "4GB"
         }
 
     def tearDown(self):
@@ -29,6 +28,9 @@ class TestConfig(unittest.TestCase):
     def test_load_default_config(self):
         config = load_config(config_path="non_existent_config.json")
         self.assertEqual(config["nan_action"], "infer")
+        config = load_config(dataset_path="data.csv")
+        self.assertEqual(config["input_dataframe"], "data.csv")
+        self.assertNotIn("input_dataframe", default_config)
 
     def test_save_config(self):
         save_config(self.config, config_path=self.config_path)
@@ -40,6 +42,15 @@ class TestConfig(unittest.TestCase):
         save_config(self.config, config_path=self.config_path)
         config = load_config(config_path=self.config_path)
         self.assertEqual(config["nan_action"], "infer")
+        self.assertEqual(config["dtype"], "float32")
+        self.assertEqual(config["memory_budget"], "4GB")
+        # Settings missing from the file take their default value
+        self.assertEqual(config["track_memory"], default_config["track_memory"])
+
+    def test_unknown_setting(self):
+        save_config(dict(self.config, manifold_dim=2), config_path=self.config_path)
+        with self.assertRaises(ValueError):
+            load_config(config_path=self.config_path)
 
 if __name__ == '__main__':
     unittest.main()
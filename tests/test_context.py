@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import networkx as nx
+import numpy as np
+from tagra.context import AnalysisContext
+from tagra.utils import neighbor_mixing_matrix, node_label_codes
+
+class TestAnalysisContext(unittest.TestCase):
+
+    def setUp(self):
+        self.G = nx.karate_club_graph()
+        self.context = AnalysisContext(self.G)
+
+    def test_results_are_memoized(self):
+        self.assertIs(self.context.mixing('club'), self.context.mixing('club'))
+        self.assertIs(self.context.communities(), self.context.communities())
+        self.assertIs(self.context.neighborhood('club'), self.context.neighborhood('club'))
+
+    def test_mixing_and_degrees(self):
+        labels, mixing = self.context.mixing('club')
+        expected_labels, expected = neighbor_mixing_matrix(self.G, 'club')
+        np.testing.assert_array_equal(mixing, expected)
+        np.testing.assert_array_equal(self.context.degrees(), [d for _, d in self.G.degree()])
+
+    def test_mixing_many(self):
+        for node in self.G.nodes:
+            self.G.nodes[node]['parity'] = node % 2
+        club = self.context.mixing('club')
+        results = self.context.mixing_many(['club', 'parity'])
+        self.assertIs(results[0], club)
+        self.assertIs(results[1], self.context.mixing('parity'))
+        np.testing.assert_array_equal(results[1][1], neighbor_mixing_matrix(self.G, 'parity')[1])
+
+    def test_threads_compute_once(self):
+        calls = []
+        barrier = threading.Barrier(4)
+
+        def slow_codes(graph, attribute):
+            calls.append(attribute)
+            time.sleep(0.05)
+            return node_label_codes(graph, attribute)
+
+        def mixing(attribute):
+            barrier.wait()
+            return self.context.mixing_many([attribute, 'club']) if attribute == 'parity' else self.context.mixing('club')
+
+        for node in self.G.nodes:
+            self.G.nodes[node]['parity'] = node % 2
+        with mock.patch('tagra.context.node_label_codes', slow_codes), ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(mixing, ['club', 'club', 'parity', 'parity']))
+        self.assertEqual(sorted(calls), ['club', 'parity'])
+        self.assertIs(results[0], results[1])
+        self.assertIs(results[2][1], results[0])
+        self.assertIs(results[2][0], results[3][0])
+
+    def test_graph_changes_invalidate(self):
+        degrees = self.context.degrees()
+        self.G.add_edge(0, 9)
+        self.assertIsNot(self.context.degrees(), degrees)
+        self.assertEqual(self.context.degrees()[9], self.G.degree(9))
+
+        labels = self.context.node_labels('club')
+        self.G.nodes[0]['club'] = 'Officer'
+        self.assertIs(self.context.node_labels('club'), labels)
+        self.context.invalidate()
+        self.assertEqual(self.context.node_labels('club')[0], 'Officer')
+
+if __name__ == '__main__':
+    unittest.main()
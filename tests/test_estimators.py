@@ -0,0 +1,84 @@
+import time
+import unittest
+import networkx as nx
+import numpy as np
+from tagra.context import AnalysisContext
+from tagra.estimators import distance_metrics, estimate_betweenness, estimate_path_lengths, pagerank
+
+class TestEstimators(unittest.TestCase):
+
+    def setUp(self):
+        self.G = nx.connected_watts_strogatz_graph(120, 6, 0.1, seed=0)
+        self.indptr, self.indices = AnalysisContext(self.G).adjacency()
+
+    def test_path_lengths(self):
+        exact = estimate_path_lengths(self.indptr, self.indices, n_samples=1000)
+        self.assertAlmostEqual(exact['avg_path_length'], nx.average_shortest_path_length(self.G))
+        self.assertEqual(exact['avg_path_length_stderr'], 0)
+        self.assertEqual(exact['diameter_lower'], nx.diameter(self.G))
+        self.assertEqual(exact['diameter_upper'], nx.diameter(self.G))
+        sampled = estimate_path_lengths(self.indptr, self.indices, n_samples=30)
+        self.assertEqual(sampled['path_samples'], 30)
+        self.assertLess(abs(sampled['avg_path_length'] - exact['avg_path_length']),
+                        4 * sampled['avg_path_length_stderr'])
+        self.assertLessEqual(sampled['diameter_lower'], nx.diameter(self.G))
+        self.assertGreaterEqual(sampled['diameter_upper'], nx.diameter(self.G))
+
+    def test_path_lengths_components(self):
+        # A path of 5 nodes and a triangle: the diameter is the one of the path
+        G = nx.disjoint_union(nx.path_graph(5), nx.complete_graph(3))
+        indptr, indices = AnalysisContext(G).adjacency()
+        result = estimate_path_lengths(indptr, indices, n_samples=100)
+        pairs = [d for _, lengths in nx.shortest_path_length(G) for d in lengths.values() if d > 0]
+        self.assertAlmostEqual(result['avg_path_length'], np.mean(pairs))
+        self.assertEqual((result['diameter_lower'], result['diameter_upper']), (4, 4))
+
+    def test_betweenness(self):
+        exact, stderr, n_sources = estimate_betweenness(self.indptr, self.indices, n_samples=1000)
+        expected = nx.betweenness_centrality(self.G)
+        np.testing.assert_allclose(exact, [expected[n] for n in self.G], atol=1e-12)
+        self.assertEqual(n_sources, 120)
+        np.testing.assert_array_equal(stderr, 0)
+        sampled, stderr, n_sources = estimate_betweenness(self.indptr, self.indices, n_samples=40, random_state=1)
+        self.assertEqual(n_sources, 40)
+        self.assertTrue(np.all(stderr > 0))
+        # The standard errors match the typical size of the errors
+        ratio = np.sqrt(np.mean((sampled - exact) ** 2) / np.mean(stderr ** 2))
+        self.assertTrue(0.5 < ratio < 2)
+        # The time budget stops after the first source
+        _, _, n_sources = estimate_betweenness(self.indptr, self.indices, n_samples=100, time_budget=0)
+        self.assertEqual(n_sources, 1)
+
+    def test_directed(self):
+        G = nx.gnm_random_graph(50, 200, seed=0, directed=True)
+        indptr, indices = AnalysisContext(G).adjacency()
+        betweenness, _, _ = estimate_betweenness(indptr, indices, n_samples=100, directed=True)
+        expected = nx.betweenness_centrality(G)
+        np.testing.assert_allclose(betweenness, [expected[n] for n in G], atol=1e-12)
+        ranks, _, _ = pagerank(indptr, indices)
+        expected = nx.pagerank(G)
+        np.testing.assert_allclose(ranks, [expected[n] for n in G], atol=1e-5)
+
+    def test_pagerank(self):
+        G = self.G.copy()
+        G.add_node(120)
+        indptr, indices = AnalysisContext(G).adjacency()
+        ranks, iterations, error = pagerank(indptr, indices, tol=1e-10)
+        expected = nx.pagerank(G, tol=1e-10)
+        self.assertAlmostEqual(ranks.sum(), 1)
+        self.assertLessEqual(np.abs(ranks - [expected[n] for n in G]).sum(), max(error, 1e-8))
+        _, capped, error = pagerank(indptr, indices, max_iter=2)
+        self.assertEqual(capped, 2)
+        self.assertGreater(error, 0)
+
+    def test_distance_metrics(self):
+        start = time.perf_counter()
+        metrics, columns = distance_metrics(self.G, path_length_samples=20, betweenness_samples=20,
+                                            pagerank_centrality=True, verbose=False)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertEqual(metrics['path_samples'], 20)
+        self.assertEqual(sorted(columns), ['betweenness', 'betweenness_stderr', 'pagerank'])
+        self.assertEqual(distance_metrics(self.G, verbose=False), ({}, {}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,17 @@
 import unittest
 import pandas as pd
 import networkx as nx
-from tagra.graph import create_graph
+import numpy as np
+import tempfile
+from tagra.graph import (
+    create_graph,
+    compute_gower_knn,
+    compute_knn,
+    estimate_edge_counts,
+    get_categorical_codes,
+    get_feature_matrix,
+    select_distance_threshold
+)
 
 class TestGraphCreation(unittest.TestCase):
 
@@ -11,19 +21,176 @@ class TestGraphCreation(unittest.TestCase):
             'B': [1.1, 2.2, 3.3, 4.4, 5.5],
             'C': ['a', 'b', 'c', 'd', 'e']
         })
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.kwargs = dict(input_dataframe=self.df, preprocessed_dataframe=self.df,
+                           output_directory=self.test_dir.name, verbose=False)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
 
     def test_knn_method(self):
-        G = create_graph(dataframe_path=self.df, method='knn', k=2)
+        G = create_graph(method='knn', k=2, **self.kwargs)
         self.assertEqual(len(G.nodes), len(self.df))
         self.assertTrue(all(len(list(G.neighbors(n))) >= 2 for n in G.nodes))
+        # The columns of the input dataframe are node attributes; the numeric ones are the features
+        self.assertEqual(G.nodes[0], {'A': 1, 'B': 1.1, 'C': 'a'})
 
     def test_distance_threshold_method(self):
-        G = create_graph(dataframe_path=self.df, method='distance_threshold', threshold=1.5)
+        G = create_graph(method='distance', distance_threshold=1.5, **self.kwargs)
         self.assertEqual(len(G.nodes), len(self.df))
+        # Consecutive rows are sqrt(1 + 1.1^2) apart, the others farther
+        self.assertEqual(G.number_of_edges(), 4)
 
     def test_similarity_method(self):
-        G = create_graph(dataframe_path=self.df, method='similarity', threshold=0.99)
+        G = create_graph(method='similarity', similarity_threshold=0.99, node_attributes=['C'], **self.kwargs)
         self.assertEqual(len(G.nodes), len(self.df))
+        self.assertEqual(G.nodes[0], {'C': 'a'})
+
+class TestSharedKnn(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame(rng.normal(size=(50, 3)), columns=['A', 'B', 'C'])
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_compute_knn_includes_self(self):
+        distances, indices = compute_knn(self.df.values, 4)
+        self.assertEqual(indices.shape, (50, 5))
+        np.testing.assert_array_equal(indices[:, 0], np.arange(50))
+        self.assertTrue(np.all(np.diff(distances, axis=1) >= 0))
+
+    def test_precomputed_knn_prefix(self):
+        kwargs = dict(input_dataframe=self.df, preprocessed_dataframe=self.df, output_directory=self.test_dir.name,
+                      method='knn', k=3, verbose=False)
+        G = create_graph(**kwargs)
+        G_shared = create_graph(knn=compute_knn(self.df.values, 14), **kwargs)
+        self.assertEqual(set(map(frozenset, G.edges())), set(map(frozenset, G_shared.edges())))
+
+    def test_precomputed_knn_too_small(self):
+        with self.assertRaises(ValueError):
+            create_graph(input_dataframe=self.df, preprocessed_dataframe=self.df, output_directory=self.test_dir.name,
+                         method='knn', k=5, knn=compute_knn(self.df.values, 2), verbose=False)
+
+    def test_feature_matrix_columns(self):
+        values, columns = get_feature_matrix(self.df)
+        self.assertEqual(columns, ['A', 'B', 'C'])
+        self.assertEqual(values.shape, (50, 3))
+        with self.assertRaises(ValueError):
+            get_feature_matrix(self.df, [])
+
+class TestNodeAttributes(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame(rng.normal(size=(20, 2)), columns=['A', 'B'], index=range(10, 30))
+        self.df['label'] = ['x', 'y'] * 10
+        self.df_preprocessed = self.df.iloc[2:].copy()
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_node_attributes_subset(self):
+        G = create_graph(input_dataframe=self.df, preprocessed_dataframe=self.df_preprocessed,
+                         output_directory=self.test_dir.name, node_attributes=['label'], k=2, verbose=False)
+        self.assertEqual(G.number_of_nodes(), 18)
+        self.assertEqual(G.nodes[0], {'label': self.df_preprocessed['label'].iloc[0]})
+        self.assertEqual(G.nodes[17], {'label': self.df_preprocessed['label'].iloc[17]})
+
+    def test_preprocessed_dataframe_only(self):
+        G = create_graph(preprocessed_dataframe=self.df_preprocessed, output_directory=self.test_dir.name,
+                         k=2, verbose=False)
+        self.assertEqual(set(G.nodes[0].keys()), {'A', 'B', 'label'})
+        self.assertEqual(list(self.df_preprocessed.index), list(range(12, 30)))
+
+class TestDistanceThreshold(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        # A dense cluster of 100 rows and 900 spread rows
+        values = np.r_[rng.normal(0, 0.01, size=(100, 2)), rng.uniform(-10, 10, size=(900, 2))]
+        self.df = pd.DataFrame(values, columns=['A', 'B'])
+        self.kwargs = dict(preprocessed_dataframe=self.df, output_directory=self.test_dir.name,
+                           graph_filename='graph.graphml', method='distance', verbose=False)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_estimate_edge_counts(self):
+        values = self.df.values
+        thresholds = [0.05, 0.5, 2.0]
+        exact = [sum(np.count_nonzero(np.linalg.norm(values[i + 1:] - values[i], axis=1) <= t)
+                     for i in range(len(values))) for t in thresholds]
+        np.testing.assert_allclose(estimate_edge_counts(values, thresholds, sample_size=1000), exact)
+        np.testing.assert_allclose(estimate_edge_counts(values, thresholds, sample_size=400), exact, rtol=0.25)
+
+    def test_target_degree(self):
+        G = create_graph(target_degree=20, **self.kwargs)
+        self.assertAlmostEqual(2 * G.number_of_edges() / G.number_of_nodes(), 20, delta=2)
+        self.assertLess(select_distance_threshold(self.df.values, 5), select_distance_threshold(self.df.values, 20))
+        with self.assertRaises(ValueError):
+            create_graph(**self.kwargs)
+
+    def test_max_degree(self):
+        G = create_graph(distance_threshold=1.0, **self.kwargs)
+        self.assertGreaterEqual(max(dict(G.degree).values()), 99)
+        G_capped = create_graph(distance_threshold=1.0, max_degree=10, **self.kwargs)
+        self.assertLessEqual(max(dict(G_capped.degree).values()), 10)
+        self.assertTrue(set(G_capped.edges) <= set(G.edges))
+        self.assertEqual(G_capped.number_of_nodes(), 1000)
+
+    def test_max_edges(self):
+        G = create_graph(distance_threshold=1.0, **self.kwargs)
+        with self.assertRaises(ValueError):
+            create_graph(distance_threshold=1.0, max_edges=G.number_of_edges() - 1, **self.kwargs)
+        G_budget = create_graph(distance_threshold=1.0, max_edges=G.number_of_edges(), **self.kwargs)
+        self.assertEqual(set(G_budget.edges), set(G.edges))
+
+class TestGower(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame({'A': rng.normal(size=80), 'B': rng.normal(scale=100, size=80),
+                                'color': rng.choice(['red', 'green', 'blue'], 80), 'size': rng.integers(0, 4, 80)})
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_compute_gower_knn(self):
+        values = self.df[['A', 'B']].values
+        codes = get_categorical_codes(self.df, ['color', 'size'])
+        self.assertEqual(codes.dtype, np.int64)
+        np.testing.assert_array_equal(codes[:, 1], self.df['size'])
+        # Brute-force Gower distances: range-scaled absolute differences and mismatches, averaged
+        scaled = values / np.ptp(values, axis=0)
+        expected = (np.abs(scaled[:, None] - scaled[None]).sum(axis=2) + (codes[:, None] != codes[None]).sum(axis=2)) / 4
+        distances, indices = compute_gower_knn(values, codes, 5, block_size=7)
+        np.testing.assert_array_equal(indices[:, 0], np.arange(80))
+        np.testing.assert_allclose(distances, np.sort(expected, axis=1)[:, :6], atol=1e-12)
+        np.testing.assert_allclose(distances, np.take_along_axis(expected, indices, axis=1), atol=1e-12)
+        distances, indices = compute_gower_knn(values[:3], codes[:3], 4)
+        self.assertTrue(np.all(indices[:, 3:] == 3) and np.all(np.isinf(distances[:, 3:])))
+
+    def test_gower_graph(self):
+        # A numeric column that is not listed (e.g. a target) stays out of the distances
+        df = self.df.assign(target=np.arange(80))
+        G = create_graph(preprocessed_dataframe=df, numeric_columns=['A', 'B'], categorical_columns=['color', 'size'],
+                         method='gower', k=3, output_directory=self.test_dir.name, graph_filename='gower.graphml',
+                         verbose=False)
+        _, indices = compute_gower_knn(self.df[['A', 'B']].values, get_categorical_codes(self.df, ['color', 'size']), 3)
+        expected = {frozenset((u, int(v))) for u in range(80) for v in indices[u, 1:]}
+        self.assertEqual(set(map(frozenset, G.edges())), expected)
+        with self.assertRaises(ValueError):
+            create_graph(preprocessed_dataframe=self.df, categorical_columns=['shape'], method='gower',
+                         output_directory=self.test_dir.name, verbose=False)
+        with self.assertRaises(ValueError):
+            create_graph(preprocessed_dataframe=self.df, method='gower', output_directory=self.test_dir.name,
+                         verbose=False)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import unittest
+import networkx as nx
+import numpy as np
+from tagra.context import AnalysisContext
+from tagra.kernels import (
+    NUMBA_AVAILABLE,
+    adjacency_csr,
+    clustering_coefficients,
+    mixing_matrices,
+    neighbor_label_counts,
+    neighbor_mean,
+    resolve_backend
+)
+from tagra.utils import graph_edge_arrays, mixing_matrix
+
+BACKENDS = ['numba', 'numpy'] if NUMBA_AVAILABLE else ['numpy']
+
+class TestKernels(unittest.TestCase):
+
+    def setUp(self):
+        self.G = nx.gnm_random_graph(300, 1500, seed=0)
+        self.G.add_edge(0, 0)
+        self.n = self.G.number_of_nodes()
+        self.sources, self.targets = graph_edge_arrays(self.G)
+        self.codes = np.random.default_rng(0).integers(0, 3, self.n)
+
+    def test_adjacency(self):
+        indptr, indices = adjacency_csr(self.sources, self.targets, self.n)
+        for u in [0, 1, 50]:
+            self.assertEqual(list(indices[indptr[u]:indptr[u + 1]]), sorted(self.G.neighbors(u)))
+        indptr, indices = adjacency_csr(self.sources, self.targets, self.n, self_loops=False)
+        self.assertNotIn(0, indices[indptr[0]:indptr[1]])
+
+    def test_neighbor_label_counts(self):
+        indptr, indices = adjacency_csr(self.sources, self.targets, self.n)
+        for backend in BACKENDS:
+            counts = neighbor_label_counts(indptr, indices, self.codes, 3, backend=backend)
+            for u in [0, 1, 50]:
+                expected = np.bincount(self.codes[list(self.G.neighbors(u))], minlength=3)
+                np.testing.assert_array_equal(counts[u], expected)
+
+    def test_clustering(self):
+        indptr, indices = adjacency_csr(self.sources, self.targets, self.n, self_loops=False)
+        expected = nx.clustering(self.G)
+        for backend in BACKENDS:
+            coefficients = clustering_coefficients(indptr, indices, backend=backend)
+            np.testing.assert_allclose(coefficients, [expected[u] for u in range(self.n)])
+        np.testing.assert_allclose(AnalysisContext(self.G).clustering(), [expected[u] for u in range(self.n)])
+
+    def test_mixing_matrices(self):
+        rows = np.vstack([self.codes, self.codes[::-1]])
+        for backend in BACKENDS:
+            matrices = mixing_matrices(rows, self.sources, self.targets, 3, backend=backend)
+            for row, matrix in zip(rows, matrices):
+                np.testing.assert_array_equal(matrix, mixing_matrix(row, self.sources, self.targets, 3))
+
+    def test_neighbor_mean(self):
+        indptr, indices = adjacency_csr(self.sources, self.targets, self.n)
+        values = np.eye(3)[self.codes]
+        results = [neighbor_mean(indptr, indices, values, backend=backend) for backend in BACKENDS]
+        counts = neighbor_label_counts(indptr, indices, self.codes, 3, backend='numpy')
+        np.testing.assert_allclose(results[0], counts / counts.sum(axis=1, keepdims=True))
+        np.testing.assert_allclose(results[0], results[-1])
+
+    def test_resolve_backend(self):
+        self.assertEqual(resolve_backend('numpy'), 'numpy')
+        self.assertEqual(resolve_backend(None), 'numba' if NUMBA_AVAILABLE else 'numpy')
+        with self.assertRaises(ValueError):
+            resolve_backend('cuda')
+
+if __name__ == '__main__':
+    unittest.main()
+
+_CONCURRENT_SCRIPT = """
+import threading
+import numba
+import numpy as np
+from tagra.kernels import adjacency_csr, kernel_lock, neighbor_label_counts, start_threading_layer
+assert numba.config.THREADING_LAYER == 'workqueue'
+print(start_threading_layer())
+
+@numba.njit(parallel=True)
+def other_library(n):
+    total = 0.0
+    for i in numba.prange(n):
+        total += np.sqrt(i)
+    return total
+
+indptr, indices = adjacency_csr(np.arange(9999), np.arange(1, 10000), 10000)
+codes = np.zeros(10000, dtype=np.int64)
+thread = threading.Thread(target=lambda: [neighbor_label_counts(indptr, indices, codes, 1) for _ in range(200)])
+thread.start()
+for _ in range(200):
+    with kernel_lock():
+        other_library(100000)
+thread.join()
+"""
+
+@unittest.skipUnless(NUMBA_AVAILABLE, "numba is not installed")
+class TestThreadingLayer(unittest.TestCase):
+
+    def run_script(self, script, threading_layer=None):
+        env = {key: value for key, value in os.environ.items() if key != 'NUMBA_THREADING_LAYER'}
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if threading_layer is not None:
+            env['NUMBA_THREADING_LAYER'] = threading_layer
+        return subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, timeout=300)
+
+    def test_import_keeps_numba_config(self):
+        result = self.run_script("import numba, tagra.kernels; print(numba.config.THREADING_LAYER)")
+        self.assertEqual(result.stdout.strip(), 'default')
+
+    def test_workqueue_concurrent_kernels(self):
+        # Without kernel_lock numba aborts the process: "Concurrent access has been detected"
+        result = self.run_script(_CONCURRENT_SCRIPT, threading_layer='workqueue')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), 'workqueue')
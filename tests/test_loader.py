@@ -0,0 +1,77 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from tagra.loader import load_dataframe, downcast_dataframe, source_name
+
+class TestLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            'A': np.arange(20, dtype=np.int64),
+            'B': np.linspace(0, 1, 20),
+            'C': ['x', 'y'] * 10,
+            'D': [f'id{i}' for i in range(20)]
+        })
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.test_dir.name, name)
+
+    def test_csv_exclude_columns(self):
+        self.df.to_csv(self.path('data.csv'), index=False)
+        df = load_dataframe(self.path('data.csv'), exclude_columns=['D', 'missing'])
+        self.assertEqual(list(df.columns), ['A', 'B', 'C'])
+        self.assertEqual(df.attrs['source_path'], self.path('data.csv'))
+
+    def test_csv_index_column(self):
+        self.df.to_csv(self.path('data.csv'))
+        df = load_dataframe(self.path('data.csv'), columns=['A', 'C'])
+        self.assertEqual(list(df.columns), ['A', 'C'])
+        self.assertEqual(list(df.index), list(range(20)))
+        self.assertIsNone(df.index.name)
+
+    def test_csv_missing_values(self):
+        with open(self.path('data.csv'), 'w') as f:
+            f.write("label,day,value\nx,2020-01-01,1\n,2020-01-02,\ny,,3\nNA,2020-01-04,4\n")
+        df = load_dataframe(self.path('data.csv'), downcast=False)
+        pd.testing.assert_frame_equal(df, pd.read_csv(self.path('data.csv')))
+        self.assertEqual(df['label'].isna().tolist(), [False, True, False, True])
+        self.assertEqual(df['day'][0], '2020-01-01')
+
+    def test_parquet_column_projection(self):
+        self.df.to_parquet(self.path('data.parquet'))
+        df = load_dataframe(self.path('data.parquet'), exclude_columns=['B'])
+        self.assertEqual(list(df.columns), ['A', 'C', 'D'])
+
+    def test_feather_column_projection(self):
+        self.df.to_feather(self.path('data.feather'))
+        df = load_dataframe(self.path('data.feather'), columns=['B'])
+        self.assertEqual(list(df.columns), ['B'])
+
+    def test_downcast(self):
+        df = downcast_dataframe(self.df.copy())
+        self.assertEqual(df['A'].dtype, np.int32)
+        # Floats keep their precision unless asked
+        self.assertEqual(df['B'].dtype, np.float64)
+        self.assertIsInstance(df['C'].dtype, pd.CategoricalDtype)
+        self.assertEqual(df['D'].dtype, object)
+        self.assertEqual(downcast_dataframe(self.df.copy(), floats=True)['B'].dtype, np.float32)
+        self.df.to_csv(self.path('data.csv'), index=False)
+        self.assertEqual(load_dataframe(self.path('data.csv'))['B'].dtype, np.float64)
+        self.assertEqual(load_dataframe(self.path('data.csv'), downcast_floats=True)['B'].dtype, np.float32)
+
+    def test_dataframe_passthrough(self):
+        self.assertIs(load_dataframe(self.df), self.df)
+        self.assertIsNone(source_name(self.df))
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            load_dataframe(self.path('data.txt'))
+
+if __name__ == '__main__':
+    unittest.main()
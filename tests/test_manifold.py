@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from tagra.manifold import compute_manifold, stratified_sample
+
+class TestManifold(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = np.vstack([rng.normal(0, 1, size=(150, 4)), rng.normal(6, 1, size=(50, 4))])
+        self.labels = np.array(['a'] * 150 + ['b'] * 50)
+
+    def test_stratified_sample_proportions(self):
+        sample = stratified_sample(len(self.labels), 40, strata=self.labels)
+        self.assertEqual(len(sample), 40)
+        self.assertEqual(len(np.unique(sample)), 40)
+        self.assertEqual((self.labels[sample] == 'a').sum(), 30)
+        self.assertEqual((self.labels[sample] == 'b').sum(), 10)
+
+    def test_stratified_sample_keeps_rare_strata(self):
+        labels = np.array(['a'] * 98 + ['b', 'c'])
+        sample = stratified_sample(len(labels), 3, strata=labels)
+        self.assertEqual(len(sample), 3)
+        self.assertEqual(set(labels[sample]), {'a', 'b', 'c'})
+
+    def test_subsampled_manifold_with_interpolation(self):
+        embedding = compute_manifold(self.values, manifold_method='TSNE', sample_size=60,
+                                     strata=self.labels, verbose=False)
+        self.assertEqual(embedding.shape, (200, 2))
+        self.assertTrue(np.isfinite(embedding).all())
+
+    def test_subsampled_manifold_with_transform(self):
+        embedding = compute_manifold(self.values, manifold_method='Isomap', sample_size=60, verbose=False)
+        self.assertEqual(embedding.shape, (200, 2))
+        self.assertTrue(np.isfinite(embedding).all())
+
+    def test_unsupported_method(self):
+        with self.assertRaises(ValueError):
+            compute_manifold(self.values, manifold_method='MDS', verbose=False)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from tagra.memory import MemoryTracker, check_memory_budget, estimate_memory, parse_memory
+
+class TestMemory(unittest.TestCase):
+
+    def test_parse_memory(self):
+        self.assertEqual(parse_memory(1000), 1000)
+        self.assertEqual(parse_memory('512MB'), 512 * 2**20)
+        self.assertEqual(parse_memory('1.5 gb'), int(1.5 * 2**30))
+        self.assertEqual(parse_memory('4KiB'), 4096)
+        with self.assertRaises(ValueError):
+            parse_memory('a lot')
+
+    def test_estimate_memory(self):
+        estimate = estimate_memory(10000, 20, dtype='float64')
+        estimate_32 = estimate_memory(10000, 20, dtype='float32')
+        self.assertEqual(estimate['features'], 10000 * 20 * 8)
+        self.assertEqual(estimate_32['features'], estimate['features'] // 2)
+        similarity = estimate_memory(10000, 20, method='similarity')
+        self.assertGreater(similarity['graph'], 10000 ** 2 * 8)
+        isomap = estimate_memory(10000, 20, manifold_method='Isomap', manifold_sample_size=1000)
+        self.assertGreaterEqual(isomap['manifold'], 1000 ** 2 * 8)
+        spectral = estimate_memory(10000, 20, manifold_method='spectral', manifold_sample_size=1000)
+        self.assertGreaterEqual(spectral['manifold'], 10000 * 5 * 2 * 12)
+        with self.assertRaises(ValueError):
+            estimate_memory(10, 2, dtype='float16')
+
+    def test_check_memory_budget(self):
+        estimate = estimate_memory(100000, 10, method='similarity')
+        with self.assertRaises(MemoryError) as error:
+            check_memory_budget(estimate, '1GB')
+        self.assertIn('graph', str(error.exception))
+        check_memory_budget(estimate_memory(1000, 10), '1GB')
+
+    def test_tracker(self):
+        with MemoryTracker() as tracker:
+            with tracker.stage('outer'):
+                with tracker.stage('small'):
+                    small = np.ones(10**5)
+                with tracker.stage('large'):
+                    large = np.ones(10**7)
+                    del large
+        self.assertGreater(tracker.peaks['large'], 8 * 10**7)
+        self.assertLess(tracker.peaks['small'], 8 * 10**7)
+        self.assertGreaterEqual(tracker.peaks['outer'], tracker.peaks['large'])
+        self.assertGreaterEqual(tracker.allocated['small'], small.nbytes)
+        self.assertLess(tracker.allocated['large'], 8 * 10**6)
+
+if __name__ == '__main__':
+    unittest.main()
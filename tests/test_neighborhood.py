@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import networkx as nx
+import numpy as np
+import pandas as pd
+from tagra.context import AnalysisContext
+from tagra.neighborhood import export_neighborhood_features, multi_hop_features, neighborhood_feature_chunks
+from tagra.utils import analyze_neighborhood_attributes
+
+class TestNeighborhoodFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.G = nx.gnm_random_graph(60, 150, seed=0)
+        self.G.add_node(60)
+        rng = np.random.default_rng(0)
+        for node in self.G:
+            self.G.nodes[node]['target'] = rng.choice(['a', 'b', 'c'])
+        self.values = pd.DataFrame(rng.normal(size=(61, 2)), columns=['x', 'y'])
+        adjacency = nx.to_numpy_array(self.G)
+        degree = adjacency.sum(axis=1, keepdims=True)
+        self.P = np.divide(adjacency, degree, out=np.zeros_like(adjacency), where=degree > 0)
+
+    def test_multi_hop_distributions(self):
+        df = pd.concat(neighborhood_feature_chunks(self.G, 'target', values=self.values, chunk_size=7))
+        self.assertEqual(len(df), 61)
+        labels = ['a', 'b', 'c']
+        one_hot = np.array([[self.G.nodes[n]['target'] == label for label in labels] for n in self.G], dtype=float)
+        for hop in [1, 2, 3]:
+            expected = np.linalg.matrix_power(self.P, hop) @ one_hot
+            for j, label in enumerate(labels):
+                np.testing.assert_allclose(df[f'hop{hop}_target_{label}'], expected[:, j], rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(df[['mean_x', 'mean_y']], self.P @ self.values.values, rtol=1e-5, atol=1e-6)
+        # Hop 1 is the neighbor class probability of the analysis
+        neighborhood = analyze_neighborhood_attributes(self.G, 'target', return_probs=True)
+        connected = neighborhood['degree'].to_numpy() > 0
+        np.testing.assert_allclose(df['hop1_target_a'][connected], neighborhood['p_a'][connected], rtol=1e-6)
+        np.testing.assert_array_equal(df['degree'], neighborhood['degree'])
+        self.assertEqual(df.iloc[60]['hop3_target_a'], 0)
+
+    def test_memory_mapped_values_by_blocks(self):
+        context = AnalysisContext(self.G)
+        indptr, indices = context.adjacency()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            values = np.memmap(os.path.join(temp_dir, 'values.dat'), dtype=np.float32, mode='w+', shape=(61, 5))
+            values[:] = np.random.default_rng(1).normal(size=(61, 5))
+            # Blocks of 2 columns
+            with mock.patch('tagra.neighborhood.VALUE_BLOCK_ELEMENTS', 2 * 61):
+                _, means = multi_hop_features(indptr, indices, values=values, hops=1)
+            self.assertEqual(means.dtype, np.float32)
+            np.testing.assert_allclose(means, self.P @ np.asarray(values, dtype=float), rtol=1e-5, atol=1e-6)
+            del values
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'features', 'neighborhood.parquet')
+            export_neighborhood_features(AnalysisContext(self.G), path, ['target'], values=self.values.values,
+                                         value_columns=['x', 'y'], hops=2, chunk_size=25, verbose=False)
+            df = pd.read_parquet(path)
+            expected = pd.concat(neighborhood_feature_chunks(self.G, 'target', values=self.values, hops=2),
+                                 ignore_index=True)
+            pd.testing.assert_frame_equal(df, expected)
+            self.assertNotIn('hop3_target_a', df.columns)
+            with self.assertRaises(ValueError):
+                export_neighborhood_features(self.G, os.path.join(temp_dir, 'neighborhood.csv'), verbose=False)
+            with self.assertRaises(ValueError):
+                next(neighborhood_feature_chunks(self.G, values=self.values.values[:10]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,274 @@
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+import numpy as np
+import pandas as pd
+from tagra.config import default_config
+from tagra.pipeline import Pipeline, build_pipeline, run_pipeline
+
+def _sleep_and_return(value, seconds=0.2):
+    time.sleep(seconds)
+    return value
+
+class TestPipeline(unittest.TestCase):
+
+    def test_results_follow_dependencies(self):
+        pipeline = Pipeline(n_workers=2, verbose=False)
+        pipeline.add_stage('a', lambda: 2)
+        pipeline.add_stage('b', lambda a: a * 3, ['a'])
+        pipeline.add_stage('c', lambda a: a + 1, ['a'], executor='main')
+        pipeline.add_stage('d', lambda b, c: (b, c), ['b', 'c'])
+        self.assertEqual(pipeline.run(), {'a': 2, 'b': 6, 'c': 3, 'd': (6, 3)})
+
+    def test_independent_stages_overlap(self):
+        pipeline = Pipeline(n_workers=2, verbose=False)
+        pipeline.add_stage('slow', lambda: _sleep_and_return('slow', 0.4))
+        pipeline.add_stage('fast', lambda: _sleep_and_return('fast', 0.1))
+        pipeline.add_stage('after_fast', lambda fast: _sleep_and_return(fast, 0.1), ['fast'])
+        pipeline.add_stage('main', lambda: _sleep_and_return('main', 0.3), executor='main')
+        pipeline.run()
+        stages = pipeline.summary()['stages']
+
+        def overlap(first, second):
+            return (stages[first]['start'] < stages[second]['start'] + stages[second]['duration']
+                    and stages[second]['start'] < stages[first]['start'] + stages[first]['duration'])
+        self.assertTrue(overlap('slow', 'fast'))
+        self.assertTrue(overlap('slow', 'main'))
+        self.assertGreaterEqual(stages['after_fast']['start'], stages['fast']['start'] + stages['fast']['duration'])
+        path, duration = pipeline.critical_path()
+        self.assertEqual(path, ['slow'])
+        self.assertGreaterEqual(duration, 0.4)
+        self.assertEqual(set(pipeline.summary()['stages']), {'slow', 'fast', 'after_fast', 'main'})
+        self.assertTrue(any('Critical path' in line for line in pipeline.report()))
+
+    def test_stages_done_before_callback(self):
+        # A future that is already done when add_done_callback is called runs its callback, and the
+        # scheduling of the next stages, before submit returns to the scheduler
+        with mock.patch('tagra.pipeline.ThreadPoolExecutor', _ImmediateExecutor):
+            pipeline = Pipeline(verbose=False)
+            pipeline.add_stage('a', lambda: 1)
+            pipeline.add_stage('b', lambda a: a + 1, ['a'])
+            pipeline.add_stage('c', lambda a: a + 2, ['a'])
+            pipeline.add_stage('d', lambda b, c: b * c, ['b', 'c'])
+            self.assertEqual(pipeline.run()['d'], 6)
+
+    def test_process_executor(self):
+        pipeline = Pipeline(n_workers=2, executor='process', verbose=False)
+        pipeline.add_stage('value', _ProcessStage(-3))
+        pipeline.add_stage('square', _ProcessStage(None), ['value'])
+        self.assertEqual(pipeline.run()['square'], 9)
+
+    def test_errors(self):
+        pipeline = Pipeline(verbose=False)
+        pipeline.add_stage('a', lambda: 1)
+        with self.assertRaises(ValueError):
+            pipeline.add_stage('a', lambda: 1)
+        with self.assertRaises(ValueError):
+            pipeline.add_stage('b', lambda x: x, ['missing'])
+        with self.assertRaises(ValueError):
+            pipeline.add_stage('c', lambda: 1, executor='gpu')
+
+        def fail(a):
+            raise RuntimeError("stage failed")
+        pipeline.add_stage('fail', fail, ['a'])
+        pipeline.add_stage('after', lambda fail: fail, ['fail'])
+        with self.assertRaises(RuntimeError):
+            pipeline.run()
+
+class _ImmediateExecutor:
+    """Executor running each call in submit, so that its future is done before any callback is added."""
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+class _ProcessStage:
+    """Picklable stage: returns its value, or squares its input."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, *args):
+        return self.value if not args else args[0] ** 2
+
+class TestRunPipeline(unittest.TestCase):
+
+    def test_run_pipeline(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 50), rng.normal(5, 1, 50)],
+                           'x2': rng.normal(0, 1, 100),
+                           'target': np.repeat(['a', 'b'], 50)})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.csv')
+            df.to_csv(path, index=False)
+            config = dict(default_config, input_dataframe=path, output_directory=temp_dir,
+                          target_columns='target', manifold_method=None, verbose=False, overwrite=True,
+                          graph_visualization_filename=None, n_workers=2)
+            metrics = run_pipeline(config)
+            self.assertEqual(metrics['nodes'], 100)
+            self.assertGreater(metrics['homophily_score'], 0.9)
+            self.assertIn('graph', metrics['pipeline']['stages'])
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, 'degree.png')))
+            # The inferred columns do not leak into the shared defaults
+            self.assertEqual(default_config['numeric_columns'], [])
+            self.assertEqual(default_config['ignore_columns'], [])
+
+    def test_process_executor(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 50), rng.normal(5, 1, 50)],
+                           'x2': rng.normal(0, 1, 100),
+                           'target': np.repeat(['a', 'b'], 50)})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.csv')
+            df.to_csv(path, index=False)
+            config = dict(default_config, input_dataframe=path, output_directory=temp_dir,
+                          target_columns='target', manifold_method=None, verbose=False, overwrite=True,
+                          graph_visualization_filename=None, n_workers=2, pipeline_executor='process',
+                          coarsen_method='matching', coarsen_max_nodes=10)
+            pipeline = build_pipeline(config)
+            # The stages sharing the AnalysisContext stay in this process
+            self.assertEqual(pipeline.stages['load'][2], 'process')
+            self.assertEqual(pipeline.stages['graph'][2], 'thread')
+            self.assertEqual(pipeline.stages['coarsen'][2], 'thread')
+            metrics = pipeline.run()['report']
+            self.assertEqual(metrics['nodes'], 100)
+            self.assertGreater(metrics['homophily_score'], 0.9)
+
+    def test_float32_and_memory(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 50), rng.normal(5, 1, 50)],
+                           'x2': rng.normal(0, 1, 100),
+                           'target': np.repeat(['a', 'b'], 50)})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.csv')
+            df.to_csv(path, index=False)
+            config = dict(default_config, input_dataframe=path, output_directory=temp_dir,
+                          target_columns='target', manifold_method=None, verbose=False, overwrite=True,
+                          graph_visualization_filename=None, dtype='float32', memory_budget='1GB',
+                          track_memory=True)
+            metrics = run_pipeline(config)
+            self.assertGreater(metrics['homophily_score'], 0.9)
+            self.assertGreater(metrics['pipeline']['peak_memory'], 0)
+            self.assertGreater(metrics['pipeline']['stages']['graph']['peak_memory'], 0)
+            with self.assertRaises(MemoryError):
+                run_pipeline(dict(config, method='similarity', similarity_threshold=0.9, memory_budget='10KB'))
+
+    def test_projection_features(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame(rng.normal(0, 1, (100, 8)), columns=[f'x{i}' for i in range(8)])
+        df['target'] = np.repeat([0, 1], 50)
+        df['row_id'] = np.arange(100)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.csv')
+            df.to_csv(path, index=False)
+            config = dict(default_config, input_dataframe=path, output_directory=temp_dir,
+                          target_columns='target', ignore_columns=['row_id'], manifold_method=None,
+                          verbose=False, overwrite=True, graph_visualization_filename=None,
+                          projection_method='pca', projection_dim=3, projection_filename=None)
+            results = build_pipeline(config).run()
+            # Only the projected coordinates are features, not the numeric target or the ignored column
+            self.assertEqual(results['preprocess']['numeric_columns'], ['projection_0', 'projection_1', 'projection_2'])
+            self.assertEqual(results['features'].shape, (100, 3))
+
+    def test_coarsen(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 50), rng.normal(5, 1, 50)],
+                           'x2': rng.normal(0, 1, 100),
+                           'target': np.repeat(['a', 'b'], 50)})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.csv')
+            df.to_csv(path, index=False)
+            config = dict(default_config, input_dataframe=path, output_directory=temp_dir,
+                          target_columns='target', manifold_method=None, verbose=False, overwrite=True,
+                          graph_visualization_filename=None, coarsen_method='matching', coarsen_max_nodes=10,
+                          super_graph_filename='super_graph.pickle')
+            results = build_pipeline(config).run()
+            super_graph = results['coarsen']
+            self.assertLessEqual(super_graph.number_of_nodes(), 10)
+            self.assertEqual(sum(super_graph.nodes[i]['size'] for i in super_graph), 100)
+            self.assertIn('target_purity', super_graph.nodes[0])
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, 'super_graph.pickle')))
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, 'super_graph.png')))
+
+    def test_neighborhood_features(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 50), rng.normal(5, 1, 50)],
+                           'x2': rng.normal(0, 1, 100),
+                           'target': np.repeat(['a', 'b'], 50)})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.csv')
+            df.to_csv(path, index=False)
+            config = dict(default_config, input_dataframe=path, output_directory=temp_dir,
+                          target_columns='target', manifold_method=None, verbose=False, overwrite=True,
+                          graph_visualization_filename=None, neighborhood_features_filename='neighborhood.parquet',
+                          neighborhood_hops=2)
+            build_pipeline(config).run()
+            features = pd.read_parquet(os.path.join(temp_dir, 'neighborhood.parquet'))
+            self.assertEqual(len(features), 100)
+            self.assertIn('hop2_target_a', features.columns)
+            self.assertIn('mean_x1', features.columns)
+            self.assertGreater(features['hop1_target_a'][:50].mean(), 0.9)
+
+    def test_gower(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 50), rng.normal(5, 1, 50)],
+                           'x2': rng.normal(0, 1, 100),
+                           'group': np.repeat(['u', 'v'], 50),
+                           'target': np.repeat(['a', 'b'], 50)})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.csv')
+            df.to_csv(path, index=False)
+            config = dict(default_config, input_dataframe=path, output_directory=temp_dir,
+                          target_columns='target', numeric_columns=['x1', 'x2'], categorical_columns=['group'],
+                          categorical_encoding='label', method='gower', memory_budget='1GB',
+                          manifold_method=None, verbose=False, overwrite=True, graph_visualization_filename=None)
+            metrics = run_pipeline(config)
+            self.assertEqual(metrics['nodes'], 100)
+            self.assertGreater(metrics['homophily_score'], 0.9)
+
+    def test_sampled_estimates(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'x1': rng.normal(0, 1, 100), 'x2': rng.normal(0, 1, 100),
+                           'target': np.repeat(['a', 'b'], 50)})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.csv')
+            df.to_csv(path, index=False)
+            config = dict(default_config, input_dataframe=path, output_directory=temp_dir,
+                          target_columns='target', manifold_method=None, verbose=False, overwrite=True,
+                          graph_visualization_filename=None, path_length_samples=10, betweenness_samples=10,
+                          pagerank_centrality=True, estimate_time_budget=5)
+            metrics = run_pipeline(config)
+            self.assertEqual(metrics['path_samples'], 10)
+            self.assertLessEqual(metrics['diameter_lower'], metrics['diameter_upper'])
+            self.assertAlmostEqual(metrics['node_metrics']['pagerank'].sum(), 1)
+
+    def test_spectral(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 50), rng.normal(8, 1, 50)],
+                           'x2': rng.normal(0, 1, 100),
+                           'target': np.repeat(['a', 'b'], 50)})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.csv')
+            df.to_csv(path, index=False)
+            config = dict(default_config, input_dataframe=path, output_directory=temp_dir,
+                          target_columns='target', manifold_method='spectral', spectral_eigenvalues=4,
+                          memory_budget='1GB', verbose=False, overwrite=True)
+            results = build_pipeline(config).run()
+            self.assertEqual(results['manifold'].shape, (100, 2))
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, 'graph.png')))
+            metrics = results['report']
+            self.assertGreaterEqual(metrics['zero_eigenvalues'], 2)
+            self.assertIn('fiedler', metrics['node_metrics'])
+
+if __name__ == '__main__':
+    unittest.main()
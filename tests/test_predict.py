@@ -0,0 +1,89 @@
+import unittest
+import networkx as nx
+import numpy as np
+import pandas as pd
+from tagra.kernels import adjacency_csr
+from tagra.predict import LabelPredictor, evaluate_label_prediction, propagate_labels
+from tagra.query import NeighborIndex
+from tagra.utils import graph_edge_arrays
+
+class TestLabelPropagation(unittest.TestCase):
+
+    def setUp(self):
+        # Two cliques of 10 nodes joined by a path of 4 nodes, and an isolated node
+        self.G = nx.barbell_graph(10, 4)
+        self.G.add_node(24)
+        for node in range(10):
+            self.G.nodes[node]['target'] = 'a'
+        for node in range(14, 24):
+            self.G.nodes[node]['target'] = 'b'
+        self.G.nodes[24]['target'] = 'b'
+
+    def test_propagate_labels(self):
+        sources, targets = graph_edge_arrays(self.G)
+        indptr, indices = adjacency_csr(sources, targets, 25)
+        codes = np.full(25, -1)
+        codes[0], codes[23] = 0, 1
+        distributions, iterations = propagate_labels(indptr, indices, codes, 2, max_iter=500, tol=1e-6)
+        self.assertLess(iterations, 500)
+        np.testing.assert_array_equal(distributions[[0, 23]], [[1, 0], [0, 1]])
+        self.assertTrue(np.all(distributions[1:10, 0] > 0.5) and np.all(distributions[14:23, 1] > 0.5))
+        np.testing.assert_array_equal(distributions[24], [0, 0])
+        # The harmonic solution is the average of the neighbors at every unlabeled node
+        unlabeled = [n for n in range(1, 23)]
+        means = np.array([distributions[list(self.G.neighbors(n))].mean(axis=0) for n in unlabeled])
+        np.testing.assert_allclose(distributions[unlabeled], means, atol=1e-4)
+
+    def test_predictor(self):
+        predictor = LabelPredictor(self.G, 'target', labeled=[0, 23, 24])
+        predictions = predictor.predict()
+        self.assertEqual(list(predictions[:10]), ['a'] * 10)
+        self.assertEqual(list(predictions[14:25]), ['b'] * 11)
+        probabilities = predictor.predict_proba([5, 20])
+        self.assertEqual(list(probabilities.columns), ['a', 'b'])
+        np.testing.assert_allclose(probabilities.sum(axis=1), 1)
+        vote = LabelPredictor(self.G, 'target', method='vote', labeled=[0, 23])
+        self.assertEqual(vote.n_iterations, 1)
+        self.assertEqual(list(vote.predict([1, 5, 22])), ['a', 'a', 'b'])
+        self.assertIsNone(vote.predict([12])[0])
+        with self.assertRaises(ValueError):
+            LabelPredictor(self.G, 'target', method='svm')
+        with self.assertRaises(ValueError):
+            predictor.predict([99])
+
+    def test_none_class(self):
+        # A class named 'None' is a label; only the nodes without the attribute (the path) are unlabeled
+        for node in range(14, 25):
+            self.G.nodes[node]['target'] = 'None'
+        self.G.nodes[13]['target'] = float('nan')
+        predictor = LabelPredictor(self.G, 'target')
+        self.assertEqual(list(predictor.classes), ['a', 'None'])
+        self.assertNotIn(12, predictor.labeled)
+        self.assertNotIn(13, predictor.labeled)
+        self.assertEqual(predictor.predict([13])[0], 'None')
+        self.assertEqual(list(predictor.predict([20, 24])), ['None', 'None'])
+
+    def test_predict_records(self):
+        values = np.r_[np.zeros((12, 2)), np.ones((13, 2)) * 10] + np.arange(25)[:, None] * 0.01
+        index = NeighborIndex(values, ['x', 'y'])
+        predictor = LabelPredictor(self.G, 'target')
+        records = pd.DataFrame({'x': [0.1, 9.9], 'y': [0.0, 10.2]})
+        predictions, probabilities = predictor.predict_records(records, index, k=3, batch_size=1,
+                                                               return_probabilities=True)
+        self.assertEqual(list(predictions), ['a', 'b'])
+        np.testing.assert_allclose(probabilities.sum(axis=1), 1)
+        with self.assertRaises(ValueError):
+            predictor.predict_records(records, NeighborIndex(values[:5], ['x', 'y']))
+
+    def test_evaluate(self):
+        G = nx.connected_caveman_graph(6, 8)
+        for node in G:
+            G.nodes[node]['target'] = str(node // 8)
+        for method in ['propagation', 'vote']:
+            results = evaluate_label_prediction(G, 'target', method=method, test_fraction=0.25, verbose=False)
+            self.assertGreater(results['accuracy'], 0.9)
+            self.assertLess(results['baseline_accuracy'], 0.5)
+            self.assertGreater(results['nodes_per_second'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
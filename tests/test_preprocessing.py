@@ -1,7 +1,9 @@
 import unittest
 import pandas as pd
 import numpy as np
-from tagra.preprocessing import preprocess_dataframe
+import tempfile
+from sklearn.preprocessing import LabelEncoder
+from tagra.preprocessing import column_fill_values, preprocess_dataframe
 
 class TestPreprocessing(unittest.TestCase):
 
@@ -13,42 +15,95 @@ class TestPreprocessing(unittest.TestCase):
             'D': [np.nan, '2021-01-01', '2021-01-02', '2021-01-03', '2021-01-04']
         })
 
+    def preprocess(self, **kwargs):
+        with tempfile.TemporaryDirectory() as directory:
+            options = dict(output_directory=directory, numeric_columns=[], categorical_columns=[], target_columns=[],
+                           ignore_columns=[], manifold_method=None, verbose=False)
+            options.update(kwargs)
+            return preprocess_dataframe(self.df.copy(), **options)[0]
+
     def test_nan_action_drop_row(self):
-        result = preprocess_dataframe(self.df, nan_action='drop row')
+        result = self.preprocess(nan_action='drop row')
         self.assertEqual(len(result), 2)
 
     def test_nan_action_drop_column(self):
-        result = preprocess_dataframe(self.df, nan_action='drop column')
+        result = self.preprocess(nan_action='drop column', nan_threshold=0)
         self.assertNotIn('A', result.columns)
         self.assertNotIn('D', result.columns)
+        self.assertEqual(len(result), 5)
+        # Only the columns with a ratio of NaNs above the threshold are dropped
+        result = self.preprocess(nan_action='drop column', nan_threshold=0.3)
+        self.assertNotIn('A', result.columns)
+        self.assertIn('D_2021-01-01', result.columns)
 
     def test_nan_action_infer(self):
-        result = preprocess_dataframe(self.df, nan_action='infer')
+        result = self.preprocess(nan_action='infer')
         self.assertFalse(result.isnull().values.any())
 
     def test_numeric_scaling_standard(self):
-        result = preprocess_dataframe(self.df, numeric_cols=['A', 'C'], numeric_scaling='standard')
+        result = self.preprocess(numeric_columns=['A', 'C'], numeric_scaling='standard')
         self.assertAlmostEqual(result['A'].mean(), 0, places=5)
         self.assertAlmostEqual(result['C'].mean(), 0, places=5)
 
     def test_numeric_scaling_minmax(self):
-        result = preprocess_dataframe(self.df, numeric_cols=['A', 'C'], numeric_scaling='minmax')
+        result = self.preprocess(numeric_columns=['A', 'C'], numeric_scaling='minmax')
         self.assertAlmostEqual(result['A'].max(), 1)
         self.assertAlmostEqual(result['C'].max(), 1)
 
+    def test_float32(self):
+        result = self.preprocess(numeric_columns=['A', 'C'], dtype='float32')
+        self.assertEqual(result['A'].dtype, np.float32)
+        self.assertEqual(result['C'].dtype, np.float32)
+
     def test_categorical_encoding_one_hot(self):
-        result = preprocess_dataframe(self.df, categorical_cols=['B'], categorical_encoding='one-hot')
+        result = self.preprocess(categorical_columns=['B'], categorical_encoding='one-hot')
         self.assertIn('B_a', result.columns)
         self.assertIn('B_b', result.columns)
 
     def test_categorical_encoding_label(self):
-        result = preprocess_dataframe(self.df, categorical_cols=['B'], categorical_encoding='label')
+        result = self.preprocess(categorical_columns=['B'], categorical_encoding='label')
         self.assertTrue(np.issubdtype(result['B'].dtype, np.integer))
 
     def test_ignore_cols(self):
-        result = preprocess_dataframe(self.df, ignore_cols=['D'])
+        result = self.preprocess(ignore_columns=['D'])
         self.assertIn('D', result.columns)
 
+    def test_column_fill_values(self):
+        df = pd.DataFrame({'A': [1.0, np.nan, 4.0], 'B': ['b', 'a', 'b'], 'C': ['x', 'y', None],
+                           'E': [None, None, None]})
+        for n_jobs in [None, 2]:
+            values = column_fill_values(df, ['A'], ['B', 'C', 'E'], n_jobs=n_jobs)
+            self.assertEqual(values, {'A': 2.5, 'B': 'b', 'C': 'x', 'E': None})
+
+    def test_label_codes_match_label_encoder(self):
+        df = pd.DataFrame({'A': [1.0, np.nan, 3.0, 4.0], 'B': ['c', 'a', None, 'c'], 'C': ['z', 'y', 'x', 'y']})
+        with tempfile.TemporaryDirectory() as directory:
+            results = [preprocess_dataframe(df, output_directory=directory, preprocessed_filename='p.pickle',
+                                            numeric_columns=['A'], categorical_columns=['B', 'C'],
+                                            target_columns=[], ignore_columns=[], nan_action='infer',
+                                            categorical_encoding='label', manifold_method=None, n_jobs=n_jobs,
+                                            verbose=False, overwrite=True)[0]
+                       for n_jobs in [None, 2]]
+        pd.testing.assert_frame_equal(results[0], results[1])
+        for col, filled in [('B', ['c', 'a', 'c', 'c']), ('C', ['z', 'y', 'x', 'y'])]:
+            np.testing.assert_array_equal(results[0][col], LabelEncoder().fit_transform(filled))
+
+    def test_label_codes_missing_and_mixed(self):
+        df = pd.DataFrame({'A': [1.0, 2.0, 3.0, 4.0], 'B': ['c', 'a', None, 'c']})
+        kwargs = dict(preprocessed_filename='p.pickle', numeric_columns=['A'], categorical_columns=['B'],
+                      target_columns=[], ignore_columns=[], categorical_encoding='label', manifold_method=None,
+                      verbose=False, overwrite=True)
+        with tempfile.TemporaryDirectory() as directory:
+            # Missing values that are not filled are a last class, as with LabelEncoder
+            df_encoded, _, preprocessor = preprocess_dataframe(df, output_directory=directory, nan_action='drop_column',
+                                                               nan_threshold=0.5, return_preprocessor=True, **kwargs)
+            np.testing.assert_array_equal(df_encoded['B'], LabelEncoder().fit_transform(df['B'].to_numpy(dtype=object)))
+            np.testing.assert_array_equal(preprocessor.transform(df.iloc[[0, 1, 3]])['B'], df_encoded['B'].iloc[[0, 1, 3]])
+            with self.assertRaises(ValueError):
+                preprocessor.transform({'A': 1.0, 'B': 'b'})
+            with self.assertRaises(ValueError):
+                preprocess_dataframe(df.assign(B=['c', 1, 'a', 2]), output_directory=directory, **kwargs)
+
     # def test_infer_columns(self):
     #     df = pd.DataFrame({
     #         'A': [1, 2, 3, 4, 5],
@@ -0,0 +1,51 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from tagra.projection import project_dataframe, knn_overlap
+
+class TestProjection(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        latent = rng.normal(size=(200, 3))
+        values = latent @ rng.normal(size=(3, 20)) + 0.01 * rng.normal(size=(200, 20))
+        self.df = pd.DataFrame(values, columns=[f'f{i}' for i in range(20)])
+        self.df['label'] = ['a' if x > 0 else 'b' for x in latent[:, 0]]
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_projection_columns(self):
+        for method in ['pca', 'svd', 'random']:
+            df_projected, info = project_dataframe(self.df, projection_method=method, projection_dim=5, verbose=False)
+            self.assertEqual(len(df_projected), len(self.df))
+            self.assertIn('label', df_projected.columns)
+            self.assertEqual([c for c in df_projected.columns if c.startswith('projection_')],
+                             [f'projection_{i}' for i in range(5)])
+            self.assertEqual(info['projection_input_dim'], 20)
+
+    def test_knn_overlap(self):
+        values = self.df.drop(columns='label').values
+        self.assertAlmostEqual(knn_overlap(values, values, k=5), 1.0)
+        _, info = project_dataframe(self.df, projection_method='pca', projection_dim=3, verbose=False)
+        self.assertGreater(info['projection_knn_overlap'], 0.8)
+
+    def test_projection_cache(self):
+        kwargs = dict(projection_method='pca', projection_dim=4, output_directory=self.test_dir.name,
+                      projection_filename='projection.pickle', verbose=False)
+        df_first, info_first = project_dataframe(self.df, **kwargs)
+        df_second, info_second = project_dataframe(self.df, **kwargs)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir.name, 'projection.pickle')))
+        self.assertFalse(info_first['projection_from_cache'])
+        self.assertTrue(info_second['projection_from_cache'])
+        np.testing.assert_allclose(df_first['projection_0'], df_second['projection_0'])
+
+    def test_projection_skipped_when_dim_too_large(self):
+        df_projected, info = project_dataframe(self.df, projection_dim=50, verbose=False)
+        self.assertIs(df_projected, self.df)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from tagra.graph import create_graph
+from tagra.preprocessing import preprocess_dataframe
+from tagra.query import NeighborIndex, AsyncNeighborQuery, load_index
+
+class TestNeighborIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = rng.normal(size=(200, 6))
+        self.points = rng.normal(size=(30, 6))
+
+    def test_brute_matches_kdtree(self):
+        kdtree = NeighborIndex(self.values, list('abcdef'))
+        brute = NeighborIndex(self.values, list('abcdef'), method='brute')
+        for k in [1, 7, 200, 500]:
+            kd_distances, kd_indices = kdtree.query(self.points, k)
+            brute_distances, brute_indices = brute.query(self.points, k)
+            self.assertEqual(brute_indices.shape, (30, min(k, 200)))
+            np.testing.assert_allclose(brute_distances, kd_distances, atol=1e-9)
+            np.testing.assert_array_equal(brute_indices, kd_indices)
+        distances, indices = brute.query(self.points[0], 3)
+        self.assertEqual(indices.shape, (1, 3))
+        with self.assertRaises(ValueError):
+            brute.query(self.points[:, :2], 3)
+        with self.assertRaises(ValueError):
+            NeighborIndex(self.values, list('abcdef'), method='ball_tree')
+
+    def test_label_counts(self):
+        labels = np.array(['x', 'y', None, 'x', 'y'] * 40, dtype=object)
+        index = NeighborIndex(self.values, list('abcdef'), labels={'label': labels})
+        indices = np.array([[0, 1, 2, 3], [4, 4, 1, 0]])
+        classes, counts = index.label_counts(indices)['label']
+        self.assertEqual(list(classes), ['x', 'y'])
+        np.testing.assert_array_equal(counts, [[2, 1], [1, 3]])
+
+class TestQuery(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(1)
+        df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 40), rng.normal(8, 1, 40)],
+                           'x2': rng.normal(0, 1, 80),
+                           'color': np.tile(['red', 'blue'], 40),
+                           'label': np.repeat(['a', 'b'], 40)})
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        df_preprocessed, _, cls.preprocessor = preprocess_dataframe(
+            df, output_directory=cls.temp_dir.name, numeric_columns=['x1', 'x2'], categorical_columns=['color'],
+            target_columns=['label'], categorical_encoding='label', manifold_method=None, verbose=False,
+            return_preprocessor=True)
+        cls.graph = create_graph(input_dataframe=df, preprocessed_dataframe=df_preprocessed,
+                                 numeric_columns=['x1', 'x2', 'color'], output_directory=cls.temp_dir.name,
+                                 graph_filename='graph.graphml', index_filename='index.pickle',
+                                 index_labels=['label'], k=4, verbose=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    def test_index_saved_with_graph(self):
+        index = load_index(os.path.join(self.temp_dir.name, 'index.pickle'))
+        self.assertEqual(len(index), self.graph.number_of_nodes())
+        self.assertEqual(index.feature_columns, ['x1', 'x2', 'color'])
+        _, indices = index.query(index.values[:5], 5)
+        for node in range(5):
+            self.assertEqual(indices[node, 0], node)
+            self.assertTrue(set(indices[node, 1:]) <= set(self.graph.neighbors(node)))
+
+    def test_micro_batching(self):
+        query = AsyncNeighborQuery(os.path.join(self.temp_dir.name, 'index.pickle'), self.preprocessor,
+                                   k=3, max_batch_size=16, max_delay=0.01)
+        records = [{'x1': 8.0 if i % 2 else 0.0, 'x2': 0.0, 'color': 'red'} for i in range(40)]
+
+        async def run():
+            return await asyncio.gather(*[query.query(record) for record in records],
+                                        query.query({'x1': 0.0, 'x2': 0.0, 'color': 'purple'}),
+                                        query.query(records[0], k=1),
+                                        return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertEqual(sum(query.batch_sizes), 42)
+        self.assertLessEqual(len(query.batch_sizes), 4)
+        self.assertEqual(results[:40], query.query_batch(records))
+        self.assertEqual(results[1]['labels'], {'label': {'b': 1.0}})
+        self.assertIsInstance(results[40], ValueError)
+        self.assertEqual(results[41]['neighbors'], results[0]['neighbors'][:1])
+        self.assertEqual(results[41]['labels'], {'label': {'a': 1.0}})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from tagra.preprocessing import preprocess_dataframe
+from tagra.graph import create_graph
+from tagra.server import TagraService, TagraClient, create_server
+
+class TestServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'x1': np.r_[rng.normal(0, 1, 30), rng.normal(6, 1, 30)],
+                           'x2': rng.normal(0, 1, 60),
+                           'color': np.tile(['red', 'blue', 'green'], 20),
+                           'label': np.repeat(['a', 'b'], 30)})
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        preprocessor_path = os.path.join(cls.temp_dir.name, 'preprocessor.pickle')
+        df_preprocessed, _, cls.preprocessor = preprocess_dataframe(
+            df, output_directory=cls.temp_dir.name, numeric_columns=['x1', 'x2'], categorical_columns=['color'],
+            target_columns=['label'], manifold_method=None, verbose=False, preprocessor_filename=preprocessor_path,
+            return_preprocessor=True)
+        graph = create_graph(df_preprocessed, numeric_columns=['x1', 'x2'], method='knn', k=4,
+                             output_directory=cls.temp_dir.name, verbose=False)
+        cls.service = TagraService(graph, df_preprocessed, numeric_columns=['x1', 'x2'],
+                                   preprocessor=preprocessor_path, target_attribute='label')
+        cls.server = create_server(cls.service, port=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        host, port = cls.server.server_address[:2]
+        cls.client = TagraClient(f"http://{host}:{port}")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.temp_dir.cleanup()
+
+    def test_preprocessor_transform(self):
+        transformed = self.preprocessor.transform({'x1': 0.0, 'x2': None, 'color': 'blue'})
+        self.assertEqual(list(transformed.columns), self.preprocessor.columns)
+        self.assertFalse(transformed[['x1', 'x2']].isna().any().any())
+        self.assertTrue(transformed['color_blue'].iloc[0])
+        self.assertFalse(transformed['color_red'].iloc[0])
+
+    def test_queries(self):
+        self.assertEqual(self.client.health()['nodes'], 60)
+        neighbors = self.client.neighbors(3)
+        self.assertEqual(sorted(neighbors['neighbors']), sorted(self.service.graph.neighbors(3)))
+        self.assertEqual(sum(neighbors['labels'].values()), neighbors['degree'])
+        community = self.client.community(3)
+        self.assertIn(3, self.service.context.communities()[community['community']])
+        mixing = self.client.mixing('label')
+        self.assertEqual(sorted(mixing['labels']), ['a', 'b'])
+        self.assertEqual(np.array(mixing['mixing']).sum(), 2 * self.service.graph.number_of_edges())
+
+    def test_knn(self):
+        results = self.client.knn([{'x1': 6.0, 'x2': 0.0, 'color': 'red'},
+                                   {'x1': 0.0, 'x2': 0.0, 'color': 'red'}], k=3)['results']
+        self.assertEqual(results[0]['labels'], {'b': 3})
+        self.assertEqual(results[1]['labels'], {'a': 3})
+        self.assertTrue(np.all(np.diff(results[0]['distances']) >= 0))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.client.neighbors(1000)
+        with self.assertRaises(ValueError):
+            self.client.knn({'x1': 'far', 'x2': 0.0, 'color': 'red'})
+        with self.assertRaises(ValueError):
+            self.client.mixing('missing')
+        with mock.patch.object(self.service, 'community', side_effect=RuntimeError('broken')):
+            with self.assertRaisesRegex(ValueError, 'RuntimeError: broken'):
+                self.client.community(0)
+        # The server keeps answering after a failure
+        self.assertEqual(self.client.health()['nodes'], 60)
+
+    def test_concurrent_requests(self):
+        results = {}
+
+        def query(row):
+            results[row] = self.client.neighbors(row)['neighbors']
+
+        threads = [threading.Thread(target=query, args=(row,)) for row in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for row in range(20):
+            self.assertEqual(sorted(results[row]), sorted(self.service.graph.neighbors(row)))
+
+if __name__ == '__main__':
+    unittest.main()
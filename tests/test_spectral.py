@@ -0,0 +1,78 @@
+import unittest
+import networkx as nx
+import numpy as np
+import tagra.spectral as spectral
+from tagra.context import AnalysisContext
+from tagra.spectral import laplacian_spectrum, normalized_laplacian, spectral_embedding, spectral_metrics
+from tagra.utils import graph_edge_arrays
+
+class TestSpectral(unittest.TestCase):
+
+    def setUp(self):
+        # Three loosely joined cliques, a separate path and an isolated node
+        self.G = nx.disjoint_union(nx.connected_caveman_graph(3, 12), nx.path_graph(6))
+        self.G.add_node(42)
+        self.exact = np.linalg.eigh(nx.normalized_laplacian_matrix(self.G).toarray())
+
+    def tearDown(self):
+        spectral.DENSE_MAX_NODES = 500
+
+    def test_normalized_laplacian(self):
+        sources, targets = graph_edge_arrays(self.G)
+        laplacian = normalized_laplacian(sources, targets, self.G.number_of_nodes())
+        np.testing.assert_allclose(laplacian.toarray(), nx.normalized_laplacian_matrix(self.G).toarray(), atol=1e-12)
+
+    def test_spectrum(self):
+        values = self.exact[0]
+        for method, dense_max_nodes in [('eigsh', 500), ('eigsh', 10), ('lobpcg', 10)]:
+            spectral.DENSE_MAX_NODES = dense_max_nodes
+            eigenvalues, eigenvectors = laplacian_spectrum(self.G, 6, method=method, tol=1e-8)
+            np.testing.assert_allclose(eigenvalues, values[:6], atol=1e-6)
+            self.assertEqual(eigenvectors.shape, (43, 6))
+            laplacian = nx.normalized_laplacian_matrix(self.G).toarray()
+            np.testing.assert_allclose(laplacian @ eigenvectors, eigenvectors * eigenvalues, atol=1e-3)
+            np.testing.assert_allclose(np.linalg.norm(eigenvectors, axis=0), 1)
+        with self.assertRaises(ValueError):
+            laplacian_spectrum(self.G, method='arpack')
+
+    def test_spectral_metrics(self):
+        metrics, columns = spectral_metrics(AnalysisContext(self.G), 6, verbose=False)
+        self.assertEqual(metrics['zero_eigenvalues'], 3)
+        self.assertAlmostEqual(metrics['spectral_gap'], self.exact[0][3])
+        self.assertEqual(metrics['eigengap_clusters'], 5)
+        self.assertEqual(len(columns['fiedler']), 43)
+        G = nx.barbell_graph(8, 0)
+        metrics, columns = spectral_metrics(G, 4, verbose=False)
+        self.assertEqual(metrics['zero_eigenvalues'], 1)
+        self.assertEqual(metrics['eigengap_clusters'], 2)
+        # The Fiedler vector separates the two cliques
+        fiedler = columns['fiedler']
+        self.assertTrue(np.all(np.sign(fiedler[:8]) == -np.sign(fiedler[8:])))
+
+    def test_components_above_dense_size(self):
+        # Repeated zero eigenvalues of a sparse-solved graph, which a single Lanczos start vector misses
+        G = nx.disjoint_union_all([nx.path_graph(200) for _ in range(4)])
+        G.add_node(800)
+        exact = np.linalg.eigvalsh(nx.normalized_laplacian_matrix(G).toarray())
+        for method in ['eigsh', 'lobpcg']:
+            metrics, _ = spectral_metrics(G, 7, method=method, verbose=False)
+            self.assertEqual(metrics['zero_eigenvalues'], 5)
+            np.testing.assert_allclose(metrics['spectral_eigenvalues'][:6], exact[:6], atol=1e-6)
+            metrics, _ = spectral_metrics(G, 3, method=method, verbose=False)
+            self.assertEqual(metrics['zero_eigenvalues'], 3)
+
+    def test_embedding(self):
+        for dense_max_nodes in [500, 10]:
+            spectral.DENSE_MAX_NODES = dense_max_nodes
+            positions = spectral_embedding(self.G, dim=2, verbose=False)
+            self.assertEqual(positions.shape, (43, 2))
+            self.assertTrue(np.all(np.isfinite(positions)))
+            # Nodes of the same clique are closer to each other than to the other cliques
+            centers = np.array([positions[i * 12:(i + 1) * 12].mean(axis=0) for i in range(3)])
+            spread = max(np.linalg.norm(positions[i * 12:(i + 1) * 12] - centers[i], axis=1).max() for i in range(3))
+            gaps = [np.linalg.norm(centers[i] - centers[j]) for i in range(3) for j in range(i + 1, 3)]
+            self.assertGreater(min(gaps), spread)
+        self.assertEqual(spectral_embedding(nx.Graph(), verbose=False).shape, (0, 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from tagra.graph import create_graph, get_feature_matrix
+from tagra.loader import load_dataframe
+from tagra.preprocessing import preprocess_dataframe
+from tagra.store import FeatureStore, open_feature_store, save_feature_store
+
+class TestFeatureStore(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame(rng.normal(size=(60, 3)), columns=['A', 'B', 'C'], index=np.arange(60) * 2)
+        self.df['target'] = np.repeat(['x', 'y', 'z'], 20)
+        self.df['flag'] = self.df['A'] > 0
+        self.path = os.path.join(self.test_dir.name, 'data.features')
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_round_trip(self):
+        save_feature_store(self.df, self.path, rows_per_partition=25)
+        store = FeatureStore(self.path)
+        self.assertIsInstance(store.features, np.memmap)
+        self.assertEqual(store.features.dtype, np.float32)
+        self.assertEqual(store.feature_columns, ['A', 'B', 'C'])
+        self.assertEqual(len(store.metadata['partitions']), 3)
+        loaded = store.to_dataframe()
+        self.assertEqual(list(loaded.columns), list(self.df.columns))
+        pd.testing.assert_index_equal(loaded.index, self.df.index)
+        np.testing.assert_allclose(loaded[['A', 'B', 'C']], self.df[['A', 'B', 'C']], rtol=1e-6)
+        pd.testing.assert_series_equal(loaded['target'], self.df['target'])
+        pd.testing.assert_frame_equal(load_dataframe(self.path, columns=['flag'], downcast=False), self.df[['flag']])
+        with self.assertRaises(ValueError):
+            save_feature_store(self.df, self.path, overwrite=False)
+        with self.assertRaises(ValueError):
+            save_feature_store(self.df, os.path.join(self.test_dir.name, 'data.npy'))
+
+    def test_zero_copy_feature_matrix(self):
+        save_feature_store(self.df, self.path)
+        store = open_feature_store(self.path)
+        values, columns = get_feature_matrix(store)
+        self.assertIs(values, store.features)
+        self.assertEqual(columns, ['A', 'B', 'C'])
+        subset, _ = get_feature_matrix(store, ['C', 'A'])
+        np.testing.assert_array_equal(subset, store.features[:, [2, 0]])
+        with self.assertRaises(ValueError):
+            store.feature_matrix(['target'])
+
+    def test_create_graph_from_store(self):
+        save_feature_store(self.df, self.path)
+        kwargs = dict(output_directory=self.test_dir.name, method='knn', k=3, verbose=False, overwrite=True)
+        G = create_graph(input_dataframe=self.df, preprocessed_dataframe=self.df, dtype='float32', **kwargs)
+        G_store = create_graph(preprocessed_dataframe=self.path, node_attributes=['target'], **kwargs)
+        self.assertEqual(set(map(frozenset, G.edges())), set(map(frozenset, G_store.edges())))
+        self.assertEqual(G_store.nodes[0], {'target': 'x'})
+
+    def test_preprocess_to_store(self):
+        df, _ = preprocess_dataframe(self.df.assign(row_id=np.arange(60)), output_directory=self.test_dir.name,
+                                     preprocessed_filename='preprocessed.features', numeric_columns=['A', 'B', 'C'],
+                                     categorical_columns=[],
+                                     target_columns=['target'], ignore_columns=['flag', 'row_id'], manifold_method=None,
+                                     verbose=False, overwrite=True)
+        store = FeatureStore(os.path.join(self.test_dir.name, 'preprocessed.features'))
+        self.assertEqual(len(store), len(df))
+        # Only the preprocessed numeric columns are features, in the dtype of the DataFrame
+        self.assertEqual(store.feature_columns, ['A', 'B', 'C'])
+        self.assertEqual(store.features.dtype, np.float64)
+        np.testing.assert_array_equal(store.feature_matrix(), df[['A', 'B', 'C']])
+        np.testing.assert_array_equal(store.read_columns(['row_id'])['row_id'], np.arange(60))
+
+if __name__ == '__main__':
+    unittest.main()
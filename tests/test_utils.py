@@ -0,0 +1,55 @@
+import unittest
+import networkx as nx
+import numpy as np
+from tagra.utils import (
+    analyze_neighborhood_attributes,
+    print_neighbors_prob,
+    neighbor_mixing_matrix,
+    stacked_mixing_matrices,
+    graph_edge_arrays,
+    node_label_codes,
+    mixing_probabilities,
+    probabilities_to_dict
+)
+
+class TestMixingMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.G = nx.karate_club_graph()
+        self.G.add_edge(0, 0)
+        self.G.add_node(100)
+
+    def test_mixing_matrix_matches_neighborhood_counts(self):
+        labels, mixing = neighbor_mixing_matrix(self.G, 'club')
+        df_neigh = analyze_neighborhood_attributes(self.G, 'club')
+        for i, label_i in enumerate(labels):
+            nodes = df_neigh[df_neigh['node_club'] == label_i]
+            self.assertEqual(mixing[i].sum(), nodes['degree'].sum())
+            for j, label_j in enumerate(labels):
+                self.assertEqual(mixing[i, j], nodes[f'n_{label_j}'].sum())
+
+    def test_probabilities_match_print_neighbors_prob(self):
+        labels, mixing = neighbor_mixing_matrix(self.G, 'club')
+        probabilities = probabilities_to_dict(labels, mixing_probabilities(mixing))
+        expected = print_neighbors_prob(analyze_neighborhood_attributes(self.G, 'club'), 'club')
+        self.assertEqual(probabilities.keys(), expected.keys())
+        for key, value in expected.items():
+            self.assertAlmostEqual(probabilities[key], value)
+
+    def test_rows_without_neighbors(self):
+        labels, mixing = neighbor_mixing_matrix(self.G, 'club')
+        probs = mixing_probabilities(mixing)
+        self.assertEqual(list(labels), ['Mr. Hi', 'Officer', 'None'])
+        np.testing.assert_array_equal(probs[2], 0)
+
+    def test_stacked_mixing_matrices(self):
+        for node in self.G.nodes:
+            self.G.nodes[node]['parity'] = node % 2
+        codes = [node_label_codes(self.G, attr)[0] for attr in ['club', 'parity']]
+        n_labels = [int(c.max()) + 1 for c in codes]
+        sources, targets = graph_edge_arrays(self.G)
+        for attr, stacked in zip(['club', 'parity'], stacked_mixing_matrices(codes, sources, targets, n_labels)):
+            np.testing.assert_array_equal(stacked, neighbor_mixing_matrix(self.G, attr)[1])
+
+if __name__ == '__main__':
+    unittest.main()